@@ -38,3 +38,7 @@ STYLE_SHEETS_PATH = f"{REPO_DATA_PATH}/stylesheets"
 KEYFRAME_DATA_PATH = f"{USER_DATA_PATH}/KEYFRAME_DATA_PATH"
 
 COPY_PASTE_KEYFRAME_SETTINGS_PATH = f"{USER_DATA_PATH}/COPY_PASTE_KEYFRAME_SETTINGS_PATH"
+
+DRAGGER_METRICS_PATH = f"{USER_DATA_PATH}/DRAGGER_METRICS"
+
+IKFK_SWITCH_DEFINITIONS_PATH = f"{USER_DATA_PATH}/IKFK_SWITCH_DEFINITIONS"
@@ -1,10 +1,12 @@
 """
 Dragger context tools
 """
+import numpy
 from maya import cmds
 from maya.api import OpenMaya
 
-from as_maya_tools.utilities import maya_utils, math_utils, dragger_utils, attribute_utils
+from as_maya_tools.utilities import maya_utils, math_utils, dragger_utils, anim_curve_utils, anim_snapshot_utils, \
+    xform_utils
 from as_maya_tools import ICONS
 
 
@@ -26,32 +28,19 @@ class TweenDragger(dragger_utils.Dragger):
         init the dragger tool data
         """
         nodes = cmds.ls(selection=True)
+        self.keyframe_handles = None
 
         if nodes is None or len(nodes) == 0:
             maya_utils.message("0 nodes selected", position='midCenterTop', record_warning=False)
             raise ValueError("0 transform nodes selected")
 
-        self.attributes = None
+        # previous and next keyframes are read from the shared snapshot so repeated presses don't query the scene
+        snapshot = anim_snapshot_utils.get_selection_animation_snapshot(nodes)
+        self.attributes = snapshot.get_channels()
         self.attribute_data = {}
-        for node in nodes:
-            self.attributes = cmds.listAttr(node, keyable=True, unlocked=True, shortNames=True)
-            # skipping node if no animatable attributes are available
-            if not self.attributes or len(self.attributes) == 0:
-                continue
-
-            for attribute in self.attributes:
-
-                previous_keyframe = cmds.findKeyframe(f"{node}.{attribute}", which="previous")
-                next_keyframe = cmds.findKeyframe(f"{node}.{attribute}", which="next")
-                if not previous_keyframe:
-                    continue
-                if not next_keyframe:
-                    continue
-
-                previous_keyframe_data = cmds.getAttr(f"{node}.{attribute}", time=previous_keyframe)
-                next_keyframe_data = cmds.getAttr(f"{node}.{attribute}", time=next_keyframe)
-                data = {"previous_keyframe_value": previous_keyframe_data, "next_keyframe_value": next_keyframe_data}
-                self.attribute_data[f"{node}.{attribute}"] = data
+        for channel in snapshot.get_channels(keyed=True):
+            data = {"previous_keyframe_value": channel.previous_value, "next_keyframe_value": channel.next_value}
+            self.attribute_data[channel.attribute_path] = data
 
         if not self.attributes or len(self.attributes) == 0:
             maya_utils.message("No attributes found to tween", position='midCenterTop', record_warning=False)
@@ -63,20 +52,26 @@ class TweenDragger(dragger_utils.Dragger):
         """
         # set keyframe will set a keyframe on all attributes
         cmds.setKeyframe()
+        # resolve the keyframes at the current time once so dragging only writes values
+        self.keyframe_handles = anim_curve_utils.KeyframeHandles(list(self.attribute_data))
+        attribute_data = [self.attribute_data[attribute] for attribute in self.keyframe_handles.attribute_paths]
+        self.start_values = numpy.asarray([data["previous_keyframe_value"] for data in attribute_data], dtype=numpy.float64)
+        self.end_values = numpy.asarray([data["next_keyframe_value"] for data in attribute_data], dtype=numpy.float64)
 
     def drag(self, *args, **kwargs):
         """
         Actions activated by left drag
         """
-        for attribute in self.attribute_data:
-            cmds.keyframe(
-                attribute,
-                time=(cmds.currentTime(query=True),),
-                valueChange=math_utils.lerp(
-                    self.attribute_data[attribute]["previous_keyframe_value"],
-                    self.attribute_data[attribute]["next_keyframe_value"],
-                    self.x)
-            )
+        values = math_utils.lerp(self.start_values, self.end_values, self.x)
+        with self.metrics.measure_write():
+            self.keyframe_handles.set_values(values)
+
+    def release(self, *args, **kwargs):
+        """
+        record the dragged keyframe values as a single undoable edit
+        """
+        if self.keyframe_handles is not None:
+            self.keyframe_handles.commit()
 
 
 class WSTweenDragger(dragger_utils.Dragger):
@@ -100,28 +95,29 @@ class WSTweenDragger(dragger_utils.Dragger):
         """
         nodes = cmds.ls(selection=True)
         self.attributes = []
+        self.transform_writer = None
 
         if nodes is None or len(nodes) == 0:
             maya_utils.message("0 nodes selected", position='midCenterTop', record_warning=False)
             raise ValueError("0 transform nodes selected")
 
+        # keyframe times are read from the shared snapshot so repeated presses don't query the scene
+        snapshot = anim_snapshot_utils.get_selection_animation_snapshot(nodes)
         self.node_data = {}
         for node in nodes:
-            animatable_attributes = cmds.listAttr(node, keyable=True, unlocked=True, shortNames=True)
+            channels = snapshot.channels.get(node)
             # skipping node if no animatable attributes are available
-            if not animatable_attributes or len(animatable_attributes) == 0:
+            if not channels:
                 continue
 
-            for attribute in animatable_attributes:
-                if attribute in self.TRANSFORM_ATTRIBUTES:
-                    self.attributes.append(f"{node}.{attribute}")
+            for channel in channels:
+                if channel.attribute_path.rsplit(".", 1)[-1] in self.TRANSFORM_ATTRIBUTES:
+                    self.attributes.append(channel.attribute_path)
 
-            if not cmds.findKeyframe(node, curve=True):
+            previous_keyframe, next_keyframe = snapshot.get_keyframe_range(node)
+            if previous_keyframe is None or next_keyframe is None:
                 continue
 
-            previous_keyframe = cmds.findKeyframe(node, which="previous")  # NOTE: default is current time
-            next_keyframe = cmds.findKeyframe(node, which="next")  # NOTE: default is current time
-
             # get the world matrix values
             pre_frame_matrix = OpenMaya.MMatrix(cmds.getAttr(f"{node}.worldMatrix", time=previous_keyframe))
             next_frame_matrix = OpenMaya.MMatrix(cmds.getAttr(f"{node}.worldMatrix", time=next_keyframe))
@@ -139,18 +135,30 @@ class WSTweenDragger(dragger_utils.Dragger):
         """
         # set keyframes on transform attributes
         cmds.setKeyframe()
+        # decompose the end matrices once so dragging only lerps arrays
+        # NOTE: the keys set on press are always edited, tweening only makes sense on keyframes
+        self.transform_writer = xform_utils.TransformWriter(list(self.node_data), edit_keyframes=True)
+        self.pre_frame_matrices = math_utils.decompose_position_matrices(
+            [self.node_data[node]["pre_frame_matrix"] for node in self.transform_writer.nodes])
+        self.next_frame_matrices = math_utils.decompose_position_matrices(
+            [self.node_data[node]["next_frame_matrix"] for node in self.transform_writer.nodes])
 
     def drag(self, *args, **kwargs):
         """
         Actions activated by left drag
         """
-        for node in self.node_data:
-            # get lerped matrix values
-            lerped_matrix = math_utils.lerp_matrix(self.node_data[node]["pre_frame_matrix"],
-                                                   self.node_data[node]["next_frame_matrix"],
-                                                   self.x,
-                                                   *args, **kwargs)
-            cmds.xform(node, matrix=lerped_matrix, ws=True)
+        lerped_matrices = math_utils.lerp_decomposed_matrices(
+            self.pre_frame_matrices, self.next_frame_matrices, self.x, *args, **kwargs)
+        values = self.transform_writer.get_channel_values(lerped_matrices)
+        with self.metrics.measure_write():
+            self.transform_writer.set_channel_values(values)
+
+    def release(self, *args, **kwargs):
+        """
+        record the dragged transforms as undoable edits
+        """
+        if self.transform_writer is not None:
+            self.transform_writer.commit()
 
 
 class DefaultTweenDragger(dragger_utils.Dragger):
@@ -171,34 +179,19 @@ class DefaultTweenDragger(dragger_utils.Dragger):
         init the dragger tool data
         """
         nodes = cmds.ls(selection=True)
+        self.keyframe_handles = None
 
         if nodes is None or len(nodes) == 0:
             maya_utils.message("0 nodes selected", position='midCenterTop', record_warning=False)
             raise ValueError("0 transform nodes selected")
 
-        self.attributes = None
+        # keyed channels are read from the shared snapshot so repeated presses don't query the scene
+        snapshot = anim_snapshot_utils.get_selection_animation_snapshot(nodes)
+        self.attributes = snapshot.get_channels()
         self.attribute_data = {}
-        for node in nodes:
-            self.attributes = cmds.listAttr(node, keyable=True, unlocked=True, shortNames=True)
-            # skipping node if no animatable attributes are available
-            if not self.attributes or len(self.attributes) == 0:
-                continue
-
-            for attribute in self.attributes:
-
-                previous_keyframe = cmds.findKeyframe(f"{node}.{attribute}", which="previous")
-                next_keyframe = cmds.findKeyframe(f"{node}.{attribute}", which="next")
-                if not previous_keyframe:
-                    continue
-                if not next_keyframe:
-                    continue
-
-                as_attribute = attribute_utils.Attribute(f"{node}.{attribute}")
-                default_value = as_attribute.get_default_value()
-                current_value = as_attribute.value
-
-                data = {"default_value": default_value, "current_value": current_value}
-                self.attribute_data[f"{node}.{attribute}"] = data
+        for channel in snapshot.get_channels(keyed=True):
+            data = {"default_value": channel.default_value, "current_value": channel.value}
+            self.attribute_data[channel.attribute_path] = data
 
         if not self.attributes or len(self.attributes) == 0:
             maya_utils.message("No attributes found to tween", position='midCenterTop', record_warning=False)
@@ -210,20 +203,72 @@ class DefaultTweenDragger(dragger_utils.Dragger):
         """
         # set keyframe will set a keyframe on all attributes
         cmds.setKeyframe()
+        # resolve the keyframes at the current time once so dragging only writes values
+        self.keyframe_handles = anim_curve_utils.KeyframeHandles(list(self.attribute_data))
+        attribute_data = [self.attribute_data[attribute] for attribute in self.keyframe_handles.attribute_paths]
+        self.start_values = numpy.asarray([data["default_value"] for data in attribute_data], dtype=numpy.float64)
+        self.end_values = numpy.asarray([data["current_value"] for data in attribute_data], dtype=numpy.float64)
 
     def drag(self, *args, **kwargs):
         """
         Actions activated by left drag
         """
-        for attribute in self.attribute_data:
-            cmds.keyframe(
-                attribute,
-                time=(cmds.currentTime(query=True),),
-                valueChange=math_utils.lerp(
-                    self.attribute_data[attribute]["default_value"],
-                    self.attribute_data[attribute]["current_value"],
-                    self.x)
-            )
+        values = math_utils.lerp(self.start_values, self.end_values, self.x)
+        with self.metrics.measure_write():
+            self.keyframe_handles.set_values(values)
+
+    def release(self, *args, **kwargs):
+        """
+        record the dragged keyframe values as a single undoable edit
+        """
+        if self.keyframe_handles is not None:
+            self.keyframe_handles.commit()
+
+
+class MultiKeyTweenDragger(dragger_utils.Dragger):
+    """
+    Drag context tool to tween or overshoot every key selected in the graph editor between its own previous and next
+    keyframe
+    """
+    NAME = "Multi Key Tween Dragger"
+    TITLE = "Multi Key Tween Dragger"
+    CURSOR = "hand"
+    DEFAULT_VALUE = 0.5
+    ICON = f"{ICONS}/tweendragger.png"
+
+    def __init__(self, *args, **kwargs):
+        super(MultiKeyTweenDragger, self).__init__(*args, **kwargs)
+
+    def _init_subclass(self, *args, **kwargs):
+        """
+        init the dragger tool data
+        """
+        self.selected_keyframes = None
+        # every selected key and its neighbours are read once so dragging is a single array lerp
+        self.selected_keyframes = anim_curve_utils.SelectedKeyframes()
+
+        if not len(self.selected_keyframes):
+            maya_utils.message("No keys selected to tween", position='midCenterTop', record_warning=False)
+            raise ValueError("No keys selected to tween")
+        if self.selected_keyframes.skipped_count:
+            maya_utils.message(
+                f"{self.selected_keyframes.skipped_count} first or last keys skipped", position='midCenterTop',
+                record_warning=False)
+
+    def drag(self, *args, **kwargs):
+        """
+        Actions activated by left drag
+        """
+        values = self.selected_keyframes.get_tween_values(self.x)
+        with self.metrics.measure_write():
+            self.selected_keyframes.set_values(values)
+
+    def release(self, *args, **kwargs):
+        """
+        record the dragged keyframe values as a single undoable edit
+        """
+        if self.selected_keyframes is not None:
+            self.selected_keyframes.commit()
 
 
 class CurveValueDragger(dragger_utils.Dragger):
@@ -236,6 +281,7 @@ class CurveValueDragger(dragger_utils.Dragger):
     DEFAULT_VALUE = 0.0
     MAX_MULTIPLIER = 1.0  # NOTE: the fastest the drag value will raise or lower
     MIN_MULTIPLIER = 0.1  # NOTE: the slowest the drag value will raise or lower
+    SAMPLES_PER_FRAME = 4  # NOTE: resolution of the sampled curves. values between samples are interpolated
     ICON = f"{ICONS}/curvevaluedragger.png"
 
     def __init__(self, *args, **kwargs):
@@ -246,29 +292,17 @@ class CurveValueDragger(dragger_utils.Dragger):
         init the dragger tool data
         """
         nodes = cmds.ls(selection=True)
+        self.keyframe_handles = None
 
         if nodes is None or len(nodes) == 0:
             maya_utils.message("0 nodes selected", position='midCenterTop', record_warning=False)
             raise ValueError("0 transform nodes selected")
 
+        # keyed channels are read from the shared snapshot so repeated presses don't query the scene
+        snapshot = anim_snapshot_utils.get_selection_animation_snapshot(nodes)
         self.nodes = {}
-        for node in nodes:
-            attributes = cmds.listAttr(node, keyable=True, unlocked=True, shortNames=True)
-            # skipping node if no animatable attributes are available
-            if not attributes or len(attributes) == 0:
-                continue
-
-            self.nodes[node] = []
-            for attribute in attributes:
-
-                previous_keyframe = cmds.findKeyframe(f"{node}.{attribute}", which="previous")
-                next_keyframe = cmds.findKeyframe(f"{node}.{attribute}", which="next")
-                if not previous_keyframe:
-                    continue
-                if not next_keyframe:
-                    continue
-
-                self.nodes[node].append(f"{node}.{attribute}")
+        for node, channels in snapshot.channels.items():
+            self.nodes[node] = [channel.attribute_path for channel in channels if channel.has_keyframes]
 
     def press(self, *args, **kwargs):
         """
@@ -276,6 +310,29 @@ class CurveValueDragger(dragger_utils.Dragger):
         """
         # set keyframe will set a keyframe on all attributes
         cmds.setKeyframe()
+        self.current_time = cmds.currentTime(query=True)
+        self.time_drag = self.current_time
+        self.keyframe_handles = anim_curve_utils.KeyframeHandles(
+            [attribute for node in self.nodes for attribute in self.nodes[node]], time=self.current_time)
+
+        # curves are sampled a block of frames at a time as the drag reaches them, so dragging only interpolates
+        # samples. the block around the current time is sampled before any keyframe is edited
+        # NOTE: drags past the playback range hold the value at the end of the range
+        self.curve_sampler = anim_curve_utils.AnimCurveSampler(
+            self.keyframe_handles.anim_curve_fns,
+            min(cmds.playbackOptions(query=True, minTime=True), self.current_time),
+            max(cmds.playbackOptions(query=True, maxTime=True), self.current_time),
+            samples_per_frame=self.SAMPLES_PER_FRAME,
+            prepare_function=self.restore_keyframe_values)
+        self.curve_sampler.get_values(self.current_time)
+
+    def restore_keyframe_values(self):
+        """
+        put the dragged keyframes back to their original values so newly sampled blocks match the original curves
+        """
+        anim_curve_utils.set_key_values(
+            self.keyframe_handles.anim_curve_fns, self.keyframe_handles.key_indices,
+            self.keyframe_handles.original_values)
 
     def _set_cursor_label_drag_display(self, *args, **kwargs):
         """
@@ -289,12 +346,21 @@ class CurveValueDragger(dragger_utils.Dragger):
         """
         Actions activated by left drag
         """
-        self.time_drag = cmds.currentTime(query=True) + self.x
+        self.time_drag = self.current_time + self.x
+        if not len(self.keyframe_handles):
+            return
+
+        # interpolate between the two samples around the drag time for every curve at once
+        values = self.curve_sampler.get_values(self.time_drag)
+        with self.metrics.measure_write():
+            self.keyframe_handles.set_internal_values(values)
 
-        for node in self.nodes:
-            for attribute in self.nodes[node]:
-                value = cmds.getAttr(attribute, time=self.time_drag)
-                cmds.setAttr(attribute, value)
+    def release(self, *args, **kwargs):
+        """
+        record the dragged keyframe values as a single undoable edit
+        """
+        if self.keyframe_handles is not None:
+            self.keyframe_handles.commit()
 
 
 class LerpSnapDragger(dragger_utils.Dragger):
@@ -316,33 +382,41 @@ class LerpSnapDragger(dragger_utils.Dragger):
         init the dragger tool data
         """
         nodes = cmds.ls(selection=True)
+        self.transform_writer = None
 
         if nodes is None or len(nodes) < 2:
             maya_utils.message("Not enough nodes selected. Select at least 2 nodes", position='midCenterTop', record_warning=False)
             raise ValueError("Not enough nodes selected. Select at least 2 nodes")
 
-        self.snap_node_matrix = OpenMaya.MMatrix(cmds.xform(nodes[0], query=True, matrix=True, ws=True))
-        self.node_data = {}
-        for node in nodes:
-            node_matrix = OpenMaya.MMatrix(cmds.xform(node, query=True, matrix=True, ws=True))
-            self.node_data[node] = node_matrix
+        # decompose the start and snap matrices once so dragging only lerps arrays
+        self.transform_writer = xform_utils.TransformWriter(nodes)
+        node_matrices = self.transform_writer.get_world_matrices()
+        self.node_matrices = math_utils.decompose_position_matrices(node_matrices)
+        self.snap_node_matrices = math_utils.decompose_position_matrices([node_matrices[0]] * len(node_matrices))
 
     def drag(self, *args, **kwargs):
         """
         Actions activated by left drag
         """
-        for node in self.node_data:
-            # get lerped matrix values
-            lerped_matrix = math_utils.lerp_matrix(self.node_data[node],
-                                                   self.snap_node_matrix,
-                                                   self.x,
-                                                   *args, **kwargs)
-            cmds.xform(node, matrix=lerped_matrix, ws=True)
+        lerped_matrices = math_utils.lerp_decomposed_matrices(
+            self.node_matrices, self.snap_node_matrices, self.x, *args, **kwargs)
+        values = self.transform_writer.get_channel_values(lerped_matrices)
+        with self.metrics.measure_write():
+            self.transform_writer.set_channel_values(values)
+
+    def release(self, *args, **kwargs):
+        """
+        record the dragged transforms as undoable edits
+        """
+        if self.transform_writer is not None:
+            self.transform_writer.commit()
 
 
 class CameraDepthDragger(dragger_utils.Dragger):
     """
     Lerp objects position towards or away from camera position
+    With view_ray the objects move along the camera's view ray through their pivot, so they keep their position on
+    screen. Orthographic cameras move objects along the view direction
     """
     NAME = "Camera Depth Dragger"
     TITLE = "Camera Depth Dragger"
@@ -350,13 +424,18 @@ class CameraDepthDragger(dragger_utils.Dragger):
     DEFAULT_VALUE = 0.0
     ICON = f"{ICONS}/cameradepthdragger.png"
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, view_ray=False, **kwargs):
+        """
+        :param bool view_ray: option to move along the true camera view ray instead of towards the camera pivot
+        """
+        self.view_ray = view_ray
         super(CameraDepthDragger, self).__init__(*args, **kwargs)
 
     def _init_subclass(self, *args, **kwargs):
         """
         init the dragger tool data
         """
+        self.transform_writer = None
         # get the camera that we're looking through, and the objects selected
         camera = maya_utils.get_current_camera()
         nodes = cmds.ls(selection=True)
@@ -365,29 +444,48 @@ class CameraDepthDragger(dragger_utils.Dragger):
             maya_utils.message("0 nodes selected", record_warning=False)
             raise ValueError("0 transform nodes selected")
 
-        # get the position of the camera in space and convert it to a vector
-        self.camera_position = cmds.xform(camera, query=True, worldSpace=True, rotatePivot=True)
-
-        self.node_data = {}
-        for node in nodes:
-            # make sure all translate attributes are settable
-            if not cmds.getAttr(f"{node}.translate", settable=True):
-                continue
+        # make sure all translate attributes are settable
+        translatable_nodes = [node for node in nodes if cmds.getAttr(f"{node}.translate", settable=True)]
 
-            # get the position of the objects as a vector, and subtract the camera vector from that
-            node_position = cmds.xform(node, query=True, worldSpace=True, rotatePivot=True)
-            self.node_data[node] = node_position
-
-        if not self.node_data:
+        if not translatable_nodes:
             maya_utils.message("No selected objects are translatable", record_warning=False)
             raise ValueError("No selected objects are translatable")
 
-        if len(nodes) != len(self.node_data):
+        if len(nodes) != len(translatable_nodes):
             maya_utils.message("Some selected objects cannot be translated", record_warning=True)
 
+        # hold every pivot and world matrix as arrays so they are all moved together. keyframes are only edited when
+        # auto key is on, like cmds.move
+        self.transform_writer = xform_utils.TransformWriter(translatable_nodes)
+        self.node_matrices = numpy.stack(
+            [math_utils.matrix_to_array(matrix) for matrix in self.transform_writer.get_world_matrices()])
+        self.node_positions = numpy.asarray(
+            [tuple(OpenMaya.MFnTransform(dag_path).rotatePivot(OpenMaya.MSpace.kWorld))[:3]
+             for dag_path in self.transform_writer.dag_paths],
+            dtype=numpy.float64)
+        self.lerp_vector = self.node_positions.mean(axis=0)
+
+        # offset from each pivot to the camera, full lerp weight moves the pivots onto the camera
+        if self.view_ray:
+            camera_path = OpenMaya.MSelectionList().add(camera).getDagPath(0)
+            camera_path.extendToShape()
+            camera_fn = OpenMaya.MFnCamera(camera_path)
+            eye_point = numpy.asarray(tuple(camera_fn.eyePoint(OpenMaya.MSpace.kWorld))[:3])
+            camera_offsets = eye_point - self.node_positions
+            if camera_fn.isOrtho():
+                # NOTE: orthographic view rays are parallel, only the depth along the view direction is kept
+                view_direction = numpy.asarray(tuple(camera_fn.viewDirection(OpenMaya.MSpace.kWorld)))
+                view_direction = view_direction / numpy.linalg.norm(view_direction)
+                camera_offsets = numpy.outer(numpy.dot(camera_offsets, view_direction), view_direction)
+        else:
+            # get the position of the camera in space
+            camera_position = cmds.xform(camera, query=True, worldSpace=True, rotatePivot=True)
+            camera_offsets = numpy.asarray(camera_position, dtype=numpy.float64) - self.node_positions
+        self.camera_offsets = camera_offsets
+
     def _set_cursor_label_drag_display(self, *args, **kwargs):
         """
-        defines what is displayed on the cursor label and how it looks when dragging
+        defines what is displayed on the cursor label and how it looks when dragging. shows the average position
         """
         self.cursor_label.set_color("white")
         label = f"X:{round(self.lerp_vector[0], 3)} Y:{round(self.lerp_vector[1], 3)} Z:{round(self.lerp_vector[2], 3)}"
@@ -397,7 +495,19 @@ class CameraDepthDragger(dragger_utils.Dragger):
         """
         pre_drag normal speed
         """
-        self.lerp_vector = [0, 0, 0]
-        for node in self.node_data:
-            self.lerp_vector = math_utils.lerp_vector(self.node_data[node], self.camera_position, self.x)
-            cmds.move(self.lerp_vector[0], self.lerp_vector[1], self.lerp_vector[2], node, absolute=True, worldSpace=True)
+        offsets = self.camera_offsets * self.x
+        matrices = self.node_matrices.copy()
+        matrices[:, 3, :3] += offsets
+        values = self.transform_writer.get_channel_values(matrices)
+        # NOTE: only the translation moves, rotate and scale keep their exact values like a regular move
+        values[:, 3:] = self.transform_writer.original_values[:, 3:]
+        with self.metrics.measure_write():
+            self.transform_writer.set_channel_values(values)
+        self.lerp_vector = (self.node_positions + offsets).mean(axis=0)
+
+    def release(self, *args, **kwargs):
+        """
+        record the moved transforms as undoable edits
+        """
+        if self.transform_writer is not None:
+            self.transform_writer.commit()
@@ -25,10 +25,9 @@ def copy_keyframes():
     keyframe_utils.copy_keyframes(**settings)
     return
 
-def paste_keyframes():
+def paste_keyframes(dry_run=False, slot_id=None):
     settings = json_utils.read_offset_json_file(COPY_PASTE_KEYFRAME_SETTINGS_PATH,
                                                 "copy_paste_keyframe_settings")
     if settings is None:
         settings = {}
-    keyframe_utils.paste_keyframes(**settings)
-    return
+    return keyframe_utils.paste_keyframes(dry_run=dry_run, slot_id=slot_id, **settings)
@@ -12,7 +12,7 @@ from maya import cmds
 from maya.api import OpenMaya
 
 from as_maya_tools.utilities.qt_utils import DockableMainWindowAbstract
-from as_maya_tools.utilities import json_utils, attribute_utils, spaceswitch_utils, maya_utils
+from as_maya_tools.utilities import json_utils, attribute_utils, spaceswitch_utils, maya_utils, advanced_skeleton_ikfk_utils
 from as_maya_tools.utilities import json_utils
 from as_maya_tools import STYLE_SHEETS_PATH
 from as_maya_tools.stylesheets import guiResources
@@ -44,6 +44,7 @@ class AdvancedSkeletonIKFKSwitcherUI(DockableMainWindowAbstract):
         super(AdvancedSkeletonIKFKSwitcherUI, self).__init__(parent)
         
         self.drag_release_callback = None
+        self.live_switch_callback = advanced_skeleton_ikfk_utils.LiveSwitchCallback()
         
 
     def _ui(self):
@@ -63,6 +64,7 @@ class AdvancedSkeletonIKFKSwitcherUI(DockableMainWindowAbstract):
         self.live_match_checkbox = QtWidgets.QCheckBox(self)
         self.live_match_checkbox.setText("Live Switching")
         self.switch_button = QtWidgets.QPushButton("Switch", self)
+        self.switch_all_button = QtWidgets.QPushButton("Switch All Characters", self)
         
         # Frame Range Options Widgets
         self.keyed_frames_checkbox = QtWidgets.QCheckBox(self)
@@ -111,6 +113,7 @@ class AdvancedSkeletonIKFKSwitcherUI(DockableMainWindowAbstract):
         self.switch_panel_layout.addLayout(self.switch_row_layout)
         self.switch_panel_layout.addLayout(self.frame_range_layout)
         self.switch_panel_layout.addWidget(self.switch_button)
+        self.switch_panel_layout.addWidget(self.switch_all_button)
         
         self.main_layout.addWidget(self.live_match_checkbox)
         self.main_layout.addWidget(self.switch_groupbox)
@@ -123,6 +126,63 @@ class AdvancedSkeletonIKFKSwitcherUI(DockableMainWindowAbstract):
         """
         # UI display callbackcs
         self.framerange_options_combo_box.currentTextChanged.connect(self.callback_enable_frame_range_spin_boxes)
+        self.switch_button.clicked.connect(self.switch)
+        self.switch_all_button.clicked.connect(self.switch_all)
+        self.live_match_checkbox.toggled.connect(self.callback_live_switching)
+
+    def callback_live_switching(self, state):
+        """
+        register or remove the live switching callback
+        :param bool state: live switching is on
+        """
+        if state:
+            self.live_switch_callback.install()
+        else:
+            self.live_switch_callback.remove()
+
+    def get_switch_frames(self):
+        """
+        get the frames to switch based on the frame range options
+        :return list[float]: frames to switch
+        """
+        frame_range = self.framerange_options_combo_box.currentText()
+        if frame_range == "Frame Range":
+            return [float(frame) for frame in range(self.start_frame_spinbox.value(), self.end_frame_spinbox.value() + 1)]
+        if frame_range == "Current Frame":
+            return [cmds.currentTime(query=True)]
+        limbs = advanced_skeleton_ikfk_utils.get_selected_limbs(cmds.ls(selection=True) or [])
+        if not limbs:
+            return []
+        # NOTE: keyed frames are read from every control of every selected limb
+        node_keyframes = advanced_skeleton_ikfk_utils.get_limbs_keyframes(
+            [limb_nodes for _, limb_nodes in limbs.values()])
+        return spaceswitch_utils.get_keyframe_range(
+            None, frame_range=frame_range, keyed_frames=self.keyed_frames_checkbox.isChecked(),
+            node_keyframes=node_keyframes)
+
+    def switch(self):
+        """
+        match the selected limbs over the frames set in the ui
+        """
+        if self.framerange_options_combo_box.currentText() == "Current Frame":
+            advanced_skeleton_ikfk_utils.match_ikfk()
+            return
+        frames = self.get_switch_frames()
+        if not frames:
+            maya_utils.message("No frames to switch", position='midCenterTop', record_warning=False)
+            return
+        advanced_skeleton_ikfk_utils.match_ikfk_range(frames)
+
+    def switch_all(self):
+        """
+        match every limb of every character over the frames set in the ui
+        """
+        frames = self.get_switch_frames()
+        if not frames:
+            maya_utils.message("No frames to switch", position='midCenterTop', record_warning=False)
+            return
+        report, read_time = advanced_skeleton_ikfk_utils.match_all_limbs(frames)
+        advanced_skeleton_ikfk_utils.report_match_all_limbs(report, read_time)
         
     def callback_enable_frame_range_spin_boxes(self, value):
         """Enable or disable frame range spin boxes based on UI settings
@@ -137,6 +197,7 @@ class AdvancedSkeletonIKFKSwitcherUI(DockableMainWindowAbstract):
 
     def remove_maya_callbacks(self):
         """remove maya callbacks"""
+        self.live_switch_callback.remove()
         try:
             OpenMaya.MMessage.removeCallback(self.drag_release_callback)
         except RuntimeError:  # MMessage already deleted
@@ -146,4 +207,4 @@ class AdvancedSkeletonIKFKSwitcherUI(DockableMainWindowAbstract):
         """Remove all callback messages and remove ui from memory"""
         super(AdvancedSkeletonIKFKSwitcherUI, self).closeEvent(event)
         self.remove_maya_callbacks()
-        self.deleteLater()
\ No newline at end of file
+        self.deleteLater()
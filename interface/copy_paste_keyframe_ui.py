@@ -2,11 +2,16 @@
 Copy/Paste settings ui
 COPY arguments:
 -all_keyframes: bool (copy all keyframes option. If false it will use the selected keyframes)
+-export_json: bool (option to also export the copied keyframes as a .json file next to the binary clipboard)
+-use_clipboard_server: bool (option to copy and paste through the local clipboard server. falls back to the clipboard files if it isn't running)
+-reduce_keys: bool (option to remove redundant keyframes on constant and linear sections. constant curves are stored as their end keys)
 PASTE arguments:
 -use_selection: bool (option to use the current selection. If false it will use the node names stored )
 -use_current_time: bool (option to apply the animation at the current time. if false it will use the stored time)
--replace: bool (option to remove the current animation in the frame range before applying animation TODO:not implemented in backend yet)
+-replace: bool (option to remove the current animation in the frame range before applying animation)
 -reverse: bool (option to reverse the animation when applying. Reverse is applied to the keyframe position and tangent positions, not the value)
+CLIPBOARD HISTORY:
+-every copy is stored in its own clipboard slot. the selected slot is pasted
 """
 try:
     from PySide2 import QtWidgets, QtCore, QtGui
@@ -15,8 +20,9 @@ except ModuleNotFoundError:
     from PySide6 import QtWidgets, QtCore, QtGui
     from shiboken6 import wrapInstance
 
+import maya.api.OpenMaya as OpenMaya
 from as_maya_tools.utilities.qt_utils import DockableMainWindowAbstract
-from as_maya_tools.utilities import json_utils, maya_node_utils, maya_utils
+from as_maya_tools.utilities import json_utils, maya_node_utils, maya_utils, keyframe_utils
 from as_maya_tools.animation import timeline
 from as_maya_tools import COPY_PASTE_KEYFRAME_SETTINGS_PATH, STYLE_SHEETS_PATH
 from as_maya_tools.stylesheets import guiResources
@@ -25,9 +31,13 @@ from as_maya_tools.stylesheets import guiResources
 DEFAULT_COPY_PASTE_KEYFRAME_SETTINGS = \
     {
         "all_keyframes": False,
+        "export_json": False,
+        "use_clipboard_server": False,
+        "reduce_keys": False,
         "use_selection": True,
         "use_current_time": True,
         "reverse": False,
+        "replace": False,
         "search_replace": False,
         "search_string": "",
         "replace_string": ""
@@ -55,6 +65,9 @@ class CopyPasteKeyframesUI(DockableMainWindowAbstract):
         self.copy_settings_groupbox.setTitle("Copy Settings")
         self.paste_settings_groupbox = QtWidgets.QGroupBox(self)
         self.paste_settings_groupbox.setTitle("Paste Settings")
+        self.clipboard_groupbox = QtWidgets.QGroupBox(self)
+        self.clipboard_groupbox.setTitle("Clipboard History")
+        self.clipboard_layout = QtWidgets.QHBoxLayout(self)
         self.copy_settings_layout = QtWidgets.QVBoxLayout(self)
         self.paste_settings_layout = QtWidgets.QVBoxLayout(self)
         self.search_layout = QtWidgets.QHBoxLayout(self)
@@ -63,6 +76,12 @@ class CopyPasteKeyframesUI(DockableMainWindowAbstract):
         # copy setting widgets
         self.all_keyframes_checkbox = QtWidgets.QCheckBox(self)
         self.all_keyframes_checkbox.setText("All Keyframes")
+        self.export_json_checkbox = QtWidgets.QCheckBox(self)
+        self.export_json_checkbox.setText("Export JSON")
+        self.use_clipboard_server_checkbox = QtWidgets.QCheckBox(self)
+        self.use_clipboard_server_checkbox.setText("Use Clipboard Server")
+        self.reduce_keys_checkbox = QtWidgets.QCheckBox(self)
+        self.reduce_keys_checkbox.setText("Reduce Keyframes")
         # paste settings widgets
         self.use_selection_checkbox = QtWidgets.QCheckBox(self)
         self.use_selection_checkbox.setText("Use Selection")
@@ -70,6 +89,8 @@ class CopyPasteKeyframesUI(DockableMainWindowAbstract):
         self.use_current_time_checkbox.setText("Use Current Time")
         self.reverse_keyframes_checkbox = QtWidgets.QCheckBox(self)
         self.reverse_keyframes_checkbox.setText("Reverse Keyframes")
+        self.replace_keyframes_checkbox = QtWidgets.QCheckBox(self)
+        self.replace_keyframes_checkbox.setText("Replace Keyframes")
         # search and replace widgets
         self.search_and_replace_checkbox = QtWidgets.QCheckBox(self)
         self.search_and_replace_checkbox.setText("Search and Replace")
@@ -81,11 +102,19 @@ class CopyPasteKeyframesUI(DockableMainWindowAbstract):
         self.replace_line_edit.setPlaceholderText("Replace")
         self.replace_use_selected_namespace_button = QtWidgets.QPushButton("Use Selected Namespace", self)
         
+        # clipboard history widgets
+        self.clipboard_slot_combo_box = QtWidgets.QComboBox(self)
+        self.clipboard_slot_combo_box.setMinimumHeight(25)
+        self.remove_clipboard_slot_button = QtWidgets.QPushButton("Remove", self)
         # action buttons
         self.copy_button = QtWidgets.QPushButton("Copy Keyframes", self)
         self.paste_button = QtWidgets.QPushButton("Paste Keyframes", self)
+        self.dry_run_button = QtWidgets.QPushButton("Dry Run Paste", self)
         # build copy settings layout
         self.copy_settings_layout.addWidget(self.all_keyframes_checkbox)
+        self.copy_settings_layout.addWidget(self.export_json_checkbox)
+        self.copy_settings_layout.addWidget(self.use_clipboard_server_checkbox)
+        self.copy_settings_layout.addWidget(self.reduce_keys_checkbox)
         self.copy_settings_groupbox.setLayout(self.copy_settings_layout)
         # build search and replace layouts
         self.search_layout.addWidget(self.search_line_edit)
@@ -96,22 +125,30 @@ class CopyPasteKeyframesUI(DockableMainWindowAbstract):
         self.paste_settings_layout.addWidget(self.use_selection_checkbox)
         self.paste_settings_layout.addWidget(self.use_current_time_checkbox)
         self.paste_settings_layout.addWidget(self.reverse_keyframes_checkbox)
+        self.paste_settings_layout.addWidget(self.replace_keyframes_checkbox)
         self.paste_settings_layout.addWidget(self.search_and_replace_checkbox)
         self.paste_settings_layout.addLayout(self.search_layout)
         self.paste_settings_layout.addLayout(self.replace_layout)
         self.paste_settings_groupbox.setLayout(self.paste_settings_layout)
+        # build clipboard history layout
+        self.clipboard_layout.addWidget(self.clipboard_slot_combo_box, 1)
+        self.clipboard_layout.addWidget(self.remove_clipboard_slot_button)
+        self.clipboard_groupbox.setLayout(self.clipboard_layout)
         # build action layout
         self.action_layout.addWidget(self.copy_button)
         self.action_layout.addWidget(self.paste_button)
+        self.action_layout.addWidget(self.dry_run_button)
         # parent to main layout
         self.main_layout.addWidget(self.copy_settings_groupbox)
         self.main_layout.addWidget(self.paste_settings_groupbox)
+        self.main_layout.addWidget(self.clipboard_groupbox)
         self.main_layout.addLayout(self.action_layout)
         self.setLayout(self.main_layout)
 
         # Get the settings before setting anything up to avoid overwriting the settings while creating the ui
         copy_paste_keyframe_settings = json_utils.read_offset_json_file(COPY_PASTE_KEYFRAME_SETTINGS_PATH, "copy_paste_keyframe_settings")
         self._init_settings(settings=copy_paste_keyframe_settings)
+        self._refresh_clipboard_slots()
 
     def _init_settings(self, settings=None):
         """
@@ -139,9 +176,13 @@ class CopyPasteKeyframesUI(DockableMainWindowAbstract):
                                                     "copy_paste_keyframe_settings")
 
         self.all_keyframes_checkbox.setChecked(settings["all_keyframes"])
+        self.export_json_checkbox.setChecked(settings["export_json"])
+        self.use_clipboard_server_checkbox.setChecked(settings["use_clipboard_server"])
+        self.reduce_keys_checkbox.setChecked(settings["reduce_keys"])
         self.use_selection_checkbox.setChecked(settings["use_selection"])
         self.use_current_time_checkbox.setChecked(settings["use_current_time"])
         self.reverse_keyframes_checkbox.setChecked(settings["reverse"])
+        self.replace_keyframes_checkbox.setChecked(settings["replace"])
         self.search_and_replace_checkbox.setChecked(settings["search_replace"])
         self.search_line_edit.setText(settings["search_string"])
         self.replace_line_edit.setText(settings["replace_string"])
@@ -166,24 +207,40 @@ class CopyPasteKeyframesUI(DockableMainWindowAbstract):
         """
         copy_paste_keyframe_settings={}
         copy_paste_keyframe_settings["all_keyframes"] = self.all_keyframes_checkbox.isChecked()
+        copy_paste_keyframe_settings["export_json"] = self.export_json_checkbox.isChecked()
+        copy_paste_keyframe_settings["use_clipboard_server"] = self.use_clipboard_server_checkbox.isChecked()
+        copy_paste_keyframe_settings["reduce_keys"] = self.reduce_keys_checkbox.isChecked()
         copy_paste_keyframe_settings["use_selection"] = self.use_selection_checkbox.isChecked()
         copy_paste_keyframe_settings["use_current_time"] = self.use_current_time_checkbox.isChecked()
         copy_paste_keyframe_settings["reverse"] = self.reverse_keyframes_checkbox.isChecked()
+        copy_paste_keyframe_settings["replace"] = self.replace_keyframes_checkbox.isChecked()
         copy_paste_keyframe_settings["search_replace"] = self.search_and_replace_checkbox.isChecked()
         copy_paste_keyframe_settings["search_string"] = self.search_line_edit.text()
         copy_paste_keyframe_settings["replace_string"] = self.replace_line_edit.text()
         json_utils.write_json_file(COPY_PASTE_KEYFRAME_SETTINGS_PATH, "copy_paste_keyframe_settings",
                                    copy_paste_keyframe_settings)
 
+    def _refresh_clipboard_slots(self):
+        """
+        list the clipboard slots, most recently used first. only the clipboard index is read
+        """
+        self.clipboard_slot_combo_box.clear()
+        for slot in keyframe_utils.get_clipboard_store().list_slots():
+            self.clipboard_slot_combo_box.addItem(slot["name"], slot["id"])
+
     def _setup_socket_connections(self):
         """
         setup socket connections
         """
         # settings updates
         self.all_keyframes_checkbox.stateChanged.connect(self._update_settings)
+        self.export_json_checkbox.stateChanged.connect(self._update_settings)
+        self.use_clipboard_server_checkbox.stateChanged.connect(self._update_settings)
+        self.reduce_keys_checkbox.stateChanged.connect(self._update_settings)
         self.use_selection_checkbox.stateChanged.connect(self._update_settings)
         self.use_current_time_checkbox.stateChanged.connect(self._update_settings)
         self.reverse_keyframes_checkbox.stateChanged.connect(self._update_settings)
+        self.replace_keyframes_checkbox.stateChanged.connect(self._update_settings)
         self.search_and_replace_checkbox.stateChanged.connect(self._update_settings)
         self.search_use_selected_namespace_button.pressed.connect(self._callback_searchline_use_selected_namespace)
         self.replace_use_selected_namespace_button.pressed.connect(self._callback_replaceline_use_selected_namespace)
@@ -192,6 +249,8 @@ class CopyPasteKeyframesUI(DockableMainWindowAbstract):
         # actions
         self.copy_button.pressed.connect(self._callback_copy_keyframe_action)
         self.paste_button.pressed.connect(self._callback_paste_keyframe_action)
+        self.dry_run_button.pressed.connect(self._callback_dry_run_paste_keyframe_action)
+        self.remove_clipboard_slot_button.pressed.connect(self._callback_remove_clipboard_slot)
 
     def _callback_copy_keyframe_action(self):
         """
@@ -199,6 +258,7 @@ class CopyPasteKeyframesUI(DockableMainWindowAbstract):
         :return:
         """
         timeline.copy_keyframes()
+        self._refresh_clipboard_slots()
         maya_utils.message(msg="Copied Keyframes", record_warning=False)
 
     def _callback_paste_keyframe_action(self):
@@ -206,9 +266,43 @@ class CopyPasteKeyframesUI(DockableMainWindowAbstract):
         paste keyframe callback
         :return:
         """
-        timeline.paste_keyframes()
+        timeline.paste_keyframes(slot_id=self._get_paste_slot_id())
+        self._refresh_clipboard_slots()
         maya_utils.message(msg="Pasted Keyframes", record_warning=False)
 
+    def _callback_dry_run_paste_keyframe_action(self):
+        """
+        dry run paste keyframe callback. the paste plan is shown in the script editor
+        :return:
+        """
+        paste_plan = timeline.paste_keyframes(dry_run=True, slot_id=self._get_paste_slot_id())
+        if paste_plan is None:
+            maya_utils.message(msg="dry run: nothing to paste", record_warning=False)
+            return
+        OpenMaya.MGlobal.displayInfo(paste_plan.report())
+        maya_utils.message(
+            msg=f"dry run: {len(paste_plan.curves)} curves and {len(paste_plan.static_values)} values would be pasted",
+            record_warning=False)
+
+    def _get_paste_slot_id(self):
+        """
+        get the clipboard slot to paste from. the clipboard server always pastes its most recent clipboard
+        :return int: slot id, None to paste the most recent clipboard
+        """
+        if self.use_clipboard_server_checkbox.isChecked():
+            return None
+        return self.clipboard_slot_combo_box.currentData()
+
+    def _callback_remove_clipboard_slot(self):
+        """
+        remove the selected clipboard slot
+        """
+        slot_id = self.clipboard_slot_combo_box.currentData()
+        if slot_id is None:
+            return
+        keyframe_utils.get_clipboard_store().remove(slot_id)
+        self._refresh_clipboard_slots()
+
     def _callback_searchline_use_selected_namespace(self):
         """
         search line use selected namespace action
@@ -0,0 +1,156 @@
+"""
+Tests for the local clipboard server. Only the standard library is used so they run without maya:
+    python -m unittest discover -s tests
+The server module is loaded from its file because the package imports maya. Copy and paste fall back to the clipboard
+files whenever the client functions return None, so the error paths check that every client returns None
+"""
+import importlib.util
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import unittest
+
+
+CLIPBOARD_SERVER_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "utilities", "clipboard_server.py")
+
+
+def load_clipboard_server():
+    """
+    load the clipboard server module from its file
+    :return module: clipboard server module
+    """
+    spec = importlib.util.spec_from_file_location("clipboard_server", CLIPBOARD_SERVER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+clipboard_server = load_clipboard_server()
+
+
+# plain python client run in its own process. argv: server path, port, command, clipboard id or payload
+CLIENT_SCRIPT = """
+import importlib.util, sys
+spec = importlib.util.spec_from_file_location("clipboard_server", sys.argv[1])
+clipboard_server = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(clipboard_server)
+port = int(sys.argv[2])
+if sys.argv[3] == "put":
+    entry = clipboard_server.send_clipboard(sys.argv[4].encode("utf-8"), name="client", port=port)
+    sys.stdout.write(str(entry["id"]) if entry else "none")
+else:
+    payload = clipboard_server.receive_clipboard(int(sys.argv[4]) if len(sys.argv) > 4 else None, port=port)
+    sys.stdout.write(payload.decode("utf-8") if payload is not None else "none")
+"""
+
+
+def run_client(port, *arguments):
+    """
+    run a plain python client in its own process
+    :param int port: clipboard server port
+    :param str arguments: command and its argument
+    :return str: client output
+    """
+    result = subprocess.run(
+        [sys.executable, "-c", CLIENT_SCRIPT, CLIPBOARD_SERVER_PATH, str(port)] + list(arguments),
+        capture_output=True, text=True, timeout=30)
+    if result.returncode:
+        raise AssertionError(result.stderr)
+    return result.stdout
+
+
+def get_free_port():
+    """
+    get a port nothing is listening on
+    :return int: port
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        probe.bind((clipboard_server.CLIPBOARD_SERVER_HOST, 0))
+        return probe.getsockname()[1]
+
+
+class ClipboardServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = clipboard_server.ClipboardServer(port=0, clipboard_count=2)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test_copy_and_paste_between_clients(self):
+        clipboard_id = run_client(self.port, "put", "copied keyframes")
+        self.assertEqual(clipboard_id, "1")
+        self.assertEqual(run_client(self.port, "get"), "copied keyframes")
+        self.assertEqual(run_client(self.port, "get", clipboard_id), "copied keyframes")
+
+    def test_most_recent_clipboards_are_kept(self):
+        for index in range(3):
+            clipboard_server.send_clipboard(f"clipboard {index}".encode("utf-8"), port=self.port)
+        entries = clipboard_server.list_clipboards(port=self.port)
+        self.assertEqual([entry["id"] for entry in entries], [3, 2])
+        self.assertEqual(clipboard_server.receive_clipboard(port=self.port), b"clipboard 2")
+        self.assertIsNone(clipboard_server.receive_clipboard(1, port=self.port))
+
+    def test_missing_clipboard(self):
+        self.assertIsNone(clipboard_server.receive_clipboard(port=self.port))
+        clipboard_server.send_clipboard(b"clipboard", port=self.port)
+        self.assertIsNone(clipboard_server.receive_clipboard(999, port=self.port))
+        self.assertEqual(run_client(self.port, "get", "999"), "none")
+
+    def test_partial_request(self):
+        # a client announcing a longer header than it sends then disconnecting doesn't take the server down
+        with socket.create_connection((clipboard_server.CLIPBOARD_SERVER_HOST, self.port)) as connection:
+            connection.sendall(clipboard_server._HEADER_LENGTH.pack(100) + b'{"command": "pu')
+        self.assertTrue(clipboard_server.is_server_running(port=self.port))
+
+    def test_unknown_command(self):
+        header, _ = clipboard_server._request({"command": "cut"}, port=self.port)
+        self.assertEqual(header["status"], "error")
+
+
+class ClipboardServerUnreachableTest(unittest.TestCase):
+
+    def test_connection_refused(self):
+        port = get_free_port()
+        start_time = time.perf_counter()
+        self.assertFalse(clipboard_server.is_server_running(port=port))
+        self.assertIsNone(clipboard_server.send_clipboard(b"clipboard", port=port))
+        self.assertIsNone(clipboard_server.receive_clipboard(port=port))
+        self.assertIsNone(clipboard_server.list_clipboards(port=port))
+        self.assertEqual(run_client(port, "put", "clipboard"), "none")
+        # NOTE: copy and paste fall back to the clipboard files, so an unreachable server must fail fast
+        self.assertLess(time.perf_counter() - start_time, 10.0)
+
+    def test_partial_response(self):
+        # a server closing the connection halfway through the payload is treated as unreachable
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind((clipboard_server.CLIPBOARD_SERVER_HOST, 0))
+        listener.listen(1)
+
+        def respond():
+            connection, _ = listener.accept()
+            with connection:
+                clipboard_server.receive_message(connection)
+                header = b'{"status": "ok", "clipboard": {}, "size": 100}'
+                connection.sendall(clipboard_server._HEADER_LENGTH.pack(len(header)) + header + b"partial")
+
+        thread = threading.Thread(target=respond, daemon=True)
+        thread.start()
+        try:
+            self.assertIsNone(clipboard_server.receive_clipboard(port=listener.getsockname()[1]))
+        finally:
+            thread.join()
+            listener.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
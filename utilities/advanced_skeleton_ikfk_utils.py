@@ -1,10 +1,18 @@
 """
 advanced skeleton IKFK switch extracted so I can manage it better
+Limbs are described by switch definitions loaded from the user data directory, so other rig types can be matched by
+adding a definition. The advanced skeleton definition is written there the first time definitions are loaded
 """
 
+import os
+import time
+
+import numpy
 from maya import cmds
 import maya.api.OpenMaya as om
-from as_maya_tools.utilities import maya_node_utils
+from as_maya_tools.utilities import xform_utils, anim_curve_utils, decorators, name_map_utils, maya_utils, \
+    math_utils, json_utils
+from as_maya_tools import IKFK_SWITCH_DEFINITIONS_PATH
 
         
 IKFK_ARM_NODES = ("FKIKArm", "Shoulder", "Elbow", "Wrist", "PoleArm", "Arm")
@@ -12,243 +20,699 @@ IKFK_LEG_NODES = ("FKIKLeg", "Hip", "PoleLeg", "Leg", "Knee", "Ankle")
 ARM_FK_SNAP_NODES = ("Shoulder", "Elbow", "Wrist")
 LEG_FK_SNAP_NODES = ("Hip", "Knee", "Ankle")
 
+FK_TO_IK = "fk to ik"
+IK_TO_FK = "ik to fk"
+
+
+def build_advanced_skeleton_limb_definition(limb_type, control_names, fk_snap_nodes):
+    """
+    build the switch definition of an advanced skeleton limb
+    :param str limb_type: "Arm" or "Leg"
+    :param tuple(str) control_names: substrings of every control name belonging to the limb
+    :param tuple(str) fk_snap_nodes: fk chain from the root to the end
+    :return dict: limb switch definition
+    """
+    return {
+        "switch_node": "FKIK{0}_{{side}}".format(limb_type),
+        "switch_attribute": "FKIKBlend",
+        "ik_value": 10,
+        "fk_value": 0,
+        "ik_handle": "IK{0}_{{side}}".format(limb_type),
+        # tool only works if these values are set like this :(
+        "ik_handle_values": {"stretchy": 10, "Lenght1": 1, "Lenght2": 1},
+        "control_names": list(control_names),
+        "live_switch_ik_names": ["IK{0}".format(limb_type)],
+        "live_switch_fk_names": list(fk_snap_nodes),
+        "fk_to_ik": [
+            {"control": "FK{0}_{{side}}".format(snap_node), "source": "IKX{0}_{{side}}".format(snap_node)}
+            for snap_node in fk_snap_nodes],
+        # NOTE: the ik control keeps its offset to the end of the ik chain and the pole vector to the middle joint.
+        # offsets are measured before any control moves
+        "ik_to_fk": [
+            {"control": "IK{0}_{{side}}".format(limb_type), "source": "FK{0}_{{side}}".format(fk_snap_nodes[2]),
+             "offset_from": "IKX{0}_{{side}}".format(fk_snap_nodes[2])},
+            {"control": "Pole{0}_{{side}}".format(limb_type), "source": "FK{0}_{{side}}".format(fk_snap_nodes[1]),
+             "offset_from": "IKX{0}_{{side}}".format(fk_snap_nodes[1])},
+        ],
+    }
+
+
+# based on AdvancedSkeleton rig builds. node names are formatted with the side and prefixed with the namespace
+# NOTE: when a control name matches several limbs the later limb wins
+DEFAULT_IKFK_SWITCH_DEFINITION = \
+    {
+        "sides": ["L", "R"],
+        "limbs":
+            {
+                "Arm": build_advanced_skeleton_limb_definition("Arm", IKFK_ARM_NODES, ARM_FK_SNAP_NODES),
+                "Leg": build_advanced_skeleton_limb_definition("Leg", IKFK_LEG_NODES, LEG_FK_SNAP_NODES),
+            },
+    }
+
+DEFAULT_IKFK_SWITCH_DEFINITION_NAME = "advanced_skeleton"
+
+
+def get_ikfk_switch_definitions():
+    """
+    load every switch definition from the user data directory. the advanced skeleton definition is written there if
+    it doesn't exist yet
+    :return dict[str, dict]: definition name to switch definition
+    """
+    if json_utils.read_offset_json_file(IKFK_SWITCH_DEFINITIONS_PATH, DEFAULT_IKFK_SWITCH_DEFINITION_NAME) is None:
+        json_utils.write_json_file(
+            IKFK_SWITCH_DEFINITIONS_PATH, DEFAULT_IKFK_SWITCH_DEFINITION_NAME, DEFAULT_IKFK_SWITCH_DEFINITION)
+    definitions = {}
+    for file in sorted(os.listdir(IKFK_SWITCH_DEFINITIONS_PATH)):
+        name, extension = os.path.splitext(file)
+        if extension != ".json":
+            continue
+        definition = json_utils.read_offset_json_file(IKFK_SWITCH_DEFINITIONS_PATH, name)
+        if not definition or not definition.get("limbs"):
+            cmds.warning("IK/FK switch definition {0} has no limbs".format(name))
+            continue
+        definitions[name] = definition
+    return definitions
+
+
+class LimbMatchPlan(object):
+    """
+    A limb of a rig compiled from its switch definition. Node names are built once, dag paths are resolved once and
+    kept while the nodes exist, and the offset recipe says which controls keep an offset to which node
+    """
+
+    def __init__(self, definition_name, limb_definition, namespace, limb_type, side):
+        """
+        :param str definition_name: name of the switch definition
+        :param dict limb_definition: limb switch definition
+        :param str namespace: character namespace
+        :param str limb_type: limb name in the definition
+        :param str side: side the node names are formatted with
+        """
+        def get_name(name_template):
+            return "{0}:{1}".format(namespace, name_template.format(side=side))
+
+        self.definition_name = definition_name
+        self.namespace = namespace
+        self.limb = limb_type
+        self.side = side
+        self.switch_node = get_name(limb_definition["switch_node"])
+        self.blend_attribute = "{0}.{1}".format(self.switch_node, limb_definition.get("switch_attribute", "FKIKBlend"))
+        self.ik_value = limb_definition.get("ik_value", 10)
+        self.fk_value = limb_definition.get("fk_value", 0)
+        self.ik_handle = get_name(limb_definition["ik_handle"]) if limb_definition.get("ik_handle") else None
+        self.ik_handle_values = [
+            ("{0}.{1}".format(self.ik_handle, attribute), value)
+            for attribute, value in (limb_definition.get("ik_handle_values") or {}).items()] if self.ik_handle else []
+        # fk to ik: (control, source) pairs. ik to fk: (control, source, offset node or None)
+        self.fk_to_ik = [(get_name(entry["control"]), get_name(entry["source"]))
+                         for entry in limb_definition.get("fk_to_ik", [])]
+        self.ik_to_fk = [(get_name(entry["control"]), get_name(entry["source"]),
+                          get_name(entry["offset_from"]) if entry.get("offset_from") else None)
+                         for entry in limb_definition.get("ik_to_fk", [])]
+        required_nodes = [self.switch_node] + ([self.ik_handle] if self.ik_handle else [])
+        for control, source in self.fk_to_ik:
+            required_nodes += [control, source]
+        for control, source, offset_node in self.ik_to_fk:
+            required_nodes += [control, source] + ([offset_node] if offset_node else [])
+        self.required_nodes = list(dict.fromkeys(required_nodes))
+        # every control the limb keys, in either direction
+        self.controls = list(dict.fromkeys(
+            [control for control, _ in self.fk_to_ik] + [control for control, _, _ in self.ik_to_fk]))
+        self._dag_paths = {}  # dict[str, tuple(OpenMaya.MDagPath, OpenMaya.MObjectHandle)]: resolved nodes
+
+    def get_dag_path(self, node):
+        """
+        get the dag path of a node of the limb, resolving it again only if the node was deleted
+        :param str node: node name
+        :return OpenMaya.MDagPath: dag path
+        """
+        dag_path, handle = self._dag_paths.get(node, (None, None))
+        if handle is None or not handle.isValid():
+            dag_path = xform_utils.get_dag_path(node)
+            self._dag_paths[node] = (dag_path, om.MObjectHandle(dag_path.node()))
+        return dag_path
+
+    def get_missing_nodes(self):
+        """
+        :return list[str]: required nodes that aren't in the scene
+        """
+        existing_nodes = name_map_utils.get_existing_names(self.required_nodes)
+        return [node for node in self.required_nodes if node not in existing_nodes]
+
+    def get_direction(self):
+        """
+        get the match direction from the switch attribute at the current time
+        :return str: FK_TO_IK when the limb is in ik, IK_TO_FK when it's in fk, None when blended
+        """
+        blend_value = cmds.getAttr(self.blend_attribute)
+        if blend_value == self.ik_value:
+            return FK_TO_IK
+        if blend_value == self.fk_value:
+            return IK_TO_FK
+        return None
+
+    def set_blend(self, blend_value):
+        """
+        set the switch attribute if it doesn't have the value yet
+        :param float blend_value: switch attribute value
+        :return bool: the value was changed
+        """
+        if cmds.getAttr(self.blend_attribute) == blend_value:
+            return False
+        cmds.setAttr(self.blend_attribute, blend_value)
+        return True
+
+    def prepare(self):
+        """
+        set the ik handle attributes the switch relies on
+        """
+        for attribute_path, value in self.ik_handle_values:
+            # NOTE: values that are already set are skipped so they don't dirty the rig or fill the undo queue
+            if cmds.getAttr(attribute_path) != value:
+                cmds.setAttr(attribute_path, value)
+
+    def get_match(self, direction):
+        """
+        get what to match in a direction. offsets are measured at the current time
+        :param str direction: FK_TO_IK or IK_TO_FK
+        :return tuple(list[OpenMaya.MDagPath], list[OpenMaya.MDagPath], numpy.ndarray): controls, the node each
+        control follows and (control count, 4, 4) offsets in the followed node's space
+        """
+        if direction == FK_TO_IK:
+            entries = [(control, source, None) for control, source in self.fk_to_ik]
+        else:
+            entries = self.ik_to_fk
+        controls = [self.get_dag_path(control) for control, _, _ in entries]
+        sources = [self.get_dag_path(source) for _, source, _ in entries]
+        offsets = numpy.tile(numpy.identity(4), (len(entries), 1, 1))
+        for index, (control, _, offset_node) in enumerate(entries):
+            if offset_node:
+                offsets[index] = math_utils.matrix_to_array(
+                    controls[index].inclusiveMatrix() * self.get_dag_path(offset_node).inclusiveMatrixInverse())
+        return controls, sources, offsets
+
+
+def split_control_name(node):
+    """
+    split a control name into namespace and base name without querying the scene
+    :param str node: control name, short or long
+    :return tuple(str, str): namespace and base name. None if the control has no namespace
+    """
+    namespace, _, base_name = node.rsplit("|", 1)[-1].rpartition(":")
+    if not namespace:
+        return None
+    return namespace, base_name
+
+
+class RigIndex(object):
+    """
+    Index of the limb match plans of every character namespace, compiled from the switch definitions. A namespace is
+    indexed the first time one of its controls is looked up, with one existence query, and the index is dropped when
+    references or namespaces change. Definitions are loaded again when the index is dropped
+    """
+
+    def __init__(self):
+        self.namespaces = {}  # dict[str, dict[tuple(str, str), LimbMatchPlan]]: namespace to (limb, side) to plan
+        self._definitions = None
+        self._control_limbs = {}  # dict[str, tuple(str, str)]: base name to (definition name, limb type)
+        self._live_switches = {}  # dict[str, tuple(str, str, bool)]: base name to (definition, limb type, to ik)
+        self._callback_ids = []
+
+    @property
+    def definitions(self):
+        if self._definitions is None:
+            self._definitions = get_ikfk_switch_definitions()
+        return self._definitions
+
+    def install_callbacks(self):
+        """
+        register the callbacks that invalidate the index
+        """
+        if self._callback_ids:
+            return
+        for message in (
+                om.MSceneMessage.kAfterOpen, om.MSceneMessage.kAfterNew, om.MSceneMessage.kAfterImport,
+                om.MSceneMessage.kAfterCreateReference, om.MSceneMessage.kAfterRemoveReference,
+                om.MSceneMessage.kAfterLoadReference, om.MSceneMessage.kAfterUnloadReference,
+                om.MSceneMessage.kAfterImportReference):
+            self._callback_ids.append(om.MSceneMessage.addCallback(message, self._invalidate))
+        # NOTE: namespace renames are reported as node name changes
+        self._callback_ids.append(om.MEventMessage.addEventCallback("NameChanged", self._invalidate))
+
+    def remove_callbacks(self):
+        """
+        remove the invalidation callbacks
+        """
+        for callback_id in self._callback_ids:
+            try:
+                om.MMessage.removeCallback(callback_id)
+            except RuntimeError:  # MMessage already deleted
+                pass
+        self._callback_ids = []
+
+    def _invalidate(self, *args):
+        """
+        drop every indexed namespace and the loaded definitions
+        """
+        self.namespaces = {}
+        self._definitions = None
+        self._control_limbs = {}
+        self._live_switches = {}
+
+    def get_namespace_limbs(self, namespace):
+        """
+        get the limb plans of a character namespace, compiling them if needed
+        :param str namespace: character namespace
+        :return dict[tuple(str, str), LimbMatchPlan]: (limb type, side) to plan for every limb in the scene
+        """
+        limbs = self.namespaces.get(namespace)
+        if limbs is None:
+            plans = []
+            for definition_name, definition in self.definitions.items():
+                for limb_type, limb_definition in definition["limbs"].items():
+                    for side in definition.get("sides", [""]):
+                        try:
+                            plans.append(LimbMatchPlan(definition_name, limb_definition, namespace, limb_type, side))
+                        except (KeyError, TypeError, AttributeError) as e:
+                            cmds.warning("IK/FK switch definition {0} {1} is invalid: {2}".format(
+                                definition_name, limb_type, e))
+            existing_nodes = name_map_utils.get_existing_names([plan.switch_node for plan in plans])
+            limbs = {(plan.limb, plan.side): plan for plan in plans if plan.switch_node in existing_nodes}
+            self.namespaces[namespace] = limbs
+        return limbs
+
+    def get_scene_limbs(self):
+        """
+        get every limb of every character in the scene, indexing namespaces that aren't indexed yet
+        :return list[LimbMatchPlan]: limb plans
+        """
+        switch_nodes = []
+        for definition in self.definitions.values():
+            for limb_definition in definition["limbs"].values():
+                switch_nodes += [limb_definition["switch_node"].format(side=side)
+                                 for side in definition.get("sides", [""])]
+        nodes = cmds.ls(list(dict.fromkeys(switch_nodes)), recursive=True) or []
+        namespaces = dict.fromkeys(
+            node.rsplit("|", 1)[-1].rpartition(":")[0] for node in nodes if ":" in node)
+        return [limb for namespace in namespaces for limb in self.get_namespace_limbs(namespace).values()]
+
+    def get_control_limb(self, base_name):
+        """
+        get the limb type of a control from its name without namespace. names are matched by substring so every
+        control of a limb, not only the matched ones, resolves to its limb
+        :param str base_name: control name without namespace
+        :return str: limb type, None if the control isn't part of a limb
+        """
+        if base_name not in self._control_limbs:
+            limb_type = None
+            for definition in self.definitions.values():
+                for name, limb_definition in definition["limbs"].items():
+                    if any(control_name in base_name for control_name in limb_definition.get("control_names", [])):
+                        limb_type = name
+            self._control_limbs[base_name] = limb_type
+        return self._control_limbs[base_name]
+
+    def get_live_switch(self, base_name):
+        """
+        get the limb live switching switches when a control is selected, and to which side of the switch
+        :param str base_name: control name without namespace
+        :return tuple(str, bool): limb type and True to switch to ik, False to switch to fk. None if selecting the
+        control doesn't switch
+        """
+        if base_name not in self._live_switches:
+            live_switch = None
+            for to_ik in (True, False):
+                names_key = "live_switch_ik_names" if to_ik else "live_switch_fk_names"
+                for definition in self.definitions.values():
+                    for limb_type, limb_definition in definition["limbs"].items():
+                        if any(name in base_name for name in limb_definition.get(names_key, [])):
+                            live_switch = (limb_type, to_ik)
+            self._live_switches[base_name] = live_switch
+        return self._live_switches[base_name]
+
+    def get_side(self, base_name):
+        """
+        get the side of a control from the sides of the definitions
+        :param str base_name: control name without namespace
+        :return str: side, None if the name doesn't end with a side
+        """
+        for definition in self.definitions.values():
+            for side in definition.get("sides", []):
+                if side and base_name.endswith("_{0}".format(side)):
+                    return side
+        return None
+
+    def get_limb(self, node, limb_type=None):
+        """
+        get the limb plan a control belongs to
+        :param str node: name of node belonging to IK/FK system
+        :param str limb_type: limb type. resolved from the control name if None
+        :return LimbMatchPlan: limb plan, None if the node isn't part of a limb in the scene
+        """
+        control_name = split_control_name(node)
+        if control_name is None:
+            return None
+        namespace, base_name = control_name
+        side = self.get_side(base_name)
+        limb_type = limb_type or self.get_control_limb(base_name)
+        if not limb_type or side is None:
+            return None
+        return self.get_namespace_limbs(namespace).get((limb_type, side))
+
+
+_RIG_INDEX = None
+
+
+def get_rig_index():
+    """
+    get the shared rig index. callbacks are installed the first time it's requested
+    :return RigIndex: rig index
+    """
+    global _RIG_INDEX
+    if _RIG_INDEX is None:
+        _RIG_INDEX = RigIndex()
+        _RIG_INDEX.install_callbacks()
+    return _RIG_INDEX
+
+
+def get_limb_nodes(node):
+    """
+    resolve the IK/FK limb a control belongs to
+    :param str node: name of node belonging to IK/FK system
+    :return LimbMatchPlan: limb plan. None if the node isn't part of a limb
+    """
+    return get_rig_index().get_limb(node)
+
+
+def get_selected_limbs(nodes):
+    """
+    resolve the limbs of selected controls. nodes that aren't limb controls are skipped
+    :param list[str] nodes: selected nodes
+    :return dict[str, tuple(str, LimbMatchPlan)]: switch node to the first selected control of the limb and its plan
+    """
+    limbs = {}
+    for node in nodes:
+        limb_nodes = get_limb_nodes(node)
+        if limb_nodes:
+            # NOTE: every control of a limb resolves to the same limb, so it is only matched once
+            limbs.setdefault(limb_nodes.switch_node, (node, limb_nodes))
+    return limbs
+
+
+def get_limbs_keyframes(limbs):
+    """
+    get every keyed frame of the controls of limbs
+    :param list[LimbMatchPlan] limbs: limb plans
+    :return list[float]: sorted keyed frames
+    """
+    controls = name_map_utils.get_existing_names(
+        list(dict.fromkeys(control for limb_nodes in limbs for control in limb_nodes.controls)))
+    if not controls:
+        return []
+    keyframes = cmds.keyframe(list(controls), query=True, timeChange=True) or []
+    return sorted(set(keyframes))
+
+
+def get_live_switch_blends(nodes):
+    """
+    get the switch value live switching sets for a list of selected controls
+    :param list[str] nodes: selected nodes. nodes that aren't limb controls are ignored
+    :return dict[str, tuple(LimbMatchPlan, float)]: switch node to limb plan and switch value. later nodes win
+    """
+    rig_index = get_rig_index()
+    blends = {}
+    for node in nodes:
+        control_name = split_control_name(node)
+        if control_name is None:
+            continue
+        live_switch = rig_index.get_live_switch(control_name[1])
+        if not live_switch:
+            continue
+        limb_type, to_ik = live_switch
+        limb_nodes = rig_index.get_limb(node, limb_type=limb_type)
+        if limb_nodes:
+            blends[limb_nodes.switch_node] = (limb_nodes, limb_nodes.ik_value if to_ik else limb_nodes.fk_value)
+    return blends
+
+
+def set_live_switch_blends(blends):
+    """
+    set switch values, skipping limbs that already have the value
+    :param dict[str, tuple(LimbMatchPlan, float)] blends: switch node to limb plan and switch value
+    :return int: number of limbs switched
+    """
+    switched_count = 0
+    for limb_nodes, blend_value in blends.values():
+        if limb_nodes.set_blend(blend_value):
+            limb_nodes.prepare()
+            switched_count += 1
+    return switched_count
+
 
 def selection_changed_callback_switch_ikfk():
     """
     function to switch between IK and FK interpolation using a SelectionChanged callback in Maya
     """
-    selection = cmds.ls(selection=True)
-    if len(selection) < 0:
-        return
-    for node in selection:
-        side=None
-        if node.endswith("_L"):
-            side ="L"
-        if node.endswith("_R"):
-            side ="R"
-        if not side:
+    set_live_switch_blends(get_live_switch_blends(cmds.ls(selection=True) or []))
+
+
+class LiveSwitchCallback(object):
+    """
+    SelectionChanged callback switching limbs between IK and FK as their controls are selected. Bursts of selection
+    events are handled once when maya is idle, and only controls that weren't selected before are looked at
+    """
+
+    def __init__(self):
+        self._callback_id = None
+        self._dispatch_pending = False
+        self._previous_selection = set()
+
+    @property
+    def installed(self):
+        return self._callback_id is not None
+
+    def install(self):
+        """
+        register the SelectionChanged callback
+        """
+        if self._callback_id is not None:
             return
-        if not ":" in node:
+        self._previous_selection = set(cmds.ls(selection=True) or [])
+        self._callback_id = om.MEventMessage.addEventCallback("SelectionChanged", self._selection_changed)
+
+    def remove(self):
+        """
+        remove the SelectionChanged callback
+        """
+        if self._callback_id is None:
             return
-        
-        #namespace, base_name = node.split(":")# If no namespace this will throw an error!!!!
-        as_maya_node = maya_node_utils.MayaNode(node) # get my as_maya_tools maya node object from node string
-        namespace = as_maya_node.namespace
-        base_name = as_maya_node.short_name
-        fkik_node = None
-        if "IKArm" in node:
-            print("to IK we go!!!!")
-            fkik_node = "{0}:FKIKArm_{1}".format(namespace, side)
-            ik_handle = "{0}:IKArm_{1}".format(namespace, side)
-            cmds.setAttr("{0}.FKIKBlend".format(fkik_node), 10)
-                
-        if "IKLeg" in node:
-            print("to IK we go!!!!")
-            fkik_node = "{0}:FKIKLeg_{1}".format(namespace, side)
-            ik_handle = "{0}:IKLeg_{1}".format(namespace, side)
-            cmds.setAttr("{0}.FKIKBlend".format(fkik_node), 10)
-            
-        for control_base_name in ARM_FK_SNAP_NODES:
-            if control_base_name in node:
-                print("to FK we go!!!!")
-                fkik_node = "{0}:FKIKArm_{1}".format(namespace, side)
-                ik_handle = "{0}:IKArm_{1}".format(namespace, side)
-                cmds.setAttr("{0}.FKIKBlend".format(fkik_node), 0)
-                
-        for control_base_name in LEG_FK_SNAP_NODES:
-            if control_base_name in node:
-                print("to FK we go!!!!")
-                fkik_node = "{0}:FKIKLeg_{1}".format(namespace, side)
-                ik_handle = "{0}:IKLeg_{1}".format(namespace, side)
-                cmds.setAttr("{0}.FKIKBlend".format(fkik_node), 0)
-                
-        if not fkik_node:
+        try:
+            om.MMessage.removeCallback(self._callback_id)
+        except RuntimeError:  # MMessage already deleted
+            pass
+        self._callback_id = None
+        self._previous_selection = set()
+
+    def _selection_changed(self, *args):
+        """
+        schedule a single dispatch for a burst of selection events
+        """
+        if self._dispatch_pending:
             return
-            
-        ik_fk_switch = cmds.getAttr("{0}.FKIKBlend".format(fkik_node))
-        # tool only works if these values are set like this :(
-        cmds.setAttr("{0}.stretchy".format(ik_handle),10)
-        cmds.setAttr("{0}.Lenght1".format(ik_handle),1)
-        cmds.setAttr("{0}.Lenght2".format(ik_handle),1)
+        self._dispatch_pending = True
+        cmds.evalDeferred(self._dispatch, lowestPriority=True)
+
+    def _dispatch(self):
+        """
+        switch the limbs of newly selected controls
+        """
+        self._dispatch_pending = False
+        if self._callback_id is None:
+            return
+        selection = cmds.ls(selection=True) or []
+        new_nodes = [node for node in selection if node not in self._previous_selection]
+        self._previous_selection = set(selection)
+        if new_nodes:
+            set_live_switch_blends(get_live_switch_blends(new_nodes))
 
 
 def match_ikfk(*args, **kwargs):
     """
     match ik to fk or fk to ik dependant on the FKIK control blend attribute values
     """
-    selection = cmds.ls(selection=True)
-    if len(selection) < 0:
-        return
-    for node in selection:
-        side=None
-        if node.endswith("_L"):
-            side ="L"
-        if node.endswith("_R"):
-            side ="R"
-        if not side:
-            return
-        if not ":" in node:
-            return
-        as_maya_node = maya_node_utils.MayaNode(node) # get my as_maya_tools maya node object from node string
-        namespace = as_maya_node.namespace
-        base_name = as_maya_node.short_name
-        #namespace, base_name = node.rsplit(":")# If no namespace this will throw an error!!!!
-        fkik_node = None
-        for snap_node in IKFK_ARM_NODES:
-            if snap_node in node:
-                fkik_node = "{0}:FKIKArm_{1}".format(namespace, side)
-                ik_handle = "{0}:IKArm_{1}".format(namespace, side)
-                continue
-                
-        for snap_node in IKFK_LEG_NODES:
-            if snap_node in node:
-                fkik_node = "{0}:FKIKLeg_{1}".format(namespace, side)
-                ik_handle = "{0}:IKLeg_{1}".format(namespace, side)
-                continue
-        
-        if not fkik_node:
-            return
-            
-        ik_fk_switch = cmds.getAttr("{0}.FKIKBlend".format(fkik_node))
-        # tool only works if these values are set like this :(
-        cmds.setAttr("{0}.stretchy".format(ik_handle),10)
-        cmds.setAttr("{0}.Lenght1".format(ik_handle),1)
-        cmds.setAttr("{0}.Lenght2".format(ik_handle),1)
-        
-        if ik_fk_switch == 10:
-            match_fk_to_ik(node, side)
-        if ik_fk_switch == 0:
-            match_ik_to_fk(node, side)
+    for node, limb_nodes in get_selected_limbs(cmds.ls(selection=True) or []).values():
+        direction = limb_nodes.get_direction()
+        limb_nodes.prepare()
 
+        if direction == FK_TO_IK:
+            match_fk_to_ik(node)
+        if direction == IK_TO_FK:
+            match_ik_to_fk(node)
 
-def match_fk_to_ik(node, side):
+
+def match_fk_to_ik(node):
     """
     match fk to ik controls
     :param str node: name of node belonging to IK/FK system
     """
-    # TODO: try to make this more universal
-    #arm
-    fk_snap_nodes = None
-    
-    for snap_node in IKFK_ARM_NODES:
-        if snap_node in node:
-            fk_snap_nodes = ARM_FK_SNAP_NODES
-            continue
-            
-    for snap_node in IKFK_LEG_NODES:
-        if snap_node in node:
-            fk_snap_nodes = LEG_FK_SNAP_NODES
-            continue
-            
-    if not fk_snap_nodes:
+    limb_nodes = get_limb_nodes(node)
+    if not limb_nodes:
         cmds.warning("select an IK or FK control")
         return
-        
-    as_maya_node = maya_node_utils.MayaNode(node) # get my as_maya_tools maya node object from node string
-    namespace = as_maya_node.namespace
-    base_name = as_maya_node.short_name
-    
-    #namespace, base_name = node.split(":")
-    
-    for snap_node in fk_snap_nodes:
-        ctrl_name = "{0}:FK{1}_{2}".format(namespace, snap_node, side)
-        snap_position_node_name = "{0}:IKX{1}_{2}".format(namespace, snap_node, side)
+
+    for ctrl_name, snap_position_node_name in limb_nodes.fk_to_ik:
         snap_to_matrix = cmds.xform(snap_position_node_name, query=True, matrix=True, ws=True)
         cmds.xform(ctrl_name, matrix=list(snap_to_matrix), ws=True)
         cmds.setKeyframe(ctrl_name)
 
 
-def match_ik_to_fk(node, side):
+def match_ik_to_fk(node):
     """
     match ik to fk controls
     :param str node: name of node belonging to IK/FK system
     """
-    ik_matrix_offset_dict = get_ik_matrix_offset_dict(node, side)
-    
-    if not ik_matrix_offset_dict:
+    limb_nodes = get_limb_nodes(node)
+    if not limb_nodes:
         cmds.warning("Unable to get ik controls for switch")
         return
-    
-    # match ik control
-    offset_mmatrix = om.MMatrix(ik_matrix_offset_dict["ik_matrix"])
-    parent_world_matrix = om.MMatrix(cmds.xform(ik_matrix_offset_dict["ik_control_snap_bone"], q=True, matrix=True, ws=True))
-    paste_matrix = offset_mmatrix * parent_world_matrix
-    cmds.xform(ik_matrix_offset_dict["ik_control"], matrix=list(paste_matrix), ws=True)
-    cmds.setKeyframe(ik_matrix_offset_dict["ik_control"])
-    
-    # match pole vector control
-    offset_mmatrix = om.MMatrix(ik_matrix_offset_dict["pole_matrix"])
-    parent_world_matrix = om.MMatrix(cmds.xform(ik_matrix_offset_dict["pole_control_snap_bone"], q=True, matrix=True, ws=True))
-    paste_matrix = offset_mmatrix * parent_world_matrix
-    cmds.xform(ik_matrix_offset_dict["pole_control"], matrix=list(paste_matrix), ws=True)
-    cmds.setKeyframe(ik_matrix_offset_dict["pole_control"])
-    
-   
-def get_ik_matrix_offset_dict(node, side):
+
+    # offsets are measured for every control before any of them moves
+    controls, sources, offsets = limb_nodes.get_match(IK_TO_FK)
+    for (ctrl_name, _, _), source, offset in zip(limb_nodes.ik_to_fk, sources, offsets):
+        paste_matrix = om.MMatrix(offset.flatten().tolist()) * source.inclusiveMatrix()
+        cmds.xform(ctrl_name, matrix=list(paste_matrix), ws=True)
+        cmds.setKeyframe(ctrl_name)
+
+
+@decorators.suspend_refresh
+@decorators.undoable_chunk
+def match_all_limbs(frames=None, *args, **kwargs):
     """
-    :param str node: name of node belonging to IK/FK system
+    match ik to fk or fk to ik for every limb of every character in the scene. the direction of each limb is set by
+    its FKIK control blend attribute value at the current time. the matrices of every limb are read together, one
+    evaluation context per frame, then each limb is keyed in one batch per curve
+    :param list[float] frames: frames to match. the current frame if None
+    :return tuple(list[dict], float): report for each limb, with limb, direction, time in milliseconds, keyed frame
+    count and error, and the milliseconds spent reading the matrices of every limb. show it with
+    report_match_all_limbs()
     """
-    # Figure out which controls to use
-        
-    # assuming there is always a namespace
-    as_maya_node = maya_node_utils.MayaNode(node) # get my as_maya_tools maya node object from node string
-    namespace = as_maya_node.namespace
-    base_name = as_maya_node.short_name
-    # Get what type of ik system it is and grab the controls
-    ik_chain_bone = None
-    ik_pole_bone = None
-    ik_control = None
-    pole_control = None
-    ik_control_snap_bone = None
-    pole_control_snap_bone = None
-    
-    for snap_node in IKFK_ARM_NODES:
-        if snap_node in node:
-            ik_chain_bone = "{0}:IKXWrist_{1}".format(namespace, side)
-            ik_pole_bone = "{0}:IKXElbow_{1}".format(namespace, side)
-            ik_control = "{0}:IKArm_{1}".format(namespace, side)
-            pole_control = "{0}:PoleArm_{1}".format(namespace, side)
-            ik_control_snap_bone = "{0}:FKWrist_{1}".format(namespace, side)
-            pole_control_snap_bone = "{0}:FKElbow_{1}".format(namespace, side)
-            
-    for snap_node in IKFK_LEG_NODES:
-        if snap_node in node:
-            ik_chain_bone = "{0}:IKXAnkle_{1}".format(namespace, side)
-            ik_pole_bone = "{0}:IKXKnee_{1}".format(namespace, side)
-            ik_control = "{0}:IKLeg_{1}".format(namespace, side)
-            pole_control = "{0}:PoleLeg_{1}".format(namespace, side)
-            ik_control_snap_bone = "{0}:FKAnkle_{1}".format(namespace, side)
-            pole_control_snap_bone = "{0}:FKKnee_{1}".format(namespace, side)
-            
-    for node_name in [ik_chain_bone, ik_pole_bone, ik_control, pole_control, ik_control_snap_bone, pole_control_snap_bone]:
-        if not node_name:
-            return None
-        
-    # Build dict
-    ik_snap_matrix_dict = {}
-    ik_snap_matrix_dict["ik_matrix"] = get_matrices_offset_dict(ik_chain_bone, ik_control)
-    ik_snap_matrix_dict["pole_matrix"] = get_matrices_offset_dict(ik_pole_bone, pole_control)
-    ik_snap_matrix_dict["ik_control"] = ik_control
-    ik_snap_matrix_dict["pole_control"] = pole_control
-    ik_snap_matrix_dict["ik_control_snap_bone"] = ik_control_snap_bone
-    ik_snap_matrix_dict["pole_control_snap_bone"] = pole_control_snap_bone
-    
-    return ik_snap_matrix_dict
-
-
-# NOTE: this calculation can cause issues where the shear value is manipulated. This can cause the IK control to explode into the nether
-def get_matrices_offset_dict(parent, child):
-    """get the matrices offset dict
-    :param str parent: parent to relate offset to
-    :param list[str] children: children to compare
-    :return dict: each key, named child, holding the offset matrix"""
-
-
-    # Using open maya to do the matrix math to get the offset
-    parent_matrix = om.MMatrix(cmds.xform(parent, query=True, matrix=True, ws=True))
-    child_matrix = om.MMatrix(cmds.xform(child, query=True, matrix=True, ws=True))
-    offset_mmatrix = child_matrix * parent_matrix.inverse()
-    return list(offset_mmatrix)
+    if not frames:
+        frames = [cmds.currentTime(query=True)]
+    limbs = get_rig_index().get_scene_limbs()
+    report = []
+    plans = []  # list[tuple(dict, list[MDagPath], list[MDagPath], numpy.ndarray)]: report entry, controls, sources, offsets
+
+    # resolve what every limb matches. missing nodes and blended limbs are reported instead of stopping the batch
+    for limb_nodes in limbs:
+        start_time = time.perf_counter()
+        entry = {"limb": limb_nodes.switch_node, "direction": None, "time": 0.0, "frames": 0, "error": None}
+        report.append(entry)
+        try:
+            missing_nodes = limb_nodes.get_missing_nodes()
+            if missing_nodes:
+                raise ValueError("missing nodes {0}".format(", ".join(missing_nodes)))
+
+            entry["direction"] = limb_nodes.get_direction()
+            if entry["direction"] is None:
+                entry["direction"] = "blended"
+                continue
+            controls, sources, offsets = limb_nodes.get_match(entry["direction"])
+            limb_nodes.prepare()
+            plans.append((entry, controls, sources, offsets))
+        except Exception as e:
+            entry["error"] = str(e)
+        finally:
+            entry["time"] += (time.perf_counter() - start_time) * 1000.0
+
+    anim_curve_changes = []
+    read_time = 0.0
+    try:
+        local_matrices = None
+        if plans:
+            # NOTE: every limb is read together so each frame is evaluated once for the whole scene
+            start_time = time.perf_counter()
+            try:
+                local_matrices = xform_utils.get_matched_local_matrices(
+                    [control for plan in plans for control in plan[1]],
+                    [source for plan in plans for source in plan[2]],
+                    frames,
+                    offsets=numpy.concatenate([plan[3] for plan in plans]))
+            except Exception:
+                # limbs are read one by one below so a broken limb doesn't fail the others
+                local_matrices = None
+            read_time = (time.perf_counter() - start_time) * 1000.0
+
+        control_index = 0
+        for entry, controls, sources, offsets in plans:
+            start_time = time.perf_counter()
+            try:
+                if local_matrices is None:
+                    limb_local_matrices = xform_utils.get_matched_local_matrices(
+                        controls, sources, frames, offsets=offsets)
+                else:
+                    limb_local_matrices = local_matrices[control_index:control_index + len(controls)]
+                xform_utils.key_local_matrices(
+                    controls, limb_local_matrices, frames, anim_curve_changes=anim_curve_changes)
+                entry["frames"] = len(frames)
+            except Exception as e:
+                entry["error"] = str(e)
+            finally:
+                control_index += len(controls)
+                entry["time"] += (time.perf_counter() - start_time) * 1000.0
+    finally:
+        # every key written across every limb is recorded as a single undoable command
+        anim_curve_utils.commit_anim_curve_changes(anim_curve_changes)
+
+    return report, read_time
+
+
+def report_match_all_limbs(report, read_time, verbose=False):
+    """
+    show a summary of a match of every limb
+    :param list[dict] report: report returned by match_all_limbs()
+    :param float read_time: milliseconds spent reading the matrices of every limb
+    :param bool verbose: option to also show the result and time of each limb in the script editor
+    """
+    if verbose:
+        for entry in report:
+            status = "failed: {0}".format(entry["error"]) if entry["error"] else "{0} frames".format(entry["frames"])
+            om.MGlobal.displayInfo(
+                "{0} {1} {2:.1f}ms {3}".format(entry["limb"], entry["direction"] or "", entry["time"], status))
+        om.MGlobal.displayInfo("matrix reads for every limb {0:.1f}ms".format(read_time))
+    failed_entries = [entry for entry in report if entry["error"]]
+    for entry in failed_entries:
+        cmds.warning("{0} failed: {1}".format(entry["limb"], entry["error"]))
+    matched_count = len([entry for entry in report if entry["frames"]])
+    maya_utils.message(
+        "{0} limbs matched, {1} failed".format(matched_count, len(failed_entries)), position='midCenterTop',
+        record_warning=bool(failed_entries))
+
+
+@decorators.undoable_chunk
+def match_ikfk_range(frames, *args, **kwargs):
+    """
+    match ik to fk or fk to ik over many frames without changing the current time. the direction of each limb is set
+    by its FKIK control blend attribute value at the current time
+    :param list[float] frames: frames to match
+    """
+    if not frames:
+        return
+    limbs = get_selected_limbs(cmds.ls(selection=True) or [])
+
+    anim_curve_changes = []
+    try:
+        for _, limb_nodes in limbs.values():
+            direction = limb_nodes.get_direction()
+            if direction is None:
+                continue
+            # NOTE: ik to fk offsets are measured once at the current time
+            controls, sources, offsets = limb_nodes.get_match(direction)
+            limb_nodes.prepare()
+            anim_curve_changes += xform_utils.match_world_matrices_at_frames(
+                controls, sources, frames, offsets=offsets)
+    finally:
+        # every key written across the range is recorded as a single undoable command
+        anim_curve_utils.commit_anim_curve_changes(anim_curve_changes)
 
 
 # Mouse click callbacks
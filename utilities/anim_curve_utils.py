@@ -0,0 +1,1082 @@
+"""
+Utilities for reading and writing whole animation curves in bulk
+Curves are captured into columns (one array per keyframe property) with a handful of queries per curve instead of
+a dozen queries per keyframe, and written back in one batch per curve through OpenMayaAnim
+"""
+import hashlib
+from functools import partial
+
+import numpy
+from maya import cmds
+import maya.api.OpenMaya as OpenMaya
+import maya.api.OpenMayaAnim as OpenMayaAnim
+
+from as_maya_tools.utilities import maya_utils, undo_utils
+
+
+# NOTE: tangent types are stored as indices into this tuple so they can be packed into arrays
+TANGENT_TYPES = (
+    "auto", "spline", "linear", "flat", "step", "stepnext", "clamped", "plateau", "fixed", "slow", "fast", "global",
+    "autoease", "automix", "autocustom")
+
+# OpenMayaAnim tangent type attribute names matching TANGENT_TYPES
+_API_TANGENT_TYPE_NAMES = (
+    "kTangentAuto", "kTangentSmooth", "kTangentLinear", "kTangentFlat", "kTangentStep", "kTangentStepNext",
+    "kTangentClamped", "kTangentPlateau", "kTangentFixed", "kTangentSlow", "kTangentFast", "kTangentGlobal",
+    "kTangentAutoEase", "kTangentAutoMix", "kTangentAutoCustom")
+
+# NOTE: older maya versions are missing some of the auto tangent types. those fall back to auto
+API_TANGENT_TYPES = tuple(
+    getattr(OpenMayaAnim.MFnAnimCurve, name, OpenMayaAnim.MFnAnimCurve.kTangentAuto)
+    for name in _API_TANGENT_TYPE_NAMES)
+
+# columns stored as floats, one entry per keyframe
+FLOAT_COLUMNS = ("times", "values", "in_angle", "out_angle", "in_weight", "out_weight", "ix", "iy", "ox", "oy")
+
+# columns stored as indices into TANGENT_TYPES
+TANGENT_COLUMNS = ("in_tangent", "out_tangent")
+
+# columns stored as bools
+BOOL_COLUMNS = ("lock", "weight_lock")
+
+COLUMNS = FLOAT_COLUMNS + TANGENT_COLUMNS + BOOL_COLUMNS
+
+# default tolerances used when reducing curves. values are in the attribute's ui units, angles in degrees
+DEFAULT_REDUCE_TOLERANCE = 0.001
+
+DEFAULT_REDUCE_ANGLE_TOLERANCE = 0.01
+
+# keyTangent query flags for each column that is read straight from the keyTangent command
+_KEY_TANGENT_QUERY_FLAGS = {
+    "in_angle": "inAngle",
+    "out_angle": "outAngle",
+    "in_weight": "inWeight",
+    "out_weight": "outWeight",
+    "ix": "ix",
+    "iy": "iy",
+    "ox": "ox",
+    "oy": "oy",
+    "lock": "lock",
+    "weight_lock": "weightLock",
+}
+
+
+class AnimCurveData(object):
+    """
+    Columnar snapshot of a single animation curve. Every column holds one entry per keyframe
+    """
+
+    def __init__(self, attribute=None, current_value=0.0, weighted_tangents=False, columns=None, content_hash=None):
+        """
+        :param str attribute: short name of the attribute the curve drives
+        :param float current_value: value of the attribute at the time of capture. used when there are no keyframes
+        :param bool weighted_tangents: curve uses weighted tangents
+        :param dict columns: column name to numpy array. empty columns are created if None
+        :param str content_hash: hash identifying the captured curve content. set by AnimCurveCache
+        """
+        self.attribute = attribute
+        self.current_value = current_value
+        self.weighted_tangents = weighted_tangents
+        self.columns = columns if columns is not None else empty_columns()
+        self.content_hash = content_hash
+
+    def __len__(self):
+        return len(self.columns["times"])
+
+    @property
+    def times(self):
+        return self.columns["times"]
+
+    @property
+    def values(self):
+        return self.columns["values"]
+
+    def get_tangent_names(self, column):
+        """
+        Get a tangent type column as tangent type names
+        :param str column: in_tangent or out_tangent
+        :return list[str]: tangent type names
+        """
+        return [TANGENT_TYPES[index] for index in self.columns[column]]
+
+    def to_dict(self):
+        """
+        Convert the curve data to a json friendly dictionary
+        :return dict: curve data
+        """
+        curve_data = {}
+        for column in FLOAT_COLUMNS + BOOL_COLUMNS:
+            curve_data[column] = self.columns[column].tolist()
+        for column in TANGENT_COLUMNS:
+            curve_data[column] = self.get_tangent_names(column)
+        return {
+            "current_value": self.current_value,
+            "weighted_tangents": self.weighted_tangents,
+            "curve_data": curve_data,
+        }
+
+    @classmethod
+    def from_dict(cls, data, attribute=None):
+        """
+        Create curve data from a dictionary created with to_dict()
+        :param dict data: curve data dictionary
+        :param str attribute: short name of the attribute the curve drives
+        :return AnimCurveData: curve data
+        """
+        curve_data = data.get("curve_data") or {}
+        columns = empty_columns()
+        if curve_data:
+            for column in FLOAT_COLUMNS:
+                columns[column] = numpy.asarray(curve_data[column], dtype=numpy.float64)
+            for column in BOOL_COLUMNS:
+                columns[column] = numpy.asarray(curve_data[column], dtype=bool)
+            for column in TANGENT_COLUMNS:
+                columns[column] = get_tangent_indices(curve_data[column])
+        return cls(
+            attribute=attribute,
+            current_value=data.get("current_value", 0.0),
+            weighted_tangents=data.get("weighted_tangents", False),
+            columns=columns)
+
+
+def empty_columns(key_count=0):
+    """
+    Create a set of empty columns
+    :param int key_count: number of keyframes the columns hold
+    :return dict: column name to numpy array
+    """
+    columns = {}
+    for column in FLOAT_COLUMNS:
+        columns[column] = numpy.zeros(key_count, dtype=numpy.float64)
+    for column in TANGENT_COLUMNS:
+        columns[column] = numpy.zeros(key_count, dtype=numpy.uint8)
+    for column in BOOL_COLUMNS:
+        columns[column] = numpy.zeros(key_count, dtype=bool)
+    return columns
+
+
+def get_tangent_indices(tangent_names):
+    """
+    Convert tangent type names to TANGENT_TYPES indices. Unknown tangent types fall back to auto
+    :param list[str] tangent_names: tangent type names
+    :return numpy.ndarray: tangent type indices
+    """
+    indices = [TANGENT_TYPES.index(name) if name in TANGENT_TYPES else 0 for name in tangent_names]
+    return numpy.asarray(indices, dtype=numpy.uint8)
+
+
+def get_anim_curve_data(node, attribute, frame_range=None):
+    """
+    Capture an attribute's animation curve with a handful of array queries
+    :param str node: owner of the attribute
+    :param str attribute: short name of the attribute
+    :param list[float] frame_range: option to only capture keyframes in the range. all keyframes are captured if None
+    :return AnimCurveData: curve data. the curve data will have no keyframes if the attribute isn't animated
+    """
+    attribute_path = f"{node}.{attribute}"
+    time_kwargs = {}
+    if frame_range:
+        time_kwargs["time"] = (frame_range[0], frame_range[1])
+
+    current_value = cmds.getAttr(attribute_path)
+    # NOTE: times and values are returned interleaved [time, value, time, value...]
+    key_values = cmds.keyframe(attribute_path, query=True, timeChange=True, valueChange=True, **time_kwargs)
+    if not key_values:
+        return AnimCurveData(attribute=attribute, current_value=current_value)
+
+    columns = {}
+    key_values = numpy.asarray(key_values, dtype=numpy.float64)
+    columns["times"] = key_values[0::2]
+    columns["values"] = key_values[1::2]
+
+    for column, flag in _KEY_TANGENT_QUERY_FLAGS.items():
+        column_values = cmds.keyTangent(attribute_path, query=True, **{flag: True}, **time_kwargs)
+        dtype = bool if column in BOOL_COLUMNS else numpy.float64
+        columns[column] = numpy.asarray(column_values, dtype=dtype)
+
+    columns["in_tangent"] = get_tangent_indices(
+        cmds.keyTangent(attribute_path, query=True, inTangentType=True, **time_kwargs))
+    columns["out_tangent"] = get_tangent_indices(
+        cmds.keyTangent(attribute_path, query=True, outTangentType=True, **time_kwargs))
+
+    weighted_tangents = cmds.keyTangent(attribute_path, query=True, weightedTangents=True)
+    return AnimCurveData(
+        attribute=attribute,
+        current_value=current_value,
+        weighted_tangents=bool(weighted_tangents and weighted_tangents[0]),
+        columns=columns)
+
+
+def get_redundant_key_mask(curve_data, tolerance=DEFAULT_REDUCE_TOLERANCE, angle_tolerance=DEFAULT_REDUCE_ANGLE_TOLERANCE):
+    """
+    Find the keyframes that can be removed without changing the shape of the curve. A key is redundant when it lies on
+    the line between its neighbours and its tangents and the tangents facing it are aligned with that line, so dense
+    keys on constant or linear sections collapse to the keys at each end of the section
+    :param AnimCurveData curve_data: curve data
+    :param float tolerance: max distance between a key's value and the line through its neighbours
+    :param float angle_tolerance: max difference between the tangent angles of the section, in degrees
+    :return numpy.ndarray: bool mask of the redundant keyframes
+    """
+    key_count = len(curve_data)
+    keep = numpy.ones(key_count, dtype=bool)
+    if key_count < 3:
+        return ~keep
+
+    columns = curve_data.columns
+    times = curve_data.times
+    values = curve_data.values
+    stepped = numpy.isin(columns["out_tangent"], (TANGENT_TYPES.index("step"), TANGENT_TYPES.index("stepnext")))
+
+    while True:
+        kept = numpy.flatnonzero(keep)
+        if len(kept) < 3:
+            break
+        previous_keys, keys, next_keys = kept[:-2], kept[1:-1], kept[2:]
+
+        # linear interpolation of each key between its kept neighbours
+        weight = (times[keys] - times[previous_keys]) / (times[next_keys] - times[previous_keys])
+        expected = values[previous_keys] + (values[next_keys] - values[previous_keys]) * weight
+        on_line = numpy.abs(values[keys] - expected) <= tolerance
+
+        section_angle = columns["out_angle"][previous_keys]
+        aligned = (
+            (numpy.abs(columns["in_angle"][keys] - section_angle) <= angle_tolerance) &
+            (numpy.abs(columns["out_angle"][keys] - section_angle) <= angle_tolerance) &
+            (numpy.abs(columns["in_angle"][next_keys] - section_angle) <= angle_tolerance))
+
+        redundant = on_line & aligned & ~stepped[previous_keys] & ~stepped[keys]
+        if not redundant.any():
+            break
+
+        # NOTE: only every other key of a run of redundant keys is removed per pass so every removed key was tested
+        # against neighbours that are kept
+        index = numpy.arange(len(redundant))
+        run_starts = redundant & ~numpy.concatenate(([False], redundant[:-1]))
+        run_start_index = numpy.maximum.accumulate(numpy.where(run_starts, index, 0))
+        keep[keys[redundant & ((index - run_start_index) % 2 == 0)]] = False
+    return ~keep
+
+
+def reduce_anim_curve_data(curve_data, tolerance=DEFAULT_REDUCE_TOLERANCE, angle_tolerance=DEFAULT_REDUCE_ANGLE_TOLERANCE):
+    """
+    Get a copy of curve data without its redundant keyframes. Constant curves are reduced to the value at each end
+    of the copied range so the pasted range is kept
+    :param AnimCurveData curve_data: curve data
+    :param float tolerance: max distance between a removed key's value and the reduced curve
+    :param float angle_tolerance: max difference between the tangent angles of a reduced section, in degrees
+    :return AnimCurveData: reduced curve data. the original curve data is returned if no keyframes are redundant
+    """
+    redundant = get_redundant_key_mask(curve_data, tolerance=tolerance, angle_tolerance=angle_tolerance)
+    if not redundant.any():
+        return curve_data
+    content_hash = None
+    if curve_data.content_hash is not None:
+        reduced_token = f"{curve_data.content_hash}|reduced|{tolerance}|{angle_tolerance}"
+        content_hash = hashlib.sha1(reduced_token.encode("utf-8")).hexdigest()
+    return AnimCurveData(
+        attribute=curve_data.attribute,
+        current_value=curve_data.current_value,
+        weighted_tangents=curve_data.weighted_tangents,
+        columns={column: array[~redundant] for column, array in curve_data.columns.items()},
+        content_hash=content_hash)
+
+
+def is_static_curve(curve_data, tolerance=DEFAULT_REDUCE_TOLERANCE, angle_tolerance=DEFAULT_REDUCE_ANGLE_TOLERANCE):
+    """
+    Check if a curve holds the same value on every keyframe with flat tangents
+    :param AnimCurveData curve_data: curve data
+    :param float tolerance: max difference between the keyframe values
+    :param float angle_tolerance: max tangent angle, in degrees
+    :return bool: curve is static
+    """
+    if len(curve_data) == 0:
+        return False
+    angles = numpy.concatenate((curve_data.columns["in_angle"], curve_data.columns["out_angle"]))
+    return float(numpy.ptp(curve_data.values)) <= tolerance and float(numpy.abs(angles).max()) <= angle_tolerance
+
+
+def _copy_curve_data(curve_data, columns):
+    """
+    Create curve data with new columns and the settings of another curve
+    :param AnimCurveData curve_data: curve data to copy the settings from
+    :param dict columns: column name to numpy array
+    :return AnimCurveData: curve data
+    """
+    return AnimCurveData(
+        attribute=curve_data.attribute,
+        current_value=curve_data.current_value,
+        weighted_tangents=curve_data.weighted_tangents,
+        columns=columns)
+
+
+def _scale_tangent_time(columns, in_scale, out_scale):
+    """
+    Stretch the tangents of every keyframe along the time axis. slopes are divided by the scale so the curve keeps
+    its shape when its keyframe times are scaled by the same amount
+    :param dict columns: columns to edit in place
+    :param numpy.ndarray in_scale: time scale of each in tangent
+    :param numpy.ndarray out_scale: time scale of each out tangent
+    """
+    for side, scale in (("in", in_scale), ("out", out_scale)):
+        angle = numpy.radians(columns[f"{side}_angle"])
+        x = numpy.cos(angle) * scale
+        y = numpy.sin(angle)
+        columns[f"{side}_angle"] = numpy.degrees(numpy.arctan2(y, x))
+        columns[f"{side}_weight"] = columns[f"{side}_weight"] * numpy.hypot(x, y)
+    columns["ix"] = columns["ix"] * in_scale
+    columns["ox"] = columns["ox"] * out_scale
+
+
+def reverse_anim_curve_data(curve_data):
+    """
+    Mirror keyframe times around the middle of the curve. tangents are mirrored, values are kept
+    :param AnimCurveData curve_data: curve data
+    :return AnimCurveData: reversed curve data, columns are kept in ascending time order
+    """
+    columns = {column: array[::-1].copy() for column, array in curve_data.columns.items()}
+    columns["times"] = (curve_data.times[0] + curve_data.times[-1]) - columns["times"]
+    for in_column, out_column in (("in_tangent", "out_tangent"), ("in_weight", "out_weight"), ("ix", "ox")):
+        columns[in_column], columns[out_column] = columns[out_column], columns[in_column]
+    columns["in_angle"], columns["out_angle"] = columns["out_angle"] * -1, columns["in_angle"] * -1
+    columns["iy"], columns["oy"] = columns["oy"] * -1, columns["iy"] * -1
+    return _copy_curve_data(curve_data, columns)
+
+
+def offset_anim_curve_data(curve_data, offset):
+    """
+    Move every keyframe in time
+    :param AnimCurveData curve_data: curve data
+    :param float offset: offset added to every keyframe time
+    :return AnimCurveData: offset curve data
+    """
+    columns = dict(curve_data.columns)
+    columns["times"] = curve_data.times + offset
+    return _copy_curve_data(curve_data, columns)
+
+
+def scale_anim_curve_data(curve_data, scale, pivot=0.0):
+    """
+    Scale keyframe times around a pivot, stretching the tangents with them
+    :param AnimCurveData curve_data: curve data
+    :param float scale: time scale. must be positive, use reverse_anim_curve_data to flip a curve
+    :param float pivot: time that stays in place
+    :return AnimCurveData: scaled curve data
+    """
+    if scale <= 0:
+        raise ValueError("time scale must be positive")
+    columns = {column: array.copy() for column, array in curve_data.columns.items()}
+    columns["times"] = pivot + (curve_data.times - pivot) * scale
+    scales = numpy.full(len(curve_data), float(scale))
+    _scale_tangent_time(columns, scales, scales)
+    return _copy_curve_data(curve_data, columns)
+
+
+def warp_anim_curve_data(curve_data, source_times, destination_times):
+    """
+    Retime keyframes with a piecewise linear time warp. tangents are stretched by the slope of the warp on each side
+    of their keyframe. times outside the warp are moved with the first or last segment
+    :param AnimCurveData curve_data: curve data
+    :param list[float] source_times: ascending times of the warp's control points
+    :param list[float] destination_times: ascending times the control points are moved to
+    :return AnimCurveData: retimed curve data
+    """
+    source_times = numpy.asarray(source_times, dtype=numpy.float64)
+    destination_times = numpy.asarray(destination_times, dtype=numpy.float64)
+    if len(source_times) < 2 or len(source_times) != len(destination_times):
+        raise ValueError("time warp needs at least two matching source and destination times")
+    slopes = numpy.diff(destination_times) / numpy.diff(source_times)
+    if (slopes <= 0).any():
+        raise ValueError("time warp must be ascending")
+
+    times = curve_data.times
+    # slope of the segment on each side of every keyframe, extended past the ends of the warp
+    segment_count = len(slopes)
+    in_segments = numpy.clip(numpy.searchsorted(source_times, times, side="left") - 1, 0, segment_count - 1)
+    out_segments = numpy.clip(numpy.searchsorted(source_times, times, side="right") - 1, 0, segment_count - 1)
+    in_slopes = slopes[in_segments]
+    out_slopes = slopes[out_segments]
+
+    columns = {column: array.copy() for column, array in curve_data.columns.items()}
+    columns["times"] = destination_times[out_segments] + (times - source_times[out_segments]) * out_slopes
+    _scale_tangent_time(columns, in_slopes, out_slopes)
+    return _copy_curve_data(curve_data, columns)
+
+
+def snap_anim_curve_data(curve_data, step=1.0):
+    """
+    Snap keyframe times to a frame step. when several keyframes snap to the same frame only the first one is kept
+    :param AnimCurveData curve_data: curve data
+    :param float step: frame step to snap to
+    :return AnimCurveData: snapped curve data
+    """
+    snapped_times = numpy.round(curve_data.times / step) * step
+    _, first_indices = numpy.unique(snapped_times, return_index=True)
+    columns = {column: array[first_indices] for column, array in curve_data.columns.items()}
+    columns["times"] = snapped_times[first_indices]
+    return _copy_curve_data(curve_data, columns)
+
+
+def transform_anim_curve_data(curve_data, offset=0.0, reverse=False, scale=1.0, pivot=0.0, time_warp=None, snap_step=None):
+    """
+    Apply time transforms to every keyframe at once. transforms are applied in the order reverse, time warp, scale,
+    offset then snap
+    :param AnimCurveData curve_data: curve data
+    :param float offset: offset added to every keyframe time
+    :param bool reverse: option to mirror the curve in time
+    :param float scale: time scale around the pivot
+    :param float pivot: time that stays in place when scaling
+    :param tuple(list[float], list[float]) time_warp: option to retime with (source times, destination times)
+    :param float snap_step: option to snap keyframe times to a frame step
+    :return AnimCurveData: transformed curve data
+    """
+    if len(curve_data) == 0:
+        return curve_data
+    if reverse:
+        curve_data = reverse_anim_curve_data(curve_data)
+    if time_warp:
+        curve_data = warp_anim_curve_data(curve_data, time_warp[0], time_warp[1])
+    if scale != 1.0:
+        curve_data = scale_anim_curve_data(curve_data, scale, pivot=pivot)
+    if offset:
+        curve_data = offset_anim_curve_data(curve_data, offset)
+    if snap_step:
+        curve_data = snap_anim_curve_data(curve_data, step=snap_step)
+    return curve_data
+
+
+def get_anim_curve_summary(anim_curve_fn):
+    """
+    get a cheap summary of a curve's keys. it changes when keys are added or removed or the end keys move, even if
+    the edit wasn't reported by an anim curve edited callback
+    :param OpenMayaAnim.MFnAnimCurve anim_curve_fn: anim curve
+    :return tuple: key count, then the time and value of the first and last keys
+    """
+    key_count = anim_curve_fn.numKeys
+    if not key_count:
+        return (0,)
+    return (key_count, anim_curve_fn.input(0).value, anim_curve_fn.value(0),
+            anim_curve_fn.input(key_count - 1).value, anim_curve_fn.value(key_count - 1))
+
+
+class AnimCurveCache(object):
+    """
+    Cache of captured curves keyed by a content hash of the anim curve node and a change token.
+    The change token is bumped by anim curve edited callbacks, and every token is invalidated on undo, redo and scene
+    changes, so re-capturing an unchanged curve returns the cached capture without querying it again.
+    Encoded clipboard blocks are cached with the same hash so unchanged curves aren't re-serialized either
+    """
+
+    def __init__(self):
+        self.curves = {}  # dict[str, AnimCurveData]: content hash to captured curve
+        self.blocks = {}  # dict[str, bytes]: content hash to encoded clipboard block
+        self._revisions = {}  # dict[str, int]: anim curve uuid to edit count
+        self._epoch = 0
+        self._callback_ids = []
+
+    def install_callbacks(self):
+        """
+        register the callbacks that invalidate cached curves
+        """
+        if self._callback_ids:
+            return
+        self._callback_ids.append(OpenMayaAnim.MAnimMessage.addAnimCurveEditedCallback(self._anim_curves_edited))
+        for event in ("Undo", "Redo"):
+            self._callback_ids.append(OpenMaya.MEventMessage.addEventCallback(event, self._invalidate))
+        for message in (OpenMaya.MSceneMessage.kAfterOpen, OpenMaya.MSceneMessage.kAfterNew):
+            self._callback_ids.append(OpenMaya.MSceneMessage.addCallback(message, self._invalidate))
+
+    def remove_callbacks(self):
+        """
+        remove the invalidation callbacks
+        """
+        for callback_id in self._callback_ids:
+            try:
+                OpenMaya.MMessage.removeCallback(callback_id)
+            except RuntimeError:  # MMessage already deleted
+                pass
+        self._callback_ids = []
+
+    def _anim_curves_edited(self, anim_curves, *args):
+        """
+        bump the change token of edited anim curves
+        :param OpenMaya.MObjectArray anim_curves: edited anim curves
+        """
+        for anim_curve in anim_curves:
+            self.bump_revision(OpenMaya.MFnDependencyNode(anim_curve).uuid().asString())
+
+    def bump_revision(self, uuid):
+        """
+        bump the change token of an anim curve
+        :param str uuid: uuid of the anim curve node
+        """
+        self._revisions[uuid] = self._revisions.get(uuid, 0) + 1
+
+    def get_change_token(self, uuid, anim_curve_fn=None):
+        """
+        get a token that changes every time an anim curve is edited
+        :param str uuid: uuid of the anim curve node
+        :param OpenMayaAnim.MFnAnimCurve anim_curve_fn: option to add the curve's own summary to the token, so edits
+        made without an anim curve edited callback are still noticed
+        :return tuple: change token
+        """
+        if anim_curve_fn is None:
+            return self._revisions.get(uuid, 0), self._epoch
+        return self._revisions.get(uuid, 0), self._epoch, get_anim_curve_summary(anim_curve_fn)
+
+    def _invalidate(self, *args):
+        """
+        invalidate every cached curve
+        """
+        self._epoch += 1
+        self.curves = {}
+        self.blocks = {}
+
+    def get_content_hash(self, attribute_path, frame_range=None):
+        """
+        get the content hash of the anim curve driving an attribute
+        :param str attribute_path: attribute path
+        :param list[float] frame_range: captured frame range
+        :return str: content hash, None if the attribute isn't driven directly by an anim curve
+        """
+        anim_curve_fn = get_anim_curve_fn(maya_utils.get_plug(attribute_path))
+        if anim_curve_fn is None:
+            return None
+        uuid = anim_curve_fn.uuid().asString()
+        change_token = f"{uuid}|{self._revisions.get(uuid, 0)}|{self._epoch}|{frame_range}|{attribute_path}|" \
+                       f"{get_anim_curve_summary(anim_curve_fn)}"
+        return hashlib.sha1(change_token.encode("utf-8")).hexdigest()
+
+    def get_anim_curve_data(self, node, attribute, frame_range=None):
+        """
+        capture a curve, reusing the cached keyframes if the curve hasn't changed. the current value is always read
+        :param str node: owner of the attribute
+        :param str attribute: short name of the attribute
+        :param list[float] frame_range: option to only capture keyframes in the range
+        :return AnimCurveData: curve data
+        """
+        attribute_path = f"{node}.{attribute}"
+        content_hash = self.get_content_hash(attribute_path, frame_range=frame_range)
+        if content_hash is not None and content_hash in self.curves:
+            curve_data = self.curves[content_hash]
+            # NOTE: the current value depends on the time, not the curve, so it isn't part of the cached capture
+            curve_data.current_value = cmds.getAttr(attribute_path)
+            return curve_data
+        curve_data = get_anim_curve_data(node, attribute, frame_range=frame_range)
+        if content_hash is not None:
+            curve_data.content_hash = content_hash
+            self.curves[content_hash] = curve_data
+        return curve_data
+
+    def prune(self, content_hashes):
+        """
+        drop cached curves and blocks that aren't in the given hashes
+        :param set[str] content_hashes: hashes to keep
+        """
+        self.curves = {key: value for key, value in self.curves.items() if key in content_hashes}
+        self.blocks = {key: value for key, value in self.blocks.items() if key in content_hashes}
+
+
+_ANIM_CURVE_CACHE = None
+
+
+def get_anim_curve_cache():
+    """
+    get the shared anim curve cache. callbacks are installed the first time it's requested
+    :return AnimCurveCache: anim curve cache
+    """
+    global _ANIM_CURVE_CACHE
+    if _ANIM_CURVE_CACHE is None:
+        _ANIM_CURVE_CACHE = AnimCurveCache()
+        _ANIM_CURVE_CACHE.install_callbacks()
+    return _ANIM_CURVE_CACHE
+
+
+def mark_anim_curve_edited(anim_curve_fn):
+    """
+    invalidate the cached capture of a curve edited through the api, where anim curve edited callbacks aren't
+    guaranteed to fire
+    :param OpenMayaAnim.MFnAnimCurve anim_curve_fn: edited anim curve
+    """
+    if _ANIM_CURVE_CACHE is None:
+        return
+    _ANIM_CURVE_CACHE.bump_revision(anim_curve_fn.uuid().asString())
+
+
+def get_anim_curve_fn(plug):
+    """
+    get the function set of the animation curve driving a plug. channels behind a pairBlend resolve to the curve of
+    the pairBlend's first input, and channels on anim layers to the curve of the best layer, the curve cmds.keyframe
+    edits
+    :param OpenMaya.MPlug plug: animated plug
+    :return OpenMayaAnim.MFnAnimCurve: anim curve function set, None if the plug isn't driven by an anim curve
+    """
+    source = plug.source()
+    if source.isNull:
+        return None
+    source_node = source.node()
+    if source_node.hasFn(OpenMaya.MFn.kAnimCurve):
+        return OpenMayaAnim.MFnAnimCurve(source_node)
+    if source_node.hasFn(OpenMaya.MFn.kPairBlend):
+        # NOTE: outTranslateX is driven by inTranslateX1 (the keyed input) and inTranslateX2
+        output_name = source.partialName(useLongNames=True)
+        if not output_name.startswith("out"):
+            return None
+        input_name = "in{0}1".format(output_name[3:])
+        try:
+            input_plug = OpenMaya.MFnDependencyNode(source_node).findPlug(input_name, False)
+        except RuntimeError:
+            return None
+        return get_anim_curve_fn(input_plug)
+    if OpenMaya.MFnDependencyNode(source_node).typeName.startswith("animBlendNode"):
+        attribute_path = plug.partialName(includeNodeName=True, useLongNames=True)
+        best_layer = cmds.animLayer([attribute_path], query=True, bestAnimLayer=True)
+        if not best_layer:
+            return None
+        anim_curves = cmds.animLayer(
+            best_layer if isinstance(best_layer, str) else best_layer[0], query=True,
+            findCurveForPlug=attribute_path) or []
+        if not anim_curves:
+            return None
+        return OpenMayaAnim.MFnAnimCurve(OpenMaya.MSelectionList().add(anim_curves[0]).getDependNode(0))
+    return None
+
+
+def get_ui_unit_factor(plug):
+    """
+    get the factor that converts ui unit values of a plug to maya's internal units
+    :param OpenMaya.MPlug plug: plug
+    :return float: conversion factor
+    """
+    attribute = plug.attribute()
+    if not attribute.hasFn(OpenMaya.MFn.kUnitAttribute):
+        return 1.0
+    unit_type = OpenMaya.MFnUnitAttribute(attribute).unitType()
+    if unit_type == OpenMaya.MFnUnitAttribute.kAngle:
+        return OpenMaya.MAngle(1.0, OpenMaya.MAngle.uiUnit()).asRadians()
+    if unit_type == OpenMaya.MFnUnitAttribute.kDistance:
+        return OpenMaya.MDistance(1.0, OpenMaya.MDistance.uiUnit()).asCentimeters()
+    return 1.0
+
+
+def get_key_times(anim_curve_fn):
+    """
+    get the times of every keyframe on a curve in ui time units
+    :param OpenMayaAnim.MFnAnimCurve anim_curve_fn: anim curve function set
+    :return numpy.ndarray: keyframe times
+    """
+    time_unit = OpenMaya.MTime.uiUnit()
+    return numpy.fromiter(
+        (anim_curve_fn.input(index).asUnits(time_unit) for index in range(anim_curve_fn.numKeys)),
+        dtype=numpy.float64,
+        count=anim_curve_fn.numKeys)
+
+
+def set_anim_curve_data(attribute_path, curve_data, replace=False):
+    """
+    write curve data onto an attribute in one batch through the api
+    Keys already on the curve at the pasted times are overwritten. The edit is returned so the caller can record it
+    for undo with undo_utils.commit()
+    :param str attribute_path: attribute to write the keyframes to
+    :param AnimCurveData curve_data: keyframes to write. must have at least one keyframe
+    :param bool replace: option to remove every existing keyframe in the pasted frame range
+    :return OpenMayaAnim.MAnimCurveChange: recorded edit
+    """
+    plug = maya_utils.get_plug(attribute_path)
+    anim_curve_fn = get_anim_curve_fn(plug)
+    if anim_curve_fn is None:
+        # NOTE: the curve is created with a regular keyframe so its creation is undone with the surrounding undo chunk
+        cmds.setKeyframe(attribute_path, time=float(curve_data.times[0]), value=float(curve_data.values[0]))
+        anim_curve_fn = get_anim_curve_fn(plug)
+
+    mark_anim_curve_edited(anim_curve_fn)
+    change = OpenMayaAnim.MAnimCurveChange()
+    columns = curve_data.columns
+    times = curve_data.times
+    time_unit = OpenMaya.MTime.uiUnit()
+
+    # remove keys that would be overwritten, or every key in the pasted range when replacing
+    existing_times = get_key_times(anim_curve_fn)
+    if replace:
+        remove_mask = (existing_times >= times[0]) & (existing_times <= times[-1])
+    else:
+        # NOTE: times are rounded so float noise from unit conversion doesn't keep duplicate keys around
+        remove_mask = numpy.isin(numpy.round(existing_times, 6), numpy.round(times, 6))
+    for index in numpy.flatnonzero(remove_mask)[::-1]:
+        anim_curve_fn.remove(int(index), change)
+    existing_times = existing_times[~remove_mask]
+
+    if anim_curve_fn.isWeighted != curve_data.weighted_tangents:
+        anim_curve_fn.setIsWeighted(curve_data.weighted_tangents, change)
+
+    time_array = OpenMaya.MTimeArray([OpenMaya.MTime(float(time), time_unit) for time in times])
+    value_array = OpenMaya.MDoubleArray((curve_data.values * get_ui_unit_factor(plug)).tolist())
+    anim_curve_fn.addKeys(
+        time_array,
+        value_array,
+        OpenMayaAnim.MFnAnimCurve.kTangentGlobal,
+        OpenMayaAnim.MFnAnimCurve.kTangentGlobal,
+        True,
+        change)
+
+    # resolve the index of every added key from the merged key times instead of querying the curve
+    key_indices = numpy.searchsorted(numpy.union1d(existing_times, times), times)
+
+    angle_unit = OpenMaya.MAngle.uiUnit()
+    for key_index, curve_index in enumerate(key_indices.tolist()):
+        # tangents are unlocked so in and out tangents can be set separately, then relocked if needed
+        anim_curve_fn.setTangentsLocked(curve_index, False, change)
+        anim_curve_fn.setAngle(curve_index, OpenMaya.MAngle(float(columns["in_angle"][key_index]), angle_unit), True, change)
+        anim_curve_fn.setAngle(curve_index, OpenMaya.MAngle(float(columns["out_angle"][key_index]), angle_unit), False, change)
+        if curve_data.weighted_tangents:
+            anim_curve_fn.setWeightsLocked(curve_index, False, change)
+            anim_curve_fn.setWeight(curve_index, float(columns["in_weight"][key_index]), True, change)
+            anim_curve_fn.setWeight(curve_index, float(columns["out_weight"][key_index]), False, change)
+            anim_curve_fn.setWeightsLocked(curve_index, bool(columns["weight_lock"][key_index]), change)
+        # NOTE: tangent types are set last so non fixed tangents are recalculated by maya
+        anim_curve_fn.setInTangentType(curve_index, API_TANGENT_TYPES[columns["in_tangent"][key_index]], change)
+        anim_curve_fn.setOutTangentType(curve_index, API_TANGENT_TYPES[columns["out_tangent"][key_index]], change)
+        anim_curve_fn.setTangentsLocked(curve_index, bool(columns["lock"][key_index]), change)
+    return change
+
+
+def set_keyframe_values(attribute_path, times, values):
+    """
+    key an attribute at many times in one batch through the api. keys already at the times keep their tangents and
+    only get the new value, other keys are added with the global tangent types
+    :param str attribute_path: attribute to key
+    :param numpy.ndarray times: keyframe times in ui time units
+    :param numpy.ndarray values: keyframe values in internal units
+    :return OpenMayaAnim.MAnimCurveChange: recorded edit
+    """
+    plug = maya_utils.get_plug(attribute_path)
+    anim_curve_fn = get_anim_curve_fn(plug)
+    if anim_curve_fn is None:
+        # NOTE: the curve is created with a regular keyframe so its creation is undone with the surrounding undo chunk
+        cmds.setKeyframe(attribute_path, time=float(times[0]))
+        anim_curve_fn = get_anim_curve_fn(plug)
+
+    mark_anim_curve_edited(anim_curve_fn)
+    change = OpenMayaAnim.MAnimCurveChange()
+    times = numpy.asarray(times, dtype=numpy.float64)
+    values = numpy.asarray(values, dtype=numpy.float64)
+
+    # NOTE: times are rounded so float noise from unit conversion doesn't add duplicate keys
+    existing_times = numpy.round(get_key_times(anim_curve_fn), 6)
+    rounded_times = numpy.round(times, 6)
+    existing_mask = numpy.isin(rounded_times, existing_times)
+    for key_index, value in zip(numpy.searchsorted(existing_times, rounded_times[existing_mask]).tolist(),
+                                values[existing_mask].tolist()):
+        anim_curve_fn.setValue(key_index, value, change)
+
+    if not existing_mask.all():
+        time_unit = OpenMaya.MTime.uiUnit()
+        anim_curve_fn.addKeys(
+            OpenMaya.MTimeArray([OpenMaya.MTime(float(time), time_unit) for time in times[~existing_mask]]),
+            OpenMaya.MDoubleArray(values[~existing_mask].tolist()),
+            OpenMayaAnim.MFnAnimCurve.kTangentGlobal,
+            OpenMayaAnim.MFnAnimCurve.kTangentGlobal,
+            True,
+            change)
+    return change
+
+
+def undo_anim_curve_changes(anim_curve_changes):
+    """
+    undo recorded anim curve edits in reverse order
+    :param list[OpenMayaAnim.MAnimCurveChange] anim_curve_changes: recorded edits
+    """
+    for anim_curve_change in reversed(anim_curve_changes):
+        anim_curve_change.undoIt()
+
+
+def redo_anim_curve_changes(anim_curve_changes):
+    """
+    redo recorded anim curve edits
+    :param list[OpenMayaAnim.MAnimCurveChange] anim_curve_changes: recorded edits
+    """
+    for anim_curve_change in anim_curve_changes:
+        anim_curve_change.redoIt()
+
+
+def commit_anim_curve_changes(anim_curve_changes):
+    """
+    record anim curve edits made through the api as a single undoable command
+    :param list[OpenMayaAnim.MAnimCurveChange] anim_curve_changes: recorded edits
+    :return bool: an edit was recorded
+    """
+    if not anim_curve_changes:
+        return False
+    undo_utils.commit(
+        partial(undo_anim_curve_changes, anim_curve_changes),
+        partial(redo_anim_curve_changes, anim_curve_changes))
+    return True
+
+
+def sample_anim_curves(anim_curve_fns, times):
+    """
+    Evaluate curves at many times without evaluating the dependency graph
+    :param list[OpenMayaAnim.MFnAnimCurve] anim_curve_fns: anim curves
+    :param numpy.ndarray times: ascending sample times in ui time units
+    :return numpy.ndarray: (curve count, sample count) values in internal units
+    """
+    time_unit = OpenMaya.MTime.uiUnit()
+    sample_times = [OpenMaya.MTime(float(time), time_unit) for time in times]
+    samples = numpy.empty((len(anim_curve_fns), len(sample_times)))
+    for index, anim_curve_fn in enumerate(anim_curve_fns):
+        samples[index] = [anim_curve_fn.evaluate(sample_time) for sample_time in sample_times]
+    return samples
+
+
+class AnimCurveSampler(object):
+    """
+    Anim curves sampled on a regular grid between two times. Samples are evaluated a block of frames at a time, the
+    first time a time inside the block is requested, so a drag only evaluates the part of the curves it reaches
+    """
+
+    def __init__(self, anim_curve_fns, start_time, end_time, samples_per_frame=4, block_frames=12,
+                 prepare_function=None):
+        """
+        :param list[OpenMayaAnim.MFnAnimCurve] anim_curve_fns: anim curves
+        :param float start_time: first sampled time in ui time units
+        :param float end_time: last sampled time in ui time units. times outside the range hold the end values
+        :param int samples_per_frame: resolution of the samples. values between samples are interpolated
+        :param int block_frames: frames evaluated together when a time outside the sampled blocks is requested
+        :param prepare_function: function taking no arguments run before a block is evaluated, to put the curves back
+        in the state they are sampled in
+        """
+        self.anim_curve_fns = anim_curve_fns
+        self.start_time = start_time
+        self.samples_per_frame = samples_per_frame
+        self.block_size = block_frames * samples_per_frame
+        self.last_index = max(int(numpy.ceil((end_time - start_time) * samples_per_frame)), 1)
+        self.prepare_function = prepare_function
+        self.blocks = {}  # dict[int, numpy.ndarray]: block index to (curve count, block size) samples
+
+    def _get_sample(self, sample_index):
+        """
+        get the samples of every curve at a sample index, evaluating its block if needed
+        :param int sample_index: sample index
+        :return numpy.ndarray: sample of each curve in internal units
+        """
+        block_index, block_sample_index = divmod(sample_index, self.block_size)
+        block = self.blocks.get(block_index)
+        if block is None:
+            if self.prepare_function is not None:
+                self.prepare_function()
+            first_index = block_index * self.block_size
+            times = self.start_time + numpy.arange(
+                first_index, min(first_index + self.block_size, self.last_index + 1)) / self.samples_per_frame
+            block = sample_anim_curves(self.anim_curve_fns, times)
+            self.blocks[block_index] = block
+        return block[:, block_sample_index]
+
+    def get_values(self, time):
+        """
+        get the value of every curve at a time, interpolated between the two samples around it
+        :param float time: time in ui time units
+        :return numpy.ndarray: value of each curve in internal units
+        """
+        position = min(max((time - self.start_time) * self.samples_per_frame, 0.0), float(self.last_index))
+        index = min(int(position), self.last_index - 1)
+        return self._get_sample(index) + (self._get_sample(index + 1) - self._get_sample(index)) * (position - index)
+
+
+def set_key_values(anim_curve_fns, key_indices, values):
+    """
+    set keyframe values in one pass
+    :param list[OpenMayaAnim.MFnAnimCurve] anim_curve_fns: anim curves
+    :param list[int] key_indices: key index on each curve
+    :param numpy.ndarray values: keyframe values in internal units
+    """
+    for anim_curve_fn, key_index, value in zip(anim_curve_fns, key_indices, values.tolist()):
+        anim_curve_fn.setValue(key_index, value)
+
+
+def commit_key_values(anim_curve_fns, key_indices, original_values, values):
+    """
+    record keyframe values that were set through the api as a single undoable command. only the keyframes whose
+    value changed are held by the command
+    :param list[OpenMayaAnim.MFnAnimCurve] anim_curve_fns: anim curve of each keyframe
+    :param list[int] key_indices: key index of each keyframe
+    :param numpy.ndarray original_values: keyframe values before the edit in internal units
+    :param numpy.ndarray values: keyframe values after the edit in internal units
+    :return bool: an edit was recorded
+    """
+    if not len(anim_curve_fns):
+        return False
+    changed_indices = numpy.flatnonzero(values != original_values).tolist()
+    if not changed_indices:
+        return False
+    changed_anim_curve_fns = [anim_curve_fns[index] for index in changed_indices]
+    changed_key_indices = [key_indices[index] for index in changed_indices]
+    for anim_curve_fn in changed_anim_curve_fns:
+        mark_anim_curve_edited(anim_curve_fn)
+    undo_utils.commit(
+        partial(set_key_values, changed_anim_curve_fns, changed_key_indices, original_values[changed_indices]),
+        partial(set_key_values, changed_anim_curve_fns, changed_key_indices, values[changed_indices]))
+    return True
+
+
+class KeyframeHandles(object):
+    """
+    Anim curve function sets and key indices of the keyframes at a time, resolved once so the values of every
+    keyframe can be edited in place through the api. Values are passed in the attributes' ui units
+    """
+
+    def __init__(self, attribute_paths, time=None):
+        """
+        :param list[str] attribute_paths: attribute paths. attributes without a keyframe at the time are skipped
+        :param float time: time of the keyframes. the current time is used if None
+        """
+        if time is None:
+            time = cmds.currentTime(query=True)
+        key_time = OpenMaya.MTime(time, OpenMaya.MTime.uiUnit())
+        self.attribute_paths = []
+        self.anim_curve_fns = []
+        self.key_indices = []
+        unit_factors = []
+        for attribute_path in attribute_paths:
+            plug = maya_utils.get_plug(attribute_path)
+            anim_curve_fn = get_anim_curve_fn(plug)
+            if anim_curve_fn is None:
+                continue
+            key_index = anim_curve_fn.find(key_time)
+            if key_index is None:
+                continue
+            self.attribute_paths.append(attribute_path)
+            self.anim_curve_fns.append(anim_curve_fn)
+            self.key_indices.append(key_index)
+            unit_factors.append(get_ui_unit_factor(plug))
+        self.unit_factors = numpy.asarray(unit_factors, dtype=numpy.float64)
+        # NOTE: values are kept in internal units so restoring them doesn't go through a unit conversion
+        self.original_values = self._get_internal_values()
+        self.values = self.original_values.copy()
+
+    def __len__(self):
+        return len(self.anim_curve_fns)
+
+    def _get_internal_values(self):
+        """
+        get the keyframe values in internal units
+        :return numpy.ndarray: keyframe values
+        """
+        return numpy.asarray(
+            [anim_curve_fn.value(key_index) for anim_curve_fn, key_index in zip(self.anim_curve_fns, self.key_indices)],
+            dtype=numpy.float64)
+
+    def set_internal_values(self, values):
+        """
+        set the keyframe values in internal units
+        :param numpy.ndarray values: keyframe values
+        """
+        set_key_values(self.anim_curve_fns, self.key_indices, values)
+        self.values = values
+
+    def get_values(self):
+        """
+        get the keyframe values
+        :return numpy.ndarray: keyframe values in ui units
+        """
+        return self.values / self.unit_factors
+
+    def set_values(self, values):
+        """
+        set every keyframe value in one pass
+        :param numpy.ndarray values: keyframe values in ui units, one per handle
+        """
+        self.set_internal_values(numpy.asarray(values, dtype=numpy.float64) * self.unit_factors)
+
+    def commit(self):
+        """
+        record the edit since the handles were resolved as a single undoable command. only the keyframes whose value
+        changed are held by the command, with their original and final values
+        :return bool: an edit was recorded
+        """
+        return commit_key_values(self.anim_curve_fns, self.key_indices, self.original_values, self.values)
+
+
+def get_selected_key_indices():
+    """
+    get the keyframes selected in the graph editor
+    :return dict: anim curve name to selected key indices
+    """
+    anim_curves = cmds.keyframe(query=True, selected=True, name=True) or []
+    return {
+        anim_curve: cmds.keyframe(anim_curve, query=True, selected=True, indexValue=True) or []
+        for anim_curve in anim_curves}
+
+
+class SelectedKeyframes(object):
+    """
+    Every selected keyframe with the values of its previous and next keyframe, read once as flat arrays so all selected
+    keys can be tweened across every curve with one numpy expression. Values are kept in internal units
+    """
+
+    def __init__(self, selected_key_indices=None):
+        """
+        :param dict selected_key_indices: anim curve name to key indices. the graph editor selection is used if None
+        """
+        if selected_key_indices is None:
+            selected_key_indices = get_selected_key_indices()
+        self.anim_curve_fns = []  # anim curve of each keyframe
+        self.key_indices = []
+        self.curve_count = 0
+        self.skipped_count = 0  # selected keys without a previous or next keyframe
+        original_values = []
+        previous_values = []
+        next_values = []
+        for anim_curve, key_indices in selected_key_indices.items():
+            selection_list = OpenMaya.MSelectionList()
+            selection_list.add(anim_curve)
+            anim_curve_fn = OpenMayaAnim.MFnAnimCurve(selection_list.getDependNode(0))
+            key_count = anim_curve_fn.numKeys
+            key_indices = numpy.unique(numpy.asarray(key_indices, dtype=numpy.int64))
+            # NOTE: the first and last key have no neighbour to tween against
+            valid_mask = (key_indices > 0) & (key_indices < key_count - 1)
+            self.skipped_count += int(len(key_indices) - valid_mask.sum())
+            key_indices = key_indices[valid_mask]
+            if not len(key_indices):
+                continue
+
+            curve_values = numpy.fromiter(
+                (anim_curve_fn.value(index) for index in range(key_count)), dtype=numpy.float64, count=key_count)
+            self.curve_count += 1
+            self.anim_curve_fns.extend([anim_curve_fn] * len(key_indices))
+            self.key_indices.extend(key_indices.tolist())
+            original_values.append(curve_values[key_indices])
+            previous_values.append(curve_values[key_indices - 1])
+            next_values.append(curve_values[key_indices + 1])
+
+        def concatenate(arrays):
+            return numpy.concatenate(arrays) if arrays else numpy.empty(0, dtype=numpy.float64)
+
+        self.original_values = concatenate(original_values)
+        self.previous_values = concatenate(previous_values)
+        self.next_values = concatenate(next_values)
+        self.values = self.original_values.copy()
+
+    def __len__(self):
+        return len(self.anim_curve_fns)
+
+    def set_values(self, values):
+        """
+        set every selected keyframe value in one pass
+        :param numpy.ndarray values: keyframe values in internal units, one per selected keyframe
+        """
+        set_key_values(self.anim_curve_fns, self.key_indices, values)
+        self.values = values
+
+    def get_tween_values(self, tween_value):
+        """
+        tween every selected keyframe between the original values of its previous and next keyframe
+        :param float tween_value: 0.0 is the previous keyframe value, 1.0 the next. values outside overshoot
+        :return numpy.ndarray: tweened keyframe values in internal units
+        """
+        return self.previous_values + (self.next_values - self.previous_values) * tween_value
+
+    def commit(self):
+        """
+        record the edit since the keyframes were read as a single undoable command
+        :return bool: an edit was recorded
+        """
+        return commit_key_values(self.anim_curve_fns, self.key_indices, self.original_values, self.values)
@@ -0,0 +1,231 @@
+"""
+Shared snapshot of the selection's animation at the current time
+Draggers read the previous and next keyframes of every selected channel from the snapshot instead of querying them on
+press. The snapshot is rebuilt when the time or selection changes, and channels are re-read from their anim curves
+when the curves are edited, so repeated presses on the same selection don't query the scene again
+"""
+from maya import cmds
+import maya.api.OpenMaya as OpenMaya
+
+from as_maya_tools.utilities import anim_curve_utils, attribute_utils
+
+
+# NOTE: keyframes this close to the current time are treated as being on the current time
+TIME_TOLERANCE = 1e-6
+
+
+class ChannelSnapshot(object):
+    """
+    Previous and next keyframe of a single channel around a time. Values are in the attribute's ui units
+    """
+
+    def __init__(self, attribute_path, plug):
+        """
+        :param str attribute_path: attribute path
+        :param OpenMaya.MPlug plug: attribute plug
+        """
+        self.attribute_path = attribute_path
+        self.plug = plug
+        self.unit_factor = anim_curve_utils.get_ui_unit_factor(plug)
+        self.anim_curve_fn = None
+        self.anim_curve_handle = None
+        self.change_token = None
+        self.previous_time = None
+        self.previous_value = None
+        self.next_time = None
+        self.next_value = None
+        self._default_value = None
+
+    @property
+    def has_keyframes(self):
+        """
+        channel has a keyframe before and after the snapshot time
+        """
+        return self.previous_time is not None and self.next_time is not None
+
+    @property
+    def default_value(self):
+        if self._default_value is None:
+            self._default_value = attribute_utils.Attribute(self.attribute_path).get_default_value()
+        return self._default_value
+
+    @property
+    def value(self):
+        """
+        current value of the channel in ui units
+        """
+        return self.plug.asDouble() / self.unit_factor
+
+    def is_anim_curve_current(self):
+        """
+        the cached anim curve still exists and still drives the plug. curves can be deleted or replaced without the
+        snapshot being invalidated, by cutKey removing every key or a new curve being connected
+        :return bool: cached anim curve can be used. curves resolved through anim layers or a pairBlend are always
+        resolved again since the best layer can change
+        """
+        if self.anim_curve_handle is None or not self.anim_curve_handle.isValid() or \
+                not self.anim_curve_handle.isAlive():
+            return False
+        source = self.plug.source()
+        return not source.isNull and source.node() == self.anim_curve_handle.object()
+
+    def update(self, time, anim_curve_cache, force=False):
+        """
+        re-read the previous and next keyframes if the anim curve changed since they were read
+        :param float time: snapshot time
+        :param AnimCurveCache anim_curve_cache: cache holding the anim curve change tokens
+        :param bool force: option to re-read even if the anim curve didn't change
+        """
+        if not force and self.anim_curve_fn is not None and self.is_anim_curve_current():
+            change_token = anim_curve_cache.get_change_token(
+                self.anim_curve_fn.uuid().asString(), anim_curve_fn=self.anim_curve_fn)
+            if change_token == self.change_token:
+                return
+
+        self.previous_time = self.previous_value = self.next_time = self.next_value = None
+        self.anim_curve_fn = anim_curve_utils.get_anim_curve_fn(self.plug)
+        if self.anim_curve_fn is None:
+            self.anim_curve_handle = None
+            self.change_token = None
+            return
+        self.anim_curve_handle = OpenMaya.MObjectHandle(self.anim_curve_fn.object())
+        self.change_token = anim_curve_cache.get_change_token(
+            self.anim_curve_fn.uuid().asString(), anim_curve_fn=self.anim_curve_fn)
+
+        key_count = self.anim_curve_fn.numKeys
+        if key_count == 0:
+            return
+        # find the neighbouring keyframes from the closest one so dense curves aren't read in full
+        time_unit = OpenMaya.MTime.uiUnit()
+        closest_index = self.anim_curve_fn.findClosest(OpenMaya.MTime(time, time_unit))
+        closest_time = self.anim_curve_fn.input(closest_index).asUnits(time_unit)
+        previous_index = closest_index if closest_time < time - TIME_TOLERANCE else closest_index - 1
+        next_index = closest_index if closest_time > time + TIME_TOLERANCE else closest_index + 1
+        if previous_index >= 0:
+            self.previous_time = self.anim_curve_fn.input(previous_index).asUnits(time_unit)
+            self.previous_value = self.anim_curve_fn.value(previous_index) / self.unit_factor
+        if next_index < key_count:
+            self.next_time = self.anim_curve_fn.input(next_index).asUnits(time_unit)
+            self.next_value = self.anim_curve_fn.value(next_index) / self.unit_factor
+
+
+class SelectionAnimationSnapshot(object):
+    """
+    Channels of the selected nodes with their previous and next keyframes at the current time
+    """
+
+    def __init__(self):
+        self.nodes = []
+        self.time = None
+        self.channels = {}  # dict[str, list[ChannelSnapshot]]: node to its keyable channels
+        self._valid = False
+        self._callback_ids = []
+
+    def install_callbacks(self):
+        """
+        register the callbacks that invalidate the snapshot. anim curve edits are tracked by the anim curve cache
+        """
+        if self._callback_ids:
+            return
+        for event in ("timeChanged", "SelectionChanged", "Undo", "Redo"):
+            self._callback_ids.append(OpenMaya.MEventMessage.addEventCallback(event, self._invalidate))
+        for message in (OpenMaya.MSceneMessage.kAfterOpen, OpenMaya.MSceneMessage.kAfterNew):
+            self._callback_ids.append(OpenMaya.MSceneMessage.addCallback(message, self._invalidate))
+
+    def remove_callbacks(self):
+        """
+        remove the invalidation callbacks
+        """
+        for callback_id in self._callback_ids:
+            try:
+                OpenMaya.MMessage.removeCallback(callback_id)
+            except RuntimeError:  # MMessage already deleted
+                pass
+        self._callback_ids = []
+
+    def _invalidate(self, *args):
+        """
+        rebuild the snapshot the next time it's requested
+        """
+        self._valid = False
+
+    def update(self, nodes=None):
+        """
+        bring the snapshot up to date with the selection and current time
+        :param list[str] nodes: nodes to snapshot. the selection is used if None
+        :return SelectionAnimationSnapshot: this snapshot
+        """
+        if nodes is None:
+            nodes = cmds.ls(selection=True) or []
+        time = cmds.currentTime(query=True)
+        anim_curve_cache = anim_curve_utils.get_anim_curve_cache()
+
+        rebuild = not self._valid or nodes != self.nodes or time != self.time
+        if rebuild:
+            self._build(nodes)
+        self.time = time
+        for node_channels in self.channels.values():
+            for channel in node_channels:
+                channel.update(time, anim_curve_cache, force=rebuild)
+        self._valid = True
+        return self
+
+    def _build(self, nodes):
+        """
+        resolve the keyable channels of the nodes
+        :param list[str] nodes: nodes to snapshot
+        """
+        self.nodes = list(nodes)
+        self.channels = {}
+        for node in self.nodes:
+            attributes = cmds.listAttr(node, keyable=True, unlocked=True, shortNames=True)
+            # skipping node if no animatable attributes are available
+            if not attributes:
+                continue
+            dependency_node = OpenMaya.MFnDependencyNode(OpenMaya.MSelectionList().add(node).getDependNode(0))
+            node_channels = []
+            for attribute in attributes:
+                try:
+                    plug = dependency_node.findPlug(attribute, False)
+                except RuntimeError:  # compound children listed with their parent's name
+                    continue
+                node_channels.append(ChannelSnapshot(f"{node}.{attribute}", plug))
+            self.channels[node] = node_channels
+
+    def get_channels(self, keyed=False):
+        """
+        get the channels of every node
+        :param bool keyed: option to only get channels with a keyframe before and after the current time
+        :return list[ChannelSnapshot]: channels
+        """
+        channels = [channel for node_channels in self.channels.values() for channel in node_channels]
+        if keyed:
+            channels = [channel for channel in channels if channel.has_keyframes]
+        return channels
+
+    def get_keyframe_range(self, node):
+        """
+        get the closest previous and next keyframe times across a node's channels
+        :param str node: node name
+        :return tuple(float, float): previous and next keyframe times, None where there is no keyframe
+        """
+        previous_times = [c.previous_time for c in self.channels.get(node, []) if c.previous_time is not None]
+        next_times = [c.next_time for c in self.channels.get(node, []) if c.next_time is not None]
+        return max(previous_times) if previous_times else None, min(next_times) if next_times else None
+
+
+_SELECTION_ANIMATION_SNAPSHOT = None
+
+
+def get_selection_animation_snapshot(nodes=None):
+    """
+    get the shared selection animation snapshot, up to date with the selection and current time. callbacks are
+    installed the first time it's requested
+    :param list[str] nodes: nodes to snapshot. the selection is used if None
+    :return SelectionAnimationSnapshot: snapshot
+    """
+    global _SELECTION_ANIMATION_SNAPSHOT
+    if _SELECTION_ANIMATION_SNAPSHOT is None:
+        _SELECTION_ANIMATION_SNAPSHOT = SelectionAnimationSnapshot()
+        _SELECTION_ANIMATION_SNAPSHOT.install_callbacks()
+    return _SELECTION_ANIMATION_SNAPSHOT.update(nodes=nodes)
@@ -0,0 +1,252 @@
+"""
+Local clipboard server for transferring copied keyframes between maya sessions without touching the disk
+The server only uses the standard library so it can run as a plain python process:
+    python as_maya_tools/utilities/clipboard_server.py --port 50727
+Clipboards are kept in memory as encoded clipboard bytes (see clipboard_utils). the most recent ones are kept.
+Messages in both directions are a 4 byte big endian header length, a utf-8 json header, then header["size"] bytes of
+payload. Requests use header["command"]: ping, put, get or list. Responses use header["status"]: ok or error
+"""
+import argparse
+import collections
+import json
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+
+CLIPBOARD_SERVER_HOST = "127.0.0.1"
+
+CLIPBOARD_SERVER_PORT = 50727
+
+DEFAULT_CLIPBOARD_COUNT = 5
+
+# NOTE: kept short so copy and paste fall back to the clipboard files quickly when the server isn't running
+CONNECT_TIMEOUT = 0.25
+
+TRANSFER_TIMEOUT = 30.0
+
+_HEADER_LENGTH = struct.Struct(">I")
+
+
+def _receive_exactly(connection, size):
+    """
+    receive an exact number of bytes from a socket
+    :param socket.socket connection: connected socket
+    :param int size: number of bytes to receive
+    :return bytes: received bytes
+    """
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        chunk_size = connection.recv_into(view[received:], size - received)
+        if chunk_size == 0:
+            raise ConnectionError("connection closed before the message was complete")
+        received += chunk_size
+    return bytes(buffer)
+
+
+def send_message(connection, header, payload=b""):
+    """
+    send a header and payload
+    :param socket.socket connection: connected socket
+    :param dict header: json serializable header. the payload size is added to it
+    :param bytes payload: payload bytes
+    """
+    header = dict(header, size=len(payload))
+    header_bytes = json.dumps(header).encode("utf-8")
+    connection.sendall(_HEADER_LENGTH.pack(len(header_bytes)) + header_bytes)
+    if payload:
+        connection.sendall(payload)
+
+
+def receive_message(connection):
+    """
+    receive a header and payload
+    :param socket.socket connection: connected socket
+    :return tuple(dict, bytes): header and payload
+    """
+    header_length = _HEADER_LENGTH.unpack(_receive_exactly(connection, _HEADER_LENGTH.size))[0]
+    header = json.loads(_receive_exactly(connection, header_length).decode("utf-8"))
+    payload = _receive_exactly(connection, header.get("size", 0))
+    return header, payload
+
+
+class ClipboardRequestHandler(socketserver.BaseRequestHandler):
+    """
+    Handles a single request from a client
+    """
+
+    def handle(self):
+        try:
+            header, payload = receive_message(self.request)
+        except (ConnectionError, ValueError):
+            return
+        command = header.get("command")
+        if command == "ping":
+            send_message(self.request, {"status": "ok"})
+        elif command == "put":
+            entry = self.server.put_clipboard(payload, name=header.get("name"), meta=header.get("meta"))
+            send_message(self.request, {"status": "ok", "clipboard": entry})
+        elif command == "get":
+            entry, clipboard_bytes = self.server.get_clipboard(header.get("id"))
+            if entry is None:
+                send_message(self.request, {"status": "error", "message": "clipboard not found"})
+                return
+            send_message(self.request, {"status": "ok", "clipboard": entry}, clipboard_bytes)
+        elif command == "list":
+            send_message(self.request, {"status": "ok", "clipboards": self.server.list_clipboards()})
+        else:
+            send_message(self.request, {"status": "error", "message": f"unknown command {command}"})
+
+
+class ClipboardServer(socketserver.ThreadingTCPServer):
+    """
+    In memory clipboard server. Only the most recent clipboard_count clipboards are kept
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, host=CLIPBOARD_SERVER_HOST, port=CLIPBOARD_SERVER_PORT, clipboard_count=DEFAULT_CLIPBOARD_COUNT):
+        """
+        :param str host: host to bind to. keep this on localhost, the server has no authentication
+        :param int port: port to listen on
+        :param int clipboard_count: number of clipboards kept in memory
+        """
+        super(ClipboardServer, self).__init__((host, port), ClipboardRequestHandler)
+        self.clipboard_count = clipboard_count
+        self._clipboards = collections.OrderedDict()
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def put_clipboard(self, clipboard_bytes, name=None, meta=None):
+        """
+        store a clipboard
+        :param bytes clipboard_bytes: encoded clipboard
+        :param str name: clipboard name
+        :param dict meta: extra json serializable information about the clipboard
+        :return dict: clipboard entry
+        """
+        with self._lock:
+            entry = {
+                "id": self._next_id,
+                "name": name,
+                "size": len(clipboard_bytes),
+                "meta": meta or {},
+                "created": time.time(),
+            }
+            self._next_id += 1
+            self._clipboards[entry["id"]] = (entry, clipboard_bytes)
+            while len(self._clipboards) > self.clipboard_count:
+                self._clipboards.popitem(last=False)
+        return entry
+
+    def get_clipboard(self, clipboard_id=None):
+        """
+        get a clipboard
+        :param int clipboard_id: id of the clipboard. the most recent clipboard is returned if None
+        :return tuple(dict, bytes): clipboard entry and encoded clipboard, (None, None) if not found
+        """
+        with self._lock:
+            if not self._clipboards:
+                return None, None
+            if clipboard_id is None:
+                clipboard_id = next(reversed(self._clipboards))
+            return self._clipboards.get(clipboard_id, (None, None))
+
+    def list_clipboards(self):
+        """
+        list the clipboards, most recent first
+        :return list[dict]: clipboard entries
+        """
+        with self._lock:
+            return [entry for entry, _ in reversed(self._clipboards.values())]
+
+
+def _request(header, payload=b"", host=CLIPBOARD_SERVER_HOST, port=CLIPBOARD_SERVER_PORT):
+    """
+    send a request to the clipboard server
+    :param dict header: request header
+    :param bytes payload: request payload
+    :return tuple(dict, bytes): response header and payload, (None, None) if the server isn't reachable
+    """
+    try:
+        connection = socket.create_connection((host, port), timeout=CONNECT_TIMEOUT)
+    except OSError:
+        return None, None
+    try:
+        connection.settimeout(TRANSFER_TIMEOUT)
+        send_message(connection, header, payload)
+        return receive_message(connection)
+    except (OSError, ConnectionError, ValueError):
+        return None, None
+    finally:
+        connection.close()
+
+
+def is_server_running(host=CLIPBOARD_SERVER_HOST, port=CLIPBOARD_SERVER_PORT):
+    """
+    check if the clipboard server is reachable
+    :return bool: server is running
+    """
+    header, _ = _request({"command": "ping"}, host=host, port=port)
+    return header is not None and header.get("status") == "ok"
+
+
+def send_clipboard(clipboard_bytes, name=None, meta=None, host=CLIPBOARD_SERVER_HOST, port=CLIPBOARD_SERVER_PORT):
+    """
+    send a clipboard to the server
+    :param bytes clipboard_bytes: encoded clipboard
+    :param str name: clipboard name
+    :param dict meta: extra json serializable information about the clipboard
+    :return dict: stored clipboard entry, None if the server isn't reachable
+    """
+    header, _ = _request({"command": "put", "name": name, "meta": meta}, clipboard_bytes, host=host, port=port)
+    if header is None or header.get("status") != "ok":
+        return None
+    return header["clipboard"]
+
+
+def receive_clipboard(clipboard_id=None, host=CLIPBOARD_SERVER_HOST, port=CLIPBOARD_SERVER_PORT):
+    """
+    receive a clipboard from the server
+    :param int clipboard_id: id of the clipboard. the most recent clipboard is received if None
+    :return bytes: encoded clipboard, None if the server isn't reachable or has no clipboard
+    """
+    header, payload = _request({"command": "get", "id": clipboard_id}, host=host, port=port)
+    if header is None or header.get("status") != "ok":
+        return None
+    return payload
+
+
+def list_clipboards(host=CLIPBOARD_SERVER_HOST, port=CLIPBOARD_SERVER_PORT):
+    """
+    list the clipboards held by the server
+    :return list[dict]: clipboard entries, most recent first. None if the server isn't reachable
+    """
+    header, _ = _request({"command": "list"}, host=host, port=port)
+    if header is None or header.get("status") != "ok":
+        return None
+    return header["clipboards"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="as_maya_tools keyframe clipboard server")
+    parser.add_argument("--host", default=CLIPBOARD_SERVER_HOST)
+    parser.add_argument("--port", type=int, default=CLIPBOARD_SERVER_PORT)
+    parser.add_argument("--clipboard-count", type=int, default=DEFAULT_CLIPBOARD_COUNT)
+    arguments = parser.parse_args()
+    server = ClipboardServer(host=arguments.host, port=arguments.port, clipboard_count=arguments.clipboard_count)
+    print(f"clipboard server listening on {arguments.host}:{arguments.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
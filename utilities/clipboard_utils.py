@@ -0,0 +1,401 @@
+"""
+Binary clipboard format for copied keyframes
+File layout:
+-magic (4 bytes), format version (uint16), header length (uint32)
+-header: utf-8 json index of nodes, attributes and where each curve block lives in the data section
+-data: packed column arrays for each curve. float columns first, then tangent type and bool columns
+The file is memory mapped when read so only the curves that are pasted get decoded
+ClipboardStore keeps a history of clipboards in numbered slots with a tiny json index so slots can be listed without
+opening their payloads
+"""
+import json
+import mmap
+import os
+import struct
+import time
+
+import numpy
+
+from as_maya_tools.utilities import anim_curve_utils, json_utils
+
+
+CLIPBOARD_MAGIC = b"ASKF"
+
+CLIPBOARD_VERSION = 1
+
+CLIPBOARD_EXTENSION = "keyframes"
+
+_PREAMBLE = struct.Struct("<4sHI")
+
+_ALIGNMENT = 8
+
+CLIPBOARD_INDEX_FILE_NAME = "clipboard_index"
+
+DEFAULT_SLOT_COUNT = 10
+
+DEFAULT_BYTE_BUDGET = 512 * 1024 * 1024
+
+
+def get_clipboard_file_path(file_path, file_name):
+    """
+    get the full path of a clipboard file
+    :param str file_path: directory of the clipboard file
+    :param str file_name: name of the clipboard file without extension
+    :return str: full path of the clipboard file
+    """
+    return "{0}/{1}.{2}".format(file_path, file_name, CLIPBOARD_EXTENSION)
+
+
+def _get_padding(size):
+    """
+    get the number of bytes needed to align size
+    :param int size: size in bytes
+    :return int: padding in bytes
+    """
+    return (_ALIGNMENT - size % _ALIGNMENT) % _ALIGNMENT
+
+
+def encode_curve_block(curve_data):
+    """
+    pack the columns of a curve into a single aligned block
+    :param AnimCurveData curve_data: curve to pack
+    :return bytes: packed curve block
+    """
+    chunks = []
+    for column in anim_curve_utils.FLOAT_COLUMNS:
+        chunks.append(numpy.ascontiguousarray(curve_data.columns[column], dtype="<f8").tobytes())
+    for column in anim_curve_utils.TANGENT_COLUMNS + anim_curve_utils.BOOL_COLUMNS:
+        chunks.append(numpy.ascontiguousarray(curve_data.columns[column], dtype=numpy.uint8).tobytes())
+    block = b"".join(chunks)
+    return block + b"\0" * _get_padding(len(block))
+
+
+def decode_curve_block(buffer, offset, key_count):
+    """
+    unpack the columns of a curve block
+    :param buffer: object supporting the buffer protocol holding the data section
+    :param int offset: byte offset of the block in the buffer
+    :param int key_count: number of keyframes in the block
+    :return dict: column name to numpy array
+    """
+    columns = {}
+    for column in anim_curve_utils.FLOAT_COLUMNS:
+        # NOTE: arrays are copied so the memory map can be closed once decoding is done
+        columns[column] = numpy.frombuffer(buffer, dtype="<f8", count=key_count, offset=offset).astype(numpy.float64)
+        offset += key_count * 8
+    for column in anim_curve_utils.TANGENT_COLUMNS:
+        columns[column] = numpy.frombuffer(buffer, dtype=numpy.uint8, count=key_count, offset=offset).copy()
+        offset += key_count
+    for column in anim_curve_utils.BOOL_COLUMNS:
+        columns[column] = numpy.frombuffer(buffer, dtype=numpy.uint8, count=key_count, offset=offset).astype(bool)
+        offset += key_count
+    return columns
+
+
+def encode_clipboard(nodes, keyframe_range, animation_data, block_cache=None):
+    """
+    encode copied animation into the binary clipboard format
+    :param list[str] nodes: nodes the animation was copied from
+    :param list[float] keyframe_range: sorted list of every copied keyframe time
+    :param dict animation_data: node name to {attribute name: AnimCurveData}
+    :param dict block_cache: option to reuse encoded blocks of curves with a content hash. new blocks are added to it
+    :return bytes: encoded clipboard
+    """
+    header_animation_data = {}
+    blocks = []
+    data_size = 0
+    for node, attribute_data in animation_data.items():
+        header_attribute_data = {}
+        for attribute, curve_data in attribute_data.items():
+            content_hash = curve_data.content_hash
+            if block_cache is not None and content_hash is not None and content_hash in block_cache:
+                block = block_cache[content_hash]
+            else:
+                block = encode_curve_block(curve_data)
+                if block_cache is not None and content_hash is not None:
+                    block_cache[content_hash] = block
+            header_attribute_data[attribute] = {
+                "current_value": curve_data.current_value,
+                "weighted_tangents": curve_data.weighted_tangents,
+                "key_count": len(curve_data),
+                "offset": data_size,
+            }
+            blocks.append(block)
+            data_size += len(block)
+        header_animation_data[node] = header_attribute_data
+
+    header = {
+        "nodes": nodes,
+        "keyframe_range": keyframe_range,
+        "animation_data": header_animation_data,
+    }
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    header_bytes += b" " * _get_padding(_PREAMBLE.size + len(header_bytes))
+    preamble = _PREAMBLE.pack(CLIPBOARD_MAGIC, CLIPBOARD_VERSION, len(header_bytes))
+    return b"".join([preamble, header_bytes] + blocks)
+
+
+def read_clipboard(file_path, file_name):
+    """
+    open a binary clipboard file for reading. nothing but the header is decoded until curves are requested
+    :param str file_path: directory of the clipboard file
+    :param str file_name: name of the clipboard file without extension
+    :return KeyframeClipboard: clipboard, None if the file doesn't exist or isn't a clipboard file
+    """
+    clipboard_file_path = get_clipboard_file_path(file_path, file_name)
+    if not file_path or not os.path.isfile(clipboard_file_path):
+        return None
+    try:
+        return KeyframeClipboard(clipboard_file_path)
+    except ValueError:
+        return None
+
+
+def read_clipboard_bytes(clipboard_bytes):
+    """
+    read an encoded clipboard held in memory
+    :param bytes clipboard_bytes: encoded clipboard
+    :return KeyframeClipboard: clipboard, None if the bytes aren't a valid clipboard
+    """
+    try:
+        return KeyframeClipboard(buffer=clipboard_bytes)
+    except (ValueError, struct.error):
+        return None
+
+
+class KeyframeClipboard(object):
+    """
+    Lazily decoded clipboard. Use as a context manager so the memory map is released after pasting
+    """
+
+    def __init__(self, file_path=None, buffer=None):
+        """
+        :param str file_path: clipboard file to memory map
+        :param bytes buffer: option to read an already loaded clipboard instead of a file
+        """
+        self._file = None
+        self._buffer = buffer
+        if file_path:
+            self._file = open(file_path, "rb")
+            try:
+                self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # NOTE: empty files can't be memory mapped
+                self._file.close()
+                raise
+        self.nodes = []
+        self.keyframe_range = []
+        self.animation_data = {}
+        self._data_offset = 0
+        self._init_header()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _init_header(self):
+        """
+        read the header index
+        """
+        if len(self._buffer) < _PREAMBLE.size:
+            self.close()
+            raise ValueError("clipboard is too small to be valid")
+        magic, version, header_length = _PREAMBLE.unpack_from(self._buffer, 0)
+        if magic != CLIPBOARD_MAGIC or version > CLIPBOARD_VERSION:
+            self.close()
+            raise ValueError("unsupported clipboard format")
+        header = json.loads(bytes(self._buffer[_PREAMBLE.size:_PREAMBLE.size + header_length]).decode("utf-8"))
+        self.nodes = header["nodes"]
+        self.keyframe_range = header["keyframe_range"]
+        self.animation_data = header["animation_data"]
+        self._data_offset = _PREAMBLE.size + header_length
+
+    def get_curve_data(self, node, attribute):
+        """
+        decode a single curve
+        :param str node: node the curve was copied from
+        :param str attribute: attribute the curve was copied from
+        :return AnimCurveData: curve data
+        """
+        curve_meta = self.animation_data[node][attribute]
+        columns = decode_curve_block(self._buffer, self._data_offset + curve_meta["offset"], curve_meta["key_count"])
+        return anim_curve_utils.AnimCurveData(
+            attribute=attribute,
+            current_value=curve_meta["current_value"],
+            weighted_tangents=curve_meta["weighted_tangents"],
+            columns=columns)
+
+    def to_dict(self):
+        """
+        decode every curve into the json export layout
+        :return dict: clipboard data
+        """
+        animation_data = {}
+        for node, attribute_data in self.animation_data.items():
+            animation_data[node] = {}
+            for attribute in attribute_data:
+                animation_data[node][attribute] = self.get_curve_data(node, attribute).to_dict()
+        return {"nodes": self.nodes, "keyframe_range": self.keyframe_range, "animation_data": animation_data}
+
+    def close(self):
+        """
+        release the memory map and file handle
+        """
+        if self._file is None:
+            return
+        self._buffer.close()
+        self._file.close()
+        self._file = None
+
+
+class ClipboardStore(object):
+    """
+    Clipboard history stored as one clipboard file per slot. Least recently used slots are evicted when there are
+    more slots than slot_count or the payloads take up more than byte_budget
+    """
+
+    def __init__(self, directory, file_name, slot_count=DEFAULT_SLOT_COUNT, byte_budget=DEFAULT_BYTE_BUDGET):
+        """
+        :param str directory: directory the clipboard files and index are stored in
+        :param str file_name: base name of the clipboard files. slot ids are appended to it
+        :param int slot_count: maximum number of slots kept
+        :param int byte_budget: maximum total size of all slot payloads in bytes
+        """
+        self.directory = directory
+        self.file_name = file_name
+        self.slot_count = slot_count
+        self.byte_budget = byte_budget
+
+    def _read_index(self):
+        """
+        read the slot index
+        :return dict: slot index
+        """
+        index = json_utils.read_offset_json_file(self.directory, CLIPBOARD_INDEX_FILE_NAME)
+        if not index or "slots" not in index:
+            index = {"next_slot_id": 1, "slots": []}
+        return index
+
+    def _write_index(self, index):
+        """
+        write the slot index
+        :param dict index: slot index
+        """
+        json_utils.write_json_file(self.directory, CLIPBOARD_INDEX_FILE_NAME, index)
+
+    def list_slots(self):
+        """
+        list the slots, most recently used first. only the index is read
+        :return list[dict]: slot entries with id, name, file_name, size, node_count, keyframe_range and last_used
+        """
+        return sorted(self._read_index()["slots"], key=lambda slot: slot["last_used"], reverse=True)
+
+    def get_slot(self, slot_id=None):
+        """
+        get a slot entry
+        :param int slot_id: id of the slot. the most recently used slot is returned if None
+        :return dict: slot entry, None if the slot doesn't exist
+        """
+        slots = self.list_slots()
+        if slot_id is None:
+            return slots[0] if slots else None
+        for slot in slots:
+            if slot["id"] == slot_id:
+                return slot
+        return None
+
+    def add_encoded(self, clipboard_bytes, nodes, keyframe_range, name=None):
+        """
+        store an already encoded clipboard in its own slot and evict old slots if needed
+        :param bytes clipboard_bytes: encoded clipboard
+        :param list[str] nodes: nodes the animation was copied from
+        :param list[float] keyframe_range: sorted list of every copied keyframe time
+        :param str name: option to name the slot. a name is generated from the nodes and frame range if None
+        :return dict: slot entry
+        """
+        index = self._read_index()
+        slot_id = index["next_slot_id"]
+        slot_file_name = f"{self.file_name}_{slot_id}"
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        with open(get_clipboard_file_path(self.directory, slot_file_name), "wb") as out_file:
+            out_file.write(clipboard_bytes)
+
+        frame_range = [keyframe_range[0], keyframe_range[-1]] if keyframe_range else []
+        if name is None:
+            name = f"{nodes[0]} +{len(nodes) - 1}" if len(nodes) > 1 else nodes[0]
+            if frame_range:
+                name = f"{name} [{frame_range[0]:g}-{frame_range[1]:g}]"
+        slot = {
+            "id": slot_id,
+            "name": name,
+            "file_name": slot_file_name,
+            "size": os.path.getsize(get_clipboard_file_path(self.directory, slot_file_name)),
+            "node_count": len(nodes),
+            "keyframe_range": frame_range,
+            "last_used": time.time(),
+        }
+        index["next_slot_id"] = slot_id + 1
+        index["slots"].append(slot)
+        self._evict(index, protected_slot_id=slot_id)
+        self._write_index(index)
+        return slot
+
+    def open(self, slot_id=None):
+        """
+        open a slot's clipboard and mark the slot as used
+        :param int slot_id: id of the slot. the most recently used slot is opened if None
+        :return KeyframeClipboard: clipboard, None if the slot doesn't exist
+        """
+        slot = self.get_slot(slot_id)
+        if slot is None:
+            return None
+        clipboard = read_clipboard(self.directory, slot["file_name"])
+        if clipboard is None:
+            return None
+        index = self._read_index()
+        for index_slot in index["slots"]:
+            if index_slot["id"] == slot["id"]:
+                index_slot["last_used"] = time.time()
+        self._write_index(index)
+        return clipboard
+
+    def remove(self, slot_id):
+        """
+        remove a slot and its clipboard file
+        :param int slot_id: id of the slot
+        """
+        index = self._read_index()
+        for slot in [slot for slot in index["slots"] if slot["id"] == slot_id]:
+            self._remove_slot(index, slot)
+        self._write_index(index)
+
+    def _remove_slot(self, index, slot):
+        """
+        remove a slot from the index and delete its clipboard file
+        :param dict index: slot index
+        :param dict slot: slot entry
+        """
+        index["slots"].remove(slot)
+        try:
+            os.remove(get_clipboard_file_path(self.directory, slot["file_name"]))
+        except OSError:
+            # NOTE: the file may be missing or still memory mapped by a paste in progress
+            pass
+
+    def _evict(self, index, protected_slot_id=None):
+        """
+        remove least recently used slots until the slot count and byte budget are respected
+        :param dict index: slot index
+        :param int protected_slot_id: slot that is never evicted
+        """
+        least_recently_used = sorted(index["slots"], key=lambda slot: slot["last_used"])
+        for slot in least_recently_used:
+            total_size = sum(index_slot["size"] for index_slot in index["slots"])
+            if len(index["slots"]) <= self.slot_count and total_size <= self.byte_budget:
+                break
+            if slot["id"] == protected_slot_id:
+                continue
+            self._remove_slot(index, slot)
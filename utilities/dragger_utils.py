@@ -1,11 +1,152 @@
 """
 Dragger utilities for creating viewport dragging tools
 """
+import contextlib
+import datetime
+import hashlib
+import inspect
+import time
 from functools import partial
 
+import numpy
+
+try:
+    from PySide2 import QtCore
+except ModuleNotFoundError:
+    from PySide6 import QtCore
+
 from maya import cmds, mel
 
-from as_maya_tools.utilities import qt_utils, maya_utils
+from as_maya_tools.utilities import qt_utils, maya_utils, undo_utils, json_utils
+from as_maya_tools import DRAGGER_METRICS_PATH
+
+
+DRAGGER_METRICS_FILE_NAME = "dragger_metrics"
+
+
+class DraggerMetrics(object):
+    """
+    Latency metrics of a dragger session. Times are in milliseconds. Collecting is skipped entirely when disabled
+    """
+
+    _NULL_CONTEXT = contextlib.nullcontext()
+
+    def __init__(self, dragger, enabled=False):
+        """
+        :param Dragger dragger: dragger being measured
+        :param bool enabled: collect metrics
+        """
+        self.dragger = dragger
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        """
+        clear the metrics for a new session
+        """
+        self.press_time = 0.0
+        self.compute_times = []
+        self.write_times = []
+        self.refresh_times = []
+        self.tick_latencies = []
+        self.events = 0
+        self.coalesced_events = 0
+        self._tick_write_time = 0.0
+
+    @contextlib.contextmanager
+    def _measure_write(self):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._tick_write_time += time.perf_counter() - start_time
+
+    def measure_write(self):
+        """
+        context measuring scene writes inside a drag tick. the rest of the drag function counts as compute time
+        :return: context manager
+        """
+        if not self.enabled:
+            return self._NULL_CONTEXT
+        return self._measure_write()
+
+    def add_tick(self, drag_time, refresh_time, latency):
+        """
+        record an evaluated drag tick
+        :param float drag_time: seconds spent in the drag function
+        :param float refresh_time: seconds spent refreshing the viewport
+        :param float latency: seconds from the first event of the tick until the viewport was refreshed
+        """
+        self.compute_times.append((drag_time - self._tick_write_time) * 1000.0)
+        self.write_times.append(self._tick_write_time * 1000.0)
+        self.refresh_times.append(refresh_time * 1000.0)
+        self.tick_latencies.append(latency * 1000.0)
+        self._tick_write_time = 0.0
+
+    @staticmethod
+    def _get_stats(times):
+        """
+        :param list[float] times: times in milliseconds
+        :return dict: mean, p50, p95 and max of the times
+        """
+        if not times:
+            return {"mean": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+        array = numpy.asarray(times)
+        p50, p95 = numpy.percentile(array, [50, 95])
+        return {"mean": round(float(array.mean()), 3), "p50": round(float(p50), 3), "p95": round(float(p95), 3),
+                "max": round(float(array.max()), 3)}
+
+    def get_hud_text(self):
+        """
+        get a short summary to display under the cursor label
+        :return str: hud text
+        """
+        latency = self._get_stats(self.tick_latencies[-100:])
+        return (f"press {self.press_time:.1f}ms | ticks {len(self.tick_latencies)} | "
+                f"coalesced {self.coalesced_events}/{self.events}\n"
+                f"compute {self._get_stats(self.compute_times[-100:])['mean']:.1f}ms "
+                f"write {self._get_stats(self.write_times[-100:])['mean']:.1f}ms "
+                f"refresh {self._get_stats(self.refresh_times[-100:])['mean']:.1f}ms\n"
+                f"latency p50 {latency['p50']:.1f}ms p95 {latency['p95']:.1f}ms")
+
+    def get_tool_version(self):
+        """
+        get a short hash of the dragger's module source so metrics can be compared across tool versions
+        :return str: tool version hash
+        """
+        try:
+            source = inspect.getsource(inspect.getmodule(type(self.dragger)))
+        except (OSError, TypeError):
+            return None
+        return hashlib.sha1(source.encode("utf-8")).hexdigest()[:12]
+
+    def to_dict(self):
+        """
+        get the session metrics as a json friendly dictionary
+        :return dict: session metrics
+        """
+        return {
+            "time": datetime.datetime.now().isoformat(timespec="seconds"),
+            "tool": self.dragger.NAME,
+            "tool_class": f"{type(self.dragger).__module__}.{type(self.dragger).__name__}",
+            "tool_version": self.get_tool_version(),
+            "maya_version": cmds.about(version=True),
+            "scene": cmds.file(query=True, sceneName=True),
+            "frame_budget": round(self.dragger.FRAME_BUDGET * 1000.0, 3),
+            "press": round(self.press_time, 3),
+            "ticks": len(self.tick_latencies),
+            "events": self.events,
+            "coalesced_events": self.coalesced_events,
+            "compute": self._get_stats(self.compute_times),
+            "write": self._get_stats(self.write_times),
+            "refresh": self._get_stats(self.refresh_times),
+            "tick_latency": self._get_stats(self.tick_latencies)}
+
+    def write_log(self):
+        """
+        append the session metrics to the dragger metrics log
+        """
+        json_utils.append_jsonl_file(DRAGGER_METRICS_PATH, DRAGGER_METRICS_FILE_NAME, self.to_dict())
 
 
 class Dragger(object):
@@ -19,11 +160,19 @@ class Dragger(object):
     ICON = None  # icon file path
     MAX_MULTIPLIER = 0.01  # NOTE: the fastest the drag value will raise or lower
     MIN_MULTIPLIER = 0.001  # NOTE: the slowest the drag value will raise or lower
+    FRAME_BUDGET = 1.0 / 30.0  # NOTE: minimum seconds between drag evaluations. drag events in between are coalesced
 
-    def __init__(self, debug=False, *args, **kwargs):
+    def __init__(self, debug=False, *args, metrics=False, metrics_hud=False, **kwargs):
+        """
+        :param bool debug: record errors raised by the subclass
+        :param bool metrics: collect latency metrics for every session and append them to the dragger metrics log
+        :param bool metrics_hud: show the latency metrics under the cursor label while dragging. enables metrics
+        """
 
         self.__press_failed = False
         self.debug = debug
+        self.metrics_hud = metrics_hud
+        self.metrics = DraggerMetrics(self, enabled=metrics or metrics_hud)
         self.y = None
         self.x = None
         self.modifier = None  # NOTE: only 3 options "shift", "ctrl", "other". other is the alt key
@@ -32,6 +181,12 @@ class Dragger(object):
         self.min_value = None
         self.max_value = None
         self.cursor_label = None
+        self.__drag_pending = False  # a drag event was coalesced and still needs to be evaluated
+        self.__last_drag_time = 0.0
+        self.__pending_time = None  # time the first coalesced event of the pending tick arrived
+        self.__flush_timer = QtCore.QTimer()
+        self.__flush_timer.setSingleShot(True)
+        self.__flush_timer.timeout.connect(partial(self.__flush_drag, *args, **kwargs))
 
         self.dragger_context = self.NAME
         if not cmds.draggerContext(self.dragger_context, exists=True):
@@ -75,11 +230,13 @@ class Dragger(object):
 
     def __press(self, *args, **kwargs):
         """
-        private press function. Undo chunk is opened here
+        private press function. Undo chunk and undo batch are opened here
         :return: None
         """
         # subclass is initialized on press command so that all data is properly gathered inside the dragger context
         # created in maya. This means if your init is heavy there may be some lag on the press
+        self.metrics.reset()
+        press_start_time = time.perf_counter()
         try:
             self._init_subclass(*args, **kwargs)
             self.__press_failed = False
@@ -95,6 +252,9 @@ class Dragger(object):
         self.anchor_point = cmds.draggerContext(self.dragger_context, query=True, anchorPoint=True)
         self.button = cmds.draggerContext(self.dragger_context, query=True, button=True)
         cmds.undoInfo(openChunk=True, chunkName=self.NAME)
+        # NOTE: api edits committed during the session are recorded as one undo command holding only the before and
+        # after values of the touched channels
+        undo_utils.open_batch()
 
         # Run press command if there are any other functions the user wants to apply before drag begins
         try:
@@ -104,6 +264,7 @@ class Dragger(object):
                 maya_utils.record_error(self.press, e)
             self.__release()
             return
+        self.metrics.press_time = (time.perf_counter() - press_start_time) * 1000.0
 
     def press(self, *args, **kwargs):
         """
@@ -144,16 +305,61 @@ class Dragger(object):
         if self.max_value is not None and self.x > self.max_value:
             self.x = self.max_value
 
+        # events arriving faster than the frame budget only update the drag values. the latest values are evaluated
+        # once the budget allows it, or by the flush timer if no more events arrive
+        event_time = time.perf_counter()
+        self.metrics.events += 1
+        if self.__pending_time is None:
+            self.__pending_time = event_time
+        remaining_time = self.FRAME_BUDGET - (event_time - self.__last_drag_time)
+        if remaining_time > 0:
+            if self.__drag_pending:
+                self.metrics.coalesced_events += 1
+            self.__drag_pending = True
+            if not self.__flush_timer.isActive():
+                self.__flush_timer.start(max(int(remaining_time * 1000), 1))
+            return
+
+        self.__evaluate_drag(*args, **kwargs)
+
+    def __evaluate_drag(self, *args, **kwargs):
+        """
+        run the subclass drag with the latest drag values and refresh the viewport
+        :return bool: drag succeeded. the tool is released if it failed
+        """
+        self.__flush_timer.stop()
+        self.__drag_pending = False
+        drag_start_time = time.perf_counter()
         try:
             self.drag(*args, **kwargs)
         except Exception as e:
             if self.debug:
                 maya_utils.record_error(self.drag, e)
             self.__release()
-            return
+            return False
+        drag_time = time.perf_counter() - drag_start_time
 
         self._set_cursor_label_drag_display(*args, **kwargs)
+        self.cursor_label.follow_mouse()
+        if self.metrics_hud:
+            self.cursor_label.set_hud_text(self.metrics.get_hud_text())
+        refresh_start_time = time.perf_counter()
         cmds.refresh()
+        # NOTE: the budget starts after the refresh so events queued during a slow evaluation are coalesced
+        self.__last_drag_time = time.perf_counter()
+        if self.metrics.enabled:
+            self.metrics.add_tick(
+                drag_time, self.__last_drag_time - refresh_start_time, self.__last_drag_time - self.__pending_time)
+        self.__pending_time = None
+        return True
+
+    def __flush_drag(self, *args, **kwargs):
+        """
+        evaluate a coalesced drag event if there is one
+        :return: None
+        """
+        if self.__drag_pending and not self.__press_failed:
+            self.__evaluate_drag(*args, **kwargs)
 
     def drag(self, *args, **kwargs):
         """
@@ -173,12 +379,30 @@ class Dragger(object):
 
     def __release(self, *args, **kwargs):
         """
-        private release function
+        private release function. the last coalesced drag event is evaluated before release
         """
-        self.release()
+        self.__flush_timer.stop()
+        if self.__drag_pending and not self.__press_failed:
+            # a failed drag has already released the tool
+            if not self.__evaluate_drag(*args, **kwargs):
+                return
+        self.__drag_pending = False
+        self.__last_drag_time = 0.0
+        self.__pending_time = None
+        try:
+            self.release()
+        finally:
+            undo_utils.close_batch()
         cmds.undoInfo(closeChunk=True, chunkName=self.NAME)
+        if self.metrics.enabled and not self.__press_failed:
+            try:
+                self.metrics.write_log()
+            except Exception as e:
+                if self.debug:
+                    maya_utils.record_error(self.metrics.write_log, e)
         if self.cursor_label:
             self.cursor_label.close()
+            self.cursor_label = None
         mel.eval('SelectTool')
 
     def release(self, *args, **kwargs):
@@ -30,4 +30,17 @@ def read_offset_json_file(file_path, file_name):
 
     with open(json_file_path) as json_data:
         json_file_contents = json.load(json_data)
-    return json_file_contents
\ No newline at end of file
+    return json_file_contents
+
+
+def append_jsonl_file(file_path, file_name, data):
+    """
+    append a record as one line of a .jsonl file
+    :param str file_path: file_path to write
+    :param str file_name: name of the jsonl file to write
+    :param dict data: dictionary formatted record to append"""
+
+    if not os.path.exists(file_path):
+        os.makedirs(file_path)
+    with open("{0}/{1}.jsonl".format(file_path, file_name), 'a') as outFile:
+        outFile.write(json.dumps(data) + "\n")
@@ -3,13 +3,21 @@ Utilities for dealing with keyframes in maya
 """
 from maya import cmds, mel
 
-from as_maya_tools.utilities import timeline_utils, json_utils, maya_utils, maya_node_utils, decorators
+from as_maya_tools.utilities import timeline_utils, json_utils, maya_utils, maya_node_utils, decorators, anim_curve_utils, clipboard_utils, clipboard_server, name_map_utils
 from as_maya_tools import KEYFRAME_DATA_PATH
 
 
 COPY_KEYFRAME_DATA = "COPY_KEYFRAME_DATA"
 
 
+def get_clipboard_store():
+    """
+    get the keyframe clipboard history
+    :return ClipboardStore: clipboard store
+    """
+    return clipboard_utils.ClipboardStore(KEYFRAME_DATA_PATH, COPY_KEYFRAME_DATA)
+
+
 def get_keyframe_list(frame_range="selected_key_range", frequency=1, **kwargs):
     """
     Get a list of keyframes with a specified frequency
@@ -50,10 +58,16 @@ def chunk_list(list_item, chunk_size=1):
 
 
 @decorators.end_progress_bar_function
-def copy_keyframes(all_keyframes=False, **kwargs):
+def copy_keyframes(all_keyframes=False, export_json=False, slot_name=None, use_clipboard_server=False, reduce_keys=False, reduce_tolerance=anim_curve_utils.DEFAULT_REDUCE_TOLERANCE, **kwargs):
     """
-    copy animation from selected objects
+    copy animation from selected objects into a new clipboard slot
     :param bool all_keyframes: option to save all keyframes
+    :param bool export_json: option to also export the copied animation as a .json file
+    :param str slot_name: option to name the clipboard slot
+    :param bool use_clipboard_server: option to send the clipboard to the local clipboard server instead of a file.
+    falls back to the clipboard files if the server isn't running
+    :param bool reduce_keys: option to remove redundant keyframes on constant and linear sections before storing
+    :param float reduce_tolerance: max value difference allowed when removing keyframes
     """
     nodes = cmds.ls(selection=True)
     if nodes is None or len(nodes) == 0:
@@ -63,7 +77,7 @@ def copy_keyframes(all_keyframes=False, **kwargs):
     main_data = {}
     animation_data = {}
     nodes_meta = []
-    key_frame_range_meta = []
+    key_frame_range_meta = set()
 
     # store selected attribute if user wants to save out specific attributes
     selected_attributes = cmds.channelBox('mainChannelBox', query=True, selectedMainAttributes=True)
@@ -77,7 +91,14 @@ def copy_keyframes(all_keyframes=False, **kwargs):
             frame_range = cmds.timeControl(gPlayBackSlider, query=True, rangeArray=True)
             
     main_progress_bar = maya_utils.progress_bar("copying animation", len(nodes))
-    
+
+    # unchanged curves are reused from the last copy instead of being queried and serialized again
+    anim_curve_cache = anim_curve_utils.get_anim_curve_cache()
+    content_hashes = set()
+    copied_key_count = 0
+    stored_key_count = 0
+    static_curve_count = 0
+
     for node in nodes:
         cmds.progressBar(main_progress_bar, edit=True,step=1, status=(f"copying animation from {node}"))
         animatable_attributes = cmds.listAttr(node, keyable=True, unlocked=True, shortNames=True)
@@ -93,34 +114,24 @@ def copy_keyframes(all_keyframes=False, **kwargs):
             if selected_attributes and not attribute in selected_attributes:
                 continue
 
-            # determine frame range to query keyframe data from
-            key_frames = cmds.keyframe(
-                f"{node}.{attribute}",
-                query=True,
-                timeChange=True)
-            if frame_range:
-                key_frames = cmds.keyframe(
-                    f"{node}.{attribute}",
-                    query=True,
-                    timeChange=True,
-                    time=(frame_range[0], frame_range[1]))
-
-            # If no keyframes are found store the current value as backup
-            current_value = cmds.getAttr(f"{node}.{attribute}")
-            # only try to store keyframe data if there is any
-            key_frame_data = {}
-            if key_frames:
-                for key_frame in key_frames:
-
-                    # storing the keyframe range 'meta data'
-                    key_frame_range_meta.append(key_frame)
-
-                    # getting keyframe data
-                    key_frame_data[key_frame] = get_keyframe_data(node, attribute, key_frame)
-            value_data = {}
-            value_data["current_value"] = current_value
-            value_data["key_frame_data"] = key_frame_data
-            attribute_data[attribute] = value_data
+            # capture the whole curve in a handful of array queries
+            curve_data = anim_curve_cache.get_anim_curve_data(node, attribute, frame_range=frame_range)
+            copied_key_count += len(curve_data)
+            # NOTE: the capture is kept under its own hash so the next copy reuses it, reduced or not
+            if curve_data.content_hash:
+                content_hashes.add(curve_data.content_hash)
+            if reduce_keys:
+                if anim_curve_utils.is_static_curve(curve_data, tolerance=reduce_tolerance):
+                    static_curve_count += 1
+                curve_data = anim_curve_utils.reduce_anim_curve_data(curve_data, tolerance=reduce_tolerance)
+            stored_key_count += len(curve_data)
+            if curve_data.content_hash:
+                content_hashes.add(curve_data.content_hash)
+
+            # storing the keyframe range 'meta data'
+            key_frame_range_meta.update(curve_data.times.tolist())
+
+            attribute_data[attribute] = curve_data
 
         animation_data[node] = attribute_data
 
@@ -132,17 +143,39 @@ def copy_keyframes(all_keyframes=False, **kwargs):
         maya_utils.message("no keyframe data was found", position='midCenterTop', record_warning=True)
         return
 
-    main_data["nodes"] = nodes_meta
-    main_data["keyframe_range"] = sorted(list(set(key_frame_range_meta)))
-    main_data["animation_data"] = animation_data
-    # save data in json file
-    json_utils.write_json_file(KEYFRAME_DATA_PATH, COPY_KEYFRAME_DATA, main_data)
+    keyframe_range = sorted(key_frame_range_meta)
+    clipboard_bytes = clipboard_utils.encode_clipboard(
+        nodes_meta, keyframe_range, animation_data, block_cache=anim_curve_cache.blocks)
+    anim_curve_cache.prune(content_hashes)
+    # stream the clipboard to the clipboard server if it's running, otherwise save it in a new clipboard slot
+    server_clipboard = None
+    if use_clipboard_server:
+        server_clipboard = clipboard_server.send_clipboard(
+            clipboard_bytes, name=slot_name, meta={"node_count": len(nodes_meta)})
+    if server_clipboard is None:
+        get_clipboard_store().add_encoded(clipboard_bytes, nodes_meta, keyframe_range, name=slot_name)
+
+    if reduce_keys and stored_key_count:
+        maya_utils.message(
+            f"stored {stored_key_count} of {copied_key_count} keys ({static_curve_count} static curves), "
+            f"compression ratio {copied_key_count / stored_key_count:.2f}",
+            position='midCenterTop',
+            record_warning=False)
+
+    if export_json:
+        main_data["nodes"] = nodes_meta
+        main_data["keyframe_range"] = keyframe_range
+        main_data["animation_data"] = {}
+        for node in animation_data:
+            main_data["animation_data"][node] = {
+                attribute: curve_data.to_dict() for attribute, curve_data in animation_data[node].items()}
+        json_utils.write_json_file(KEYFRAME_DATA_PATH, COPY_KEYFRAME_DATA, main_data)
     cmds.progressBar(main_progress_bar, edit=True, endProgress=True)
 
 
 @decorators.undoable_chunk
 @decorators.end_progress_bar_function
-def paste_keyframes(use_selection=True, use_current_time=True, reverse=False, replace=False, search_replace=False, search_string="", replace_string="", **kwargs):
+def paste_keyframes(use_selection=True, use_current_time=True, reverse=False, replace=False, search_replace=False, search_string="", replace_string="", dry_run=False, slot_id=None, use_clipboard_server=False, name_map=None, time_scale=1.0, time_warp=None, snap_to_frames=False, **kwargs):
     """
     paste animation
     :param bool use_selection: option to use the current selection to paste keyframes
@@ -152,116 +185,213 @@ def paste_keyframes(use_selection=True, use_current_time=True, reverse=False, re
     :param bool search_replace: option to search and replace node names
     :param str search_string: search string
     :param str replace_string: replacement string
+    :param bool dry_run: option to only resolve what would be pasted without touching the scene. the plan is returned
+    for the caller to report
+    :param int slot_id: clipboard slot to paste from. the most recently used slot is pasted if None
+    :param bool use_clipboard_server: option to paste the most recent clipboard held by the local clipboard server.
+    falls back to the clipboard files if the server isn't running or a slot_id is given
+    :param NameMap name_map: option to map the destination node names with tables, namespace remaps and regex rules
+    :param float time_scale: option to scale the pasted animation in time around its first keyframe
+    :param tuple(list[float], list[float]) time_warp: option to retime the copied animation with (source times,
+    destination times) control points before it's offset
+    :param bool snap_to_frames: option to snap the pasted keyframes to whole frames
+    :return PastePlan: resolved paste plan, None if there was nothing to paste
     """
-    # read saved animation json file
-    anim_data = json_utils.read_offset_json_file(KEYFRAME_DATA_PATH, COPY_KEYFRAME_DATA)
-    
-    nodes = anim_data["nodes"]
-    
+    # open the clipboard. only the header index is read here, curves are decoded as they are planned
+    anim_data = None
+    if use_clipboard_server and slot_id is None:
+        clipboard_bytes = clipboard_server.receive_clipboard()
+        if clipboard_bytes:
+            anim_data = clipboard_utils.read_clipboard_bytes(clipboard_bytes)
+    if anim_data is None:
+        anim_data = get_clipboard_store().open(slot_id)
+    if not anim_data:
+        maya_utils.message("no copied keyframe data found", position='midCenterTop', record_warning=True)
+        return None
+
+    try:
+        paste_plan = get_paste_plan(
+            anim_data,
+            use_selection=use_selection,
+            use_current_time=use_current_time,
+            reverse=reverse,
+            search_replace=search_replace,
+            search_string=search_string,
+            replace_string=replace_string,
+            name_map=name_map,
+            time_scale=time_scale,
+            time_warp=time_warp,
+            snap_to_frames=snap_to_frames)
+    finally:
+        anim_data.close()
+
+    if paste_plan is None:
+        return None
+
+    if dry_run:
+        return paste_plan
+
+    apply_paste_plan(paste_plan, replace=replace)
+    return paste_plan
+
+
+class PastePlan(object):
+    """
+    Everything a paste writes, resolved up front so applying it only has to write to the scene
+    """
+
+    def __init__(self):
+        self.node_map = []  # list[tuple(str, str)]: (source node, destination node)
+        self.curves = []  # list[tuple(str, AnimCurveData)]: (destination attribute path, curve data to paste)
+        self.static_values = []  # list[tuple(str, value)]: (destination attribute path, value) for curves without keyframes
+        self.skipped_nodes = []  # list[str]: destination nodes that don't exist in the scene
+        self.skipped_attributes = []  # list[str]: destination attribute paths that aren't keyable or don't exist
+
+    def report(self):
+        """
+        get a readable summary of the plan
+        :return str: plan summary
+        """
+        lines = [f"paste plan: {len(self.curves)} curves, {len(self.static_values)} static values"]
+        for source_node, destination_node in self.node_map:
+            lines.append(f"  {source_node} -> {destination_node}")
+        for attribute_path, curve_data in self.curves:
+            lines.append(
+                f"  {attribute_path}: {len(curve_data)} keys {curve_data.times[0]} - {curve_data.times[-1]}")
+        for attribute_path, value in self.static_values:
+            lines.append(f"  {attribute_path}: value {value}")
+        if self.skipped_nodes:
+            lines.append(f"  skipped missing nodes: {', '.join(self.skipped_nodes)}")
+        if self.skipped_attributes:
+            lines.append(f"  skipped attributes: {', '.join(self.skipped_attributes)}")
+        return "\n".join(lines)
+
+
+def get_paste_plan(anim_data, use_selection=True, use_current_time=True, reverse=False, search_replace=False, search_string="", replace_string="", name_map=None, time_scale=1.0, time_warp=None, snap_to_frames=False):
+    """
+    resolve the source to destination node mapping, the destination attributes and the keyframes to paste
+    :param KeyframeClipboard anim_data: clipboard to paste from
+    :param NameMap name_map: option to map the destination node names. search and replace is applied after it
+    :param float time_scale: option to scale the pasted animation in time around its first keyframe
+    :param tuple(list[float], list[float]) time_warp: option to retime the copied animation before it's offset
+    :param bool snap_to_frames: option to snap the pasted keyframes to whole frames
+    :return PastePlan: resolved paste plan, None if there are no nodes to paste onto
+    """
+    nodes = anim_data.nodes
+
     if use_selection:
         nodes = cmds.ls(selection=True)
     if nodes is None or len(nodes) == 0:
         maya_utils.message("no nodes specified to paste keyframes", position='midCenterTop', record_warning=True)
-        return
-
-    if not anim_data:
-        maya_utils.message("no copied keyframe data found", position='midCenterTop', record_warning=True)
-        return
+        return None
 
     # determine the animation offset from original
     animation_offset = 0
     if use_current_time:
         # if no keyframes are stored skip setting the animation offset
-        if anim_data["keyframe_range"]:
-            animation_offset = anim_data["keyframe_range"][0] - cmds.currentTime(query=True)
-        
-    main_progress_bar = maya_utils.progress_bar("pasting animation", len(nodes))
-
+        if anim_data.keyframe_range:
+            animation_offset = anim_data.keyframe_range[0] - cmds.currentTime(query=True)
+
+    # map every destination name at once and check them against the scene with a single query
+    if name_map is None:
+        name_map = name_map_utils.NameMap()
+    if search_replace:
+        name_map = name_map_utils.NameMap.from_dict(name_map.to_dict())
+        name_map.add_search_replace(search_string, replace_string)
+    nodes = name_map.map_names(nodes)
+    existing_nodes = name_map_utils.get_existing_names(nodes)
+
+    # the animation is scaled around the first copied keyframe, where the paste starts
+    scale_pivot = anim_data.keyframe_range[0] if anim_data.keyframe_range else 0.0
+
+    paste_plan = PastePlan()
+    source_nodes = list(anim_data.animation_data)
+    # curves are decoded once per source node even when the animation data loops over the selection
+    paste_curve_data_cache = {}
     for i, node in enumerate(nodes):
-        if search_replace:
-            node = node.replace(search_string, replace_string)
         # skip any object that doesn't exist in the current maya session
-        if not maya_utils.obj_exists(node):
+        if node not in existing_nodes:
+            paste_plan.skipped_nodes.append(node)
             continue
-        
-        cmds.progressBar(main_progress_bar, edit=True,step=1, status=(f"pasting animtion to {node}"))
-        
-        node_key = list(anim_data["animation_data"])[
-            i % len(anim_data["animation_data"])]  # animation data will loop until selected node list ends
-        for attribute_key in anim_data["animation_data"][node_key]:
 
-            # make sure attribute exists on this node before going any further
-            # TODO: may need to check if attribute is not connected to other nodes
-            animatable_attributes = cmds.listAttr(node, keyable=True, unlocked=True, shortNames=True)
+        node_key = source_nodes[i % len(source_nodes)]  # animation data will loop until selected node list ends
+        paste_plan.node_map.append((node_key, node))
+
+        # make sure attributes exist on this node before going any further
+        # TODO: may need to check if attribute is not connected to other nodes
+        animatable_attributes = set(cmds.listAttr(node, keyable=True, unlocked=True, shortNames=True) or [])
+        for attribute_key in anim_data.animation_data[node_key]:
+            attribute_path = f"{node}.{attribute_key}"
             if attribute_key not in animatable_attributes:
+                paste_plan.skipped_attributes.append(attribute_path)
                 continue
 
-            # setting the order keyframes are applied
-            key_frames_data = anim_data["animation_data"][node_key][attribute_key]["key_frame_data"]
+            if (node_key, attribute_key) not in paste_curve_data_cache:
+                curve_data = anim_data.get_curve_data(node_key, attribute_key)
+                curve_data = get_paste_curve_data(
+                    curve_data,
+                    animation_offset=animation_offset,
+                    reverse=reverse,
+                    time_scale=time_scale,
+                    scale_pivot=scale_pivot,
+                    time_warp=time_warp,
+                    snap_step=1.0 if snap_to_frames else None)
+                paste_curve_data_cache[(node_key, attribute_key)] = curve_data
+            curve_data = paste_curve_data_cache[(node_key, attribute_key)]
+
             # use the stored value if no keyframes were saved
-            if len(key_frames_data) == 0:
-                cmds.setAttr(
-                    f"{node}.{attribute_key}",
-                    anim_data["animation_data"][node_key][attribute_key]["current_value"])
+            if len(curve_data) == 0:
+                paste_plan.static_values.append((attribute_path, curve_data.current_value))
                 continue
+            paste_plan.curves.append((attribute_path, curve_data))
+    return paste_plan
 
-            # set keyframes on nodes
-            for key_frame_key in key_frames_data:
-
-                # getting the keyframe time including any offsets
-                key_frame_time = float(key_frame_key) - animation_offset
-
-                # gathering keyframe data in case we need to manipulate the data before applying the keyframes
-                in_tangent_key = "in_tangent"
-                out_tangent_key = "out_tangent"
-                in_angle = anim_data["animation_data"][node_key][attribute_key]["key_frame_data"][key_frame_key]["in_angle"]
-                out_angle = anim_data["animation_data"][node_key][attribute_key]["key_frame_data"][key_frame_key]["out_angle"]
-                in_weight_key = "in_weight"
-                out_weight_key = "out_weight"
-                ix = anim_data["animation_data"][node_key][attribute_key]["key_frame_data"][key_frame_key]["ix"]
-                iy = anim_data["animation_data"][node_key][attribute_key]["key_frame_data"][key_frame_key]["iy"]
-                ox = anim_data["animation_data"][node_key][attribute_key]["key_frame_data"][key_frame_key]["ox"]
-                oy = anim_data["animation_data"][node_key][attribute_key]["key_frame_data"][key_frame_key]["oy"]
-                if reverse:
-                    # calculate reversed keyframe time
-                    min_key = float(next(iter(key_frames_data)))
-                    max_key = float(next(reversed(key_frames_data)))
-                    key_frame_time = ((min_key + max_key) - float(key_frame_key)) - animation_offset
-
-                    # reverse tangent data
-                    in_tangent_key = "out_tangent"
-                    out_tangent_key = "in_tangent"
-                    in_angle = anim_data["animation_data"][node_key][attribute_key]["key_frame_data"][key_frame_key]["out_angle"] * -1
-                    out_angle = anim_data["animation_data"][node_key][attribute_key]["key_frame_data"][key_frame_key]["in_angle"] * -1
-                    in_weight_key = "out_weight"
-                    out_weight_key = "in_weight"
-                    ix = anim_data["animation_data"][node_key][attribute_key]["key_frame_data"][key_frame_key]["ox"]
-                    iy = anim_data["animation_data"][node_key][attribute_key]["key_frame_data"][key_frame_key]["oy"] * -1
-                    ox = anim_data["animation_data"][node_key][attribute_key]["key_frame_data"][key_frame_key]["ix"]
-                    oy = anim_data["animation_data"][node_key][attribute_key]["key_frame_data"][key_frame_key]["iy"] * -1
-
-                set_keyframe(
-                    node,
-                    attribute_key,
-                    key_frame_time,
-                    anim_data["animation_data"][node_key][attribute_key]["key_frame_data"][key_frame_key]["value"],
-                    anim_data["animation_data"][node_key][attribute_key]["key_frame_data"][key_frame_key][in_tangent_key],
-                    anim_data["animation_data"][node_key][attribute_key]["key_frame_data"][key_frame_key][out_tangent_key],
-                    in_angle,
-                    anim_data["animation_data"][node_key][attribute_key]["key_frame_data"][key_frame_key][in_weight_key],
-                    ix,
-                    iy,
-                    anim_data["animation_data"][node_key][attribute_key]["key_frame_data"][key_frame_key]["lock"],
-                    out_angle,
-                    anim_data["animation_data"][node_key][attribute_key]["key_frame_data"][key_frame_key][out_weight_key],
-                    ox,
-                    oy,
-                    anim_data["animation_data"][node_key][attribute_key]["key_frame_data"][key_frame_key]["weight_lock"],
-                    anim_data["animation_data"][node_key][attribute_key]["key_frame_data"][key_frame_key]["weighted_tangents"],
-                )
+
+def apply_paste_plan(paste_plan, replace=False):
+    """
+    write a resolved paste plan to the scene
+    :param PastePlan paste_plan: plan to write
+    :param bool replace: option to replace animation in the keyframe range
+    """
+    main_progress_bar = maya_utils.progress_bar("pasting animation", len(paste_plan.curves))
+
+    for attribute_path, value in paste_plan.static_values:
+        cmds.setAttr(attribute_path, value)
+
+    anim_curve_changes = []
+    try:
+        for attribute_path, curve_data in paste_plan.curves:
+            cmds.progressBar(main_progress_bar, edit=True, step=1, status=(f"pasting animation to {attribute_path}"))
+            anim_curve_changes.append(anim_curve_utils.set_anim_curve_data(attribute_path, curve_data, replace=replace))
+    finally:
+        # record every curve edit as a single undoable command
+        anim_curve_utils.commit_anim_curve_changes(anim_curve_changes)
     cmds.progressBar(main_progress_bar, edit=True, endProgress=True)
 
 
+def get_paste_curve_data(curve_data, animation_offset=0, reverse=False, time_scale=1.0, scale_pivot=0.0, time_warp=None, snap_step=None):
+    """
+    get curve data with the paste time transforms applied to all keyframes at once
+    :param AnimCurveData curve_data: copied curve data
+    :param float animation_offset: offset subtracted from every keyframe time
+    :param bool reverse: option to reverse keyframes. keyframe times and tangents are mirrored, values are kept
+    :param float time_scale: time scale around the scale pivot
+    :param float scale_pivot: copied time that stays in place when scaling
+    :param tuple(list[float], list[float]) time_warp: option to retime the copied times with (source times,
+    destination times) control points
+    :param float snap_step: option to snap the pasted keyframes to a frame step
+    :return AnimCurveData: curve data to paste
+    """
+    return anim_curve_utils.transform_anim_curve_data(
+        curve_data,
+        offset=-animation_offset,
+        reverse=reverse,
+        scale=time_scale,
+        pivot=scale_pivot,
+        time_warp=time_warp,
+        snap_step=snap_step)
+
+
 def get_keyframe_data(node, attribute, key_frame):
     """
     Get single keyframe's data
@@ -2,6 +2,8 @@
 Math utilities
 """
 import math
+
+import numpy
 from maya.api import OpenMaya
 
 
@@ -108,3 +110,172 @@ def recompose_position_matrix(translation, rotation, scale, shear):
 
     recoupled_position_matrix = recomposed_position_transform.asMatrix()
     return recoupled_position_matrix
+
+
+def matrix_to_array(om_matrix):
+    """
+    convert a matrix to a numpy array
+    :param OpenMaya.MMatrix om_matrix: matrix
+    :return numpy.ndarray: 4x4 array, rows match the MMatrix rows
+    """
+    return numpy.asarray(list(om_matrix), dtype=numpy.float64).reshape(4, 4)
+
+
+def decompose_position_matrices(om_matrices):
+    """
+    decompose position matrices into stacked translation, rotation, scale and shear arrays
+    :param list[OpenMaya.MMatrix] om_matrices: matrices
+    :return dict: translation (n, 3), rotation (n, 4) quaternions as x, y, z, w, scale (n, 3) and shear (n, 3)
+    """
+    decomposed = {"translation": [], "rotation": [], "scale": [], "shear": []}
+    for om_matrix in om_matrices:
+        translation, rotation, scale, shear = decompose_position_matrix(OpenMaya.MMatrix(om_matrix))
+        decomposed["translation"].append(tuple(translation))
+        decomposed["rotation"].append((rotation.x, rotation.y, rotation.z, rotation.w))
+        decomposed["scale"].append(tuple(scale))
+        decomposed["shear"].append(tuple(shear))
+    return {key: numpy.asarray(value, dtype=numpy.float64).reshape(-1, 3 if key != "rotation" else 4)
+            for key, value in decomposed.items()}
+
+
+def decompose_position_matrix_arrays(matrices):
+    """
+    decompose stacked position matrices with numpy. the inverse of recompose_position_matrices()
+    :param numpy.ndarray matrices: (n, 4, 4) matrices, rows match the MMatrix rows
+    :return dict: translation (n, 3), rotation (n, 3, 3) rotation matrices, scale (n, 3), shear (n, 3) as xy, xz, yz
+    and determinant (n,). matrices with a negative determinant hold a mirrored rotation
+    """
+    rows = matrices[:, :3, :3]
+    # NOTE: the rows are scale * (shear * rotation), so gram schmidt on the rows in order gives every part
+    scale = numpy.empty((len(matrices), 3))
+    shear = numpy.empty((len(matrices), 3))
+    rotation = numpy.empty((len(matrices), 3, 3))
+    scale[:, 0] = numpy.linalg.norm(rows[:, 0], axis=1)
+    rotation[:, 0] = rows[:, 0] / scale[:, 0, None]
+    projection = numpy.sum(rows[:, 1] * rotation[:, 0], axis=1)
+    row = rows[:, 1] - projection[:, None] * rotation[:, 0]
+    scale[:, 1] = numpy.linalg.norm(row, axis=1)
+    rotation[:, 1] = row / scale[:, 1, None]
+    shear[:, 0] = projection / scale[:, 1]
+    projection_0 = numpy.sum(rows[:, 2] * rotation[:, 0], axis=1)
+    projection_1 = numpy.sum(rows[:, 2] * rotation[:, 1], axis=1)
+    row = rows[:, 2] - projection_0[:, None] * rotation[:, 0] - projection_1[:, None] * rotation[:, 1]
+    scale[:, 2] = numpy.linalg.norm(row, axis=1)
+    rotation[:, 2] = row / scale[:, 2, None]
+    shear[:, 1] = projection_0 / scale[:, 2]
+    shear[:, 2] = projection_1 / scale[:, 2]
+    return {"translation": matrices[:, 3, :3].copy(), "rotation": rotation, "scale": scale, "shear": shear,
+            "determinant": numpy.linalg.det(rotation)}
+
+
+# axes of each OpenMaya.MEulerRotation order, in the order they are applied
+EULER_ROTATION_AXES = ((0, 1, 2), (1, 2, 0), (2, 0, 1), (0, 2, 1), (1, 0, 2), (2, 1, 0))
+
+
+def rotation_matrices_to_euler(rotation_matrices, rotate_orders, reference_rotations):
+    """
+    get the euler rotations of stacked rotation matrices with numpy. like MEulerRotation.closestSolution() the solution
+    closest to a reference rotation is used
+    :param numpy.ndarray rotation_matrices: (n, 3, 3) rotation matrices, rows match the MMatrix rows
+    :param numpy.ndarray rotate_orders: (n,) MEulerRotation orders
+    :param numpy.ndarray reference_rotations: (n, 3) rotations in radians the solutions are kept close to
+    :return numpy.ndarray: (n, 3) rotations in radians
+    """
+    rotations = numpy.empty((len(rotation_matrices), 3))
+    for rotate_order in numpy.unique(rotate_orders).tolist():
+        mask = rotate_orders == rotate_order
+        axes = list(EULER_ROTATION_AXES[rotate_order])
+        # NOTE: reordering the axes turns every order into xyz. odd orders mirror the angles
+        matrices = rotation_matrices[mask][:, axes][:, :, axes]
+        cos_middle = numpy.hypot(matrices[:, 0, 0], matrices[:, 0, 1])
+        middle = numpy.arctan2(-matrices[:, 0, 2], cos_middle)
+        gimbal = cos_middle < 1e-9
+        first = numpy.where(
+            gimbal, numpy.arctan2(matrices[:, 1, 0] * -numpy.sign(matrices[:, 0, 2]), matrices[:, 1, 1]),
+            numpy.arctan2(matrices[:, 1, 2], matrices[:, 2, 2]))
+        last = numpy.where(gimbal, 0.0, numpy.arctan2(matrices[:, 0, 1], matrices[:, 0, 0]))
+        solutions = numpy.stack([numpy.stack([first, middle, last], axis=1),
+                                 numpy.stack([first + numpy.pi, numpy.pi - middle, last + numpy.pi], axis=1)])
+        if rotate_order >= 3:
+            solutions = -solutions
+        reference = reference_rotations[mask][:, axes]
+        solutions += 2.0 * numpy.pi * numpy.round((reference - solutions) / (2.0 * numpy.pi))
+        distances = numpy.sum(numpy.abs(solutions - reference), axis=2)
+        solution = numpy.where((distances[1] < distances[0])[:, None], solutions[1], solutions[0])
+        rotations[numpy.ix_(numpy.flatnonzero(mask), axes)] = solution
+    return rotations
+
+
+def slerp_quaternions(a, b, t):
+    """
+    slerp stacked quaternions along the shortest path
+    :param numpy.ndarray a: (n, 4) quaternions as x, y, z, w
+    :param numpy.ndarray b: (n, 4) quaternions as x, y, z, w
+    :param float t: lerp weight. can be higher or lower to overshoot
+    :return numpy.ndarray: (n, 4) slerped quaternions
+    """
+    dot = numpy.sum(a * b, axis=1)
+    b = numpy.where((dot < 0.0)[:, None], -b, b)
+    dot = numpy.clip(numpy.abs(dot), 0.0, 1.0)
+    theta = numpy.arccos(dot)
+    sin_theta = numpy.sin(theta)
+    # NOTE: nearly identical rotations are lerped to avoid dividing by zero
+    nearly_equal = sin_theta < 1e-6
+    safe_sin_theta = numpy.where(nearly_equal, 1.0, sin_theta)
+    weight_a = numpy.where(nearly_equal, 1.0 - t, numpy.sin((1.0 - t) * theta) / safe_sin_theta)
+    weight_b = numpy.where(nearly_equal, t, numpy.sin(t * theta) / safe_sin_theta)
+    result = a * weight_a[:, None] + b * weight_b[:, None]
+    return result / numpy.linalg.norm(result, axis=1)[:, None]
+
+
+def recompose_position_matrices(translation, rotation, scale, shear):
+    """
+    recompose stacked position matrices. matches MTransformationMatrix with no pivots: scale * shear * rotation *
+    translation
+    :param numpy.ndarray translation: (n, 3) translations
+    :param numpy.ndarray rotation: (n, 4) quaternions as x, y, z, w
+    :param numpy.ndarray scale: (n, 3) scales
+    :param numpy.ndarray shear: (n, 3) shears as xy, xz, yz
+    :return numpy.ndarray: (n, 4, 4) matrices, rows match the MMatrix rows
+    """
+    count = len(translation)
+    x, y, z, w = rotation[:, 0], rotation[:, 1], rotation[:, 2], rotation[:, 3]
+    rotation_matrices = numpy.empty((count, 3, 3))
+    rotation_matrices[:, 0, 0] = 1.0 - 2.0 * (y * y + z * z)
+    rotation_matrices[:, 0, 1] = 2.0 * (x * y + z * w)
+    rotation_matrices[:, 0, 2] = 2.0 * (x * z - y * w)
+    rotation_matrices[:, 1, 0] = 2.0 * (x * y - z * w)
+    rotation_matrices[:, 1, 1] = 1.0 - 2.0 * (x * x + z * z)
+    rotation_matrices[:, 1, 2] = 2.0 * (y * z + x * w)
+    rotation_matrices[:, 2, 0] = 2.0 * (x * z + y * w)
+    rotation_matrices[:, 2, 1] = 2.0 * (y * z - x * w)
+    rotation_matrices[:, 2, 2] = 1.0 - 2.0 * (x * x + y * y)
+
+    shear_matrices = numpy.zeros((count, 3, 3))
+    shear_matrices[:, 0, 0] = shear_matrices[:, 1, 1] = shear_matrices[:, 2, 2] = 1.0
+    shear_matrices[:, 1, 0] = shear[:, 0]
+    shear_matrices[:, 2, 0] = shear[:, 1]
+    shear_matrices[:, 2, 1] = shear[:, 2]
+
+    matrices = numpy.zeros((count, 4, 4))
+    matrices[:, :3, :3] = scale[:, :, None] * numpy.matmul(shear_matrices, rotation_matrices)
+    matrices[:, 3, :3] = translation
+    matrices[:, 3, 3] = 1.0
+    return matrices
+
+
+def lerp_decomposed_matrices(a, b, lerp_value, translation=True, rotation=True, scale=True, *args, **kwargs):
+    """
+    Lerp stacked decomposed matrices in one pass. rotation is slerped. shear is kept from a like lerp_matrix()
+    :param dict a: first matrices from decompose_position_matrices()
+    :param dict b: second matrices from decompose_position_matrices()
+    :param float lerp_value: lerp weight
+    :param bool translation: option to lerp translation
+    :param bool rotation: option to lerp rotation
+    :param bool scale: option to lerp scale
+    :return numpy.ndarray: (n, 4, 4) lerped matrices
+    """
+    lerp_translation = lerp(a["translation"], b["translation"], lerp_value) if translation else a["translation"]
+    lerp_rotation = slerp_quaternions(a["rotation"], b["rotation"], lerp_value) if rotation else a["rotation"]
+    lerp_scale = lerp(a["scale"], b["scale"], lerp_value) if scale else a["scale"]
+    return recompose_position_matrices(lerp_translation, lerp_rotation, lerp_scale, a["shear"])
@@ -23,6 +23,17 @@ def obj_exists(name):
         return False
 
 
+def get_plug(attribute_path):
+    """
+    get the OpenMaya plug of an attribute path
+    :param str attribute_path: attribute path. example node.translateX
+    :return OpenMaya.MPlug: plug
+    """
+    selection = OpenMaya.MSelectionList()
+    selection.add(attribute_path)
+    return selection.getPlug(0)
+
+
 def record_error(function, error):
     """
     records a clean error message in the maya terminal with details for troubleshooting
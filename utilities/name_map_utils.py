@@ -0,0 +1,156 @@
+"""
+Utilities for mapping node names between scenes, rigs and namespaces
+A NameMap holds explicit name tables, namespace remaps and ordered regex rules. Rules are compiled once and applied to
+whole name lists, and the mapped names are checked against the scene with a single ls query
+"""
+import re
+
+from maya import cmds
+
+from as_maya_tools.utilities import maya_utils
+
+
+class NameMap(object):
+    """
+    Ordered name mapping. Explicit table entries win, otherwise the namespace is remapped and the regex rules are
+    applied in the order they were added
+    """
+
+    def __init__(self, table=None, namespaces=None, rules=None):
+        """
+        :param dict table: source name to destination name
+        :param dict namespaces: source namespace to destination namespace. use "" for nodes without a namespace
+        :param list[tuple(str, str)] rules: ordered (regex pattern, replacement) rules
+        """
+        self.table = dict(table or {})
+        self.namespaces = dict(namespaces or {})
+        self._rules = []  # list[tuple(re.Pattern, str)]: compiled rules
+        self._mapped_names = {}  # dict[str, str]: source name to mapped name
+        for pattern, replacement in rules or []:
+            self.add_rule(pattern, replacement)
+
+    def __bool__(self):
+        return bool(self.table or self.namespaces or self._rules)
+
+    @property
+    def rules(self):
+        return [(pattern.pattern, replacement) for pattern, replacement in self._rules]
+
+    def add_rule(self, pattern, replacement):
+        """
+        add a regex rule. rules are applied in the order they are added
+        :param str pattern: regex pattern
+        :param str replacement: replacement, may reference groups
+        """
+        self._rules.append((re.compile(pattern), replacement))
+        self._mapped_names = {}
+
+    def add_search_replace(self, search_string, replace_string):
+        """
+        add a plain text search and replace rule
+        :param str search_string: text to search for
+        :param str replace_string: replacement text
+        """
+        if not search_string:
+            return
+        self.add_rule(re.escape(search_string), replace_string.replace("\\", "\\\\"))
+
+    def add_namespace(self, namespace, new_namespace):
+        """
+        remap a namespace
+        :param str namespace: source namespace, "" for nodes without a namespace
+        :param str new_namespace: destination namespace, "" to remove the namespace
+        """
+        self.namespaces[namespace] = new_namespace
+        self._mapped_names = {}
+
+    def add_table(self, table):
+        """
+        add explicit name mappings
+        :param dict table: source name to destination name
+        """
+        self.table.update(table)
+        self._mapped_names = {}
+
+    def map_name(self, name):
+        """
+        map a single name
+        :param str name: source name
+        :return str: mapped name
+        """
+        mapped_name = self._mapped_names.get(name)
+        if mapped_name is not None:
+            return mapped_name
+
+        if name in self.table:
+            mapped_name = self.table[name]
+        else:
+            namespace, _, base_name = name.rpartition(":")
+            if namespace in self.namespaces:
+                namespace = self.namespaces[namespace]
+            mapped_name = f"{namespace}:{base_name}" if namespace else base_name
+            for pattern, replacement in self._rules:
+                mapped_name = pattern.sub(replacement, mapped_name)
+        self._mapped_names[name] = mapped_name
+        return mapped_name
+
+    def map_names(self, names):
+        """
+        map a list of names
+        :param list[str] names: source names
+        :return list[str]: mapped names in the same order
+        """
+        return [self.map_name(name) for name in names]
+
+    def resolve(self, names):
+        """
+        map a list of names and keep the ones that exist in the scene
+        :param list[str] names: source names
+        :return tuple(list[tuple(str, str)], list[str]): (source name, mapped name) pairs that exist, and mapped names
+        that don't exist
+        """
+        mapped_names = self.map_names(names)
+        existing_names = get_existing_names(mapped_names)
+        resolved = []
+        missing = []
+        for name, mapped_name in zip(names, mapped_names):
+            if mapped_name in existing_names:
+                resolved.append((name, mapped_name))
+            else:
+                missing.append(mapped_name)
+        return resolved, missing
+
+    def to_dict(self):
+        """
+        get the name map as a json friendly dictionary
+        :return dict: name map data
+        """
+        return {"table": self.table, "namespaces": self.namespaces, "rules": [list(rule) for rule in self.rules]}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        create a name map from a dictionary created with to_dict()
+        :param dict data: name map data
+        :return NameMap: name map
+        """
+        return cls(table=data.get("table"), namespaces=data.get("namespaces"), rules=data.get("rules"))
+
+
+def get_existing_names(names):
+    """
+    get the names that exist in the scene with a single ls query
+    :param list[str] names: node names
+    :return set[str]: names that exist
+    """
+    if not names:
+        return set()
+    unique_names = list(dict.fromkeys(names))
+    listed_names = set(cmds.ls(unique_names) or [])
+    existing_names = listed_names.intersection(unique_names)
+    # NOTE: ls returns long names for names that aren't unique, those few are checked one by one
+    if len(existing_names) < len(listed_names):
+        for name in unique_names:
+            if name not in existing_names and maya_utils.obj_exists(name):
+                existing_names.add(name)
+    return existing_names
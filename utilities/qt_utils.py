@@ -392,7 +392,8 @@ class InformationDialog(QtWidgets.QDialog):
 
 class CursorLabel(QtWidgets.QLabel):
     """
-    Label that follows the cursor 
+    Label that follows the cursor. It only moves when the widget under the cursor reports a mouse move or when
+    follow_mouse() is called, and only relayouts when the size of the text changes
     """
 
     STYLE_SHEET = """
@@ -403,34 +404,92 @@ class CursorLabel(QtWidgets.QLabel):
                     border-radius: 4px;
                 }}
                 """
+    CURSOR_OFFSET = 15  # NOTE: pixels between the cursor and the label
+
+    _style_sheets = {}  # dict[str, str]: formatted style sheet per color, shared by every label
 
     def __init__(self, parent=get_maya_main_widget()):
         super(CursorLabel, self).__init__(parent)
 
-        self.setStyleSheet(self.STYLE_SHEET.format(color_val="white"))
+        self.label_text = ""
+        self.hud_text = ""  # optional extra lines displayed under the label text
+        self.color = None
+        self.text_size = None  # (width, line count) of the displayed text, used to skip relayouts
+        self.position = None
+        self.set_color("white")
         self.adjustSize()
 
         # Make it float above everything
         self.setWindowFlags(QtCore.Qt.Tool | QtCore.Qt.FramelessWindowHint)
         self.setAttribute(QtCore.Qt.WA_TransparentForMouseEvents)
+        self.setAttribute(QtCore.Qt.WA_DeleteOnClose)
+
+        # NOTE: the widget under the cursor gets the mouse moves of a drag, so only its events are filtered
+        self.tracked_widget = QtWidgets.QApplication.widgetAt(QtGui.QCursor.pos())
+        if self.tracked_widget is not None:
+            self.tracked_widget.installEventFilter(self)
+        self.follow_mouse()
 
-        # Timer to follow cursor
-        self.timer = QtCore.QTimer()
-        self.timer.timeout.connect(self.follow_mouse)
-        self.timer.start(16)  # ~60 FPS
+    def eventFilter(self, watched, event):
+        if event.type() == QtCore.QEvent.MouseMove:
+            self.follow_mouse()
+        return False
 
     def setText(self, text):
+        self.label_text = text
+        if self.hud_text:
+            text = f"{text}\n{self.hud_text}"
+        if text == self.text():
+            return
         super().setText(text)
-        self.adjustSize()  # Resize immediately
-        self.updateGeometry()
+        lines = text.split("\n")
+        font_metrics = self.fontMetrics()
+        text_size = (max(font_metrics.horizontalAdvance(line) for line in lines), len(lines))
+        if text_size != self.text_size:
+            self.text_size = text_size
+            self.adjustSize()  # Resize immediately
+            self.updateGeometry()
+
+    def set_hud_text(self, text):
+        """
+        set the extra lines displayed under the label text
+        :param str text: hud text
+        """
+        self.hud_text = text
+        self.setText(self.label_text)
 
     def follow_mouse(self):
         pos = QtGui.QCursor.pos()
-        self.move(pos.x() + 15, pos.y() + 15)  # offset from cursor
+        position = (pos.x() + self.CURSOR_OFFSET, pos.y() + self.CURSOR_OFFSET)  # offset from cursor
+        if position != self.position:
+            self.position = position
+            self.move(*position)
 
     def set_color(self, color):
         """
         set the color of the text
         :param color: qss color
         """
-        self.setStyleSheet(self.STYLE_SHEET.format(color_val=color))
+        if color == self.color:
+            return
+        self.color = color
+        style_sheet = self._style_sheets.get(color)
+        if style_sheet is None:
+            style_sheet = self._style_sheets[color] = self.STYLE_SHEET.format(color_val=color)
+        self.setStyleSheet(style_sheet)
+
+    def closeEvent(self, event):
+        self.remove_event_filter()
+        super(CursorLabel, self).closeEvent(event)
+
+    def remove_event_filter(self):
+        """
+        stop following the mouse moves of the widget under the cursor
+        """
+        if self.tracked_widget is not None:
+            try:
+                self.tracked_widget.removeEventFilter(self)
+            except RuntimeError:
+                # the widget was already deleted
+                pass
+            self.tracked_widget = None
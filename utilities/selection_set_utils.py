@@ -5,7 +5,7 @@ import os
 
 from maya import cmds
 
-from as_maya_tools.utilities import json_utils, maya_utils
+from as_maya_tools.utilities import json_utils, name_map_utils
 from as_maya_tools import SELECTION_SET_DIRECTORY
 
 
@@ -75,38 +75,29 @@ def get_selection_set(
         selected_nodes = cmds.ls(selection=True)
         namespaces = get_namespaces_from_nodes(selected_nodes)
 
-    selection_set = []
-    for node in selection_set_data:
+    # search and replace only applies to the base names
+    name_map = name_map_utils.NameMap()
+    if search_and_replace:
+        name_map.add_search_replace(search_string, replace_string)
 
-        # storing nodes base name for search and replace. for now only using replace on base name
+    candidates = []
+    for node in selection_set_data:
         name_space = selection_set_data[node]["namespace"]
-        node_base_name = selection_set_data[node]["name"]
-        if search_and_replace:
-            node_base_name = node_base_name.replace(search_string, replace_string)
+        node_base_name = name_map.map_name(selection_set_data[node]["name"])
 
-        # adding any nodes without a namespace first
+        # nodes without a namespace are added directly
         if not name_space:
-            # Any nodes in the selection set without a namespace are added directly, If they currently exist
-            if maya_utils.obj_exists(node_base_name):
-                selection_set.append(node_base_name)
-            continue
-
-        # rebuilding node name with namespace if namespaces are supplied
-        if namespaces:
-            # Replace stored namespace with selected nodes namespaces
-            for namespace in namespaces:
-                # Rebuild the control name with the namespaces of selected nodes
-                rebuilt_name = "{0}:{1}".format(namespace, node_base_name)
-                # Only add the node if it currently exists
-                if maya_utils.obj_exists(rebuilt_name):
-                    selection_set.append(rebuilt_name)
+            candidates.append(node_base_name)
+        # rebuilding node name with the namespaces of selected nodes if namespaces are supplied
+        elif namespaces:
+            candidates.extend("{0}:{1}".format(namespace, node_base_name) for namespace in namespaces)
+        # Use the stored namespace if no nodes with namespaces are selected
         else:
-            # Use the stored namespace if no nodes with namespaces are selected
-            rebuilt_node_name = f"{name_space}:{node_base_name}"
-            # Only add the node if it currently exists
-            if maya_utils.obj_exists(rebuilt_node_name):
-                selection_set.append(rebuilt_node_name)
-    return selection_set
+            candidates.append(f"{name_space}:{node_base_name}")
+
+    # Only add the nodes that currently exist, checked with a single query
+    existing_names = name_map_utils.get_existing_names(candidates)
+    return [candidate for candidate in candidates if candidate in existing_names]
 
 
 def get_namespaces_from_nodes(nodes):
@@ -52,12 +52,14 @@ def do_space_switch(attribute_object, value):
     cmds.setKeyframe(attribute_object.node)
     
 
-def get_keyframe_range(attribute_object, frame_range=None, keyed_frames=False, **kwargs):
+def get_keyframe_range(attribute_object, frame_range=None, keyed_frames=False, node_keyframes=None, **kwargs):
     """
     Return a list of keyframes based on given frame_range string
     :param str range: options include current frame, selected frames, time slider range, animation range
+    :param list[float] node_keyframes: option to use these keyframes instead of the keyframes of the attribute's node
     """
-    node_keyframes = cmds.keyframe(attribute_object.node, query=True, timeChange=True)
+    if node_keyframes is None:
+        node_keyframes = cmds.keyframe(attribute_object.node, query=True, timeChange=True)
     if not node_keyframes:
         node_keyframes = []
         
@@ -0,0 +1,127 @@
+"""
+Undo support for edits made through the maya api
+Api edits don't enter maya's undo queue on their own. Once the edits are done, pass functions that undo and redo them
+to commit() and they will be recorded as a single undoable command.
+Between open_batch() and close_batch() committed edits are collected and recorded together as one command, so a long
+interactive session leaves a single entry in the undo queue.
+The undoable command is registered by loading this file as a maya plugin, which commit() does automatically
+"""
+import os
+from functools import partial
+
+from maya import cmds
+import maya.api.OpenMaya as OpenMaya
+
+
+UNDO_COMMAND_NAME = "asMayaToolsApiUndo"
+
+PLUGIN_PATH = os.path.splitext(os.path.abspath(__file__))[0] + ".py"
+
+# NOTE: maya loads the plugin as its own module, so the command always reads pending functions from the package module
+_pending_functions = None
+_batch = None  # list[tuple(function, function)]: undo and redo functions committed while a batch is open
+
+
+def maya_useNewAPI():
+    """
+    tells maya this plugin uses the python api 2.0
+    """
+    pass
+
+
+class ApiUndoCommand(OpenMaya.MPxCommand):
+    """
+    Command holding the undo and redo functions of an api edit that has already been done
+    """
+
+    def __init__(self):
+        super(ApiUndoCommand, self).__init__()
+        self.undo_function = None
+        self.redo_function = None
+
+    @classmethod
+    def creator(cls):
+        return cls()
+
+    def doIt(self, args):
+        from as_maya_tools.utilities import undo_utils
+        self.undo_function, self.redo_function = undo_utils._pending_functions
+        undo_utils._pending_functions = None
+
+    def undoIt(self):
+        self.undo_function()
+
+    def redoIt(self):
+        self.redo_function()
+
+    def isUndoable(self):
+        return True
+
+
+def initializePlugin(plugin):
+    OpenMaya.MFnPlugin(plugin).registerCommand(UNDO_COMMAND_NAME, ApiUndoCommand.creator)
+
+
+def uninitializePlugin(plugin):
+    OpenMaya.MFnPlugin(plugin).deregisterCommand(UNDO_COMMAND_NAME)
+
+
+def load_plugin():
+    """
+    load this file as a plugin so the undo command is available
+    """
+    if not cmds.pluginInfo(PLUGIN_PATH, query=True, loaded=True):
+        cmds.loadPlugin(PLUGIN_PATH, quiet=True)
+
+
+def commit(undo_function, redo_function):
+    """
+    record an api edit that has already been done as a single undoable command
+    :param undo_function: function taking no arguments that reverts the edit
+    :param redo_function: function taking no arguments that applies the edit again
+    """
+    global _pending_functions
+    if _batch is not None:
+        _batch.append((undo_function, redo_function))
+        return
+    load_plugin()
+    _pending_functions = (undo_function, redo_function)
+    getattr(cmds, UNDO_COMMAND_NAME)()
+
+
+def _run_functions(functions):
+    """
+    run functions in order
+    :param list functions: functions taking no arguments
+    """
+    for function in functions:
+        function()
+
+
+def open_batch():
+    """
+    start collecting committed edits so they are recorded as one undoable command by close_batch()
+    """
+    global _batch
+    if _batch is None:
+        _batch = []
+
+
+def close_batch():
+    """
+    record every edit committed since open_batch() as a single undoable command. undo reverts the edits in reverse
+    order, redo applies them again in order
+    :return bool: an edit was recorded
+    """
+    global _batch
+    batch = _batch
+    _batch = None
+    if not batch:
+        return False
+    undo_functions = [undo_function for undo_function, _ in reversed(batch)]
+    redo_functions = [redo_function for _, redo_function in batch]
+    if len(batch) == 1:
+        commit(undo_functions[0], redo_functions[0])
+    else:
+        commit(partial(_run_functions, undo_functions), partial(_run_functions, redo_functions))
+    return True
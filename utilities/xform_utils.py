@@ -1,9 +1,17 @@
 """
 xform utilities
 """
+from functools import partial
+
+import numpy
 from maya import cmds
+import maya.api.OpenMaya as OpenMaya
+import maya.api.OpenMayaAnim as OpenMayaAnim
+
+from as_maya_tools.utilities import attribute_utils, math_utils, anim_curve_utils, undo_utils
 
-from as_maya_tools.utilities import attribute_utils
+
+TRANSFORM_CHANNELS = ("tx", "ty", "tz", "rx", "ry", "rz", "sx", "sy", "sz")
 
 
 def snap_a_to_b(a, b, translation=True, rotation=True, scale=False, **kwargs):
@@ -104,4 +112,398 @@ def snap_to_first(
         
         # Snap Scale
         if scale_x or scale_y or scale_z:
-            cmds.xform(node, scale=list(scale_vector), ws=True)
\ No newline at end of file
+            cmds.xform(node, scale=list(scale_vector), ws=True)
+
+
+def set_plug_values(plugs, values):
+    """
+    set double plug values with one dg modifier
+    :param list[OpenMaya.MPlug] plugs: plugs to set
+    :param numpy.ndarray values: plug values in internal units
+    """
+    dg_modifier = OpenMaya.MDGModifier()
+    for plug, value in zip(plugs, values.tolist()):
+        dg_modifier.newPlugValueDouble(plug, value)
+    dg_modifier.doIt()
+
+
+def get_base_transformation(dag_path):
+    """
+    get what a transform adds to its channels when building its local matrix
+    :param OpenMaya.MDagPath dag_path: transform
+    :return tuple(OpenMaya.MTransformationMatrix, OpenMaya.MQuaternion): transformation holding the pivots, rotate
+    axis and rotate order, and the joint orient. the joint orient is identity for other transforms
+    """
+    joint_orient = OpenMaya.MQuaternion()
+    if dag_path.hasFn(OpenMaya.MFn.kJoint):
+        joint_orient = OpenMayaAnim.MFnIkJoint(dag_path).orientation()
+    return OpenMaya.MFnTransform(dag_path).transformation(), joint_orient
+
+
+def has_base_offsets(base_transformation, joint_orient, tolerance=1e-9):
+    """
+    :param OpenMaya.MTransformationMatrix base_transformation: pivots, rotate axis and rotate order of the transform
+    :param OpenMaya.MQuaternion joint_orient: joint orient, identity for other transforms
+    :param float tolerance: offsets smaller than this are ignored
+    :return bool: the transform has pivots, a rotate axis or a joint orient, so its channels can't be read straight
+    from its local matrix
+    """
+    for offset in (
+            base_transformation.rotatePivot(OpenMaya.MSpace.kTransform),
+            base_transformation.scalePivot(OpenMaya.MSpace.kTransform),
+            base_transformation.rotatePivotTranslation(OpenMaya.MSpace.kTransform),
+            base_transformation.scalePivotTranslation(OpenMaya.MSpace.kTransform)):
+        if max(abs(offset.x), abs(offset.y), abs(offset.z)) > tolerance:
+            return True
+    return not base_transformation.rotationOrientation().isEquivalent(OpenMaya.MQuaternion(), tolerance) or \
+        not joint_orient.isEquivalent(OpenMaya.MQuaternion(), tolerance)
+
+
+def solve_channel_values(local_matrix, base_transformation, joint_orient, euler_rotation):
+    """
+    solve the channel values that give a transform a local matrix
+    :param numpy.ndarray local_matrix: (4, 4) local matrix
+    :param OpenMaya.MTransformationMatrix base_transformation: pivots, rotate axis and rotate order of the transform
+    :param OpenMaya.MQuaternion joint_orient: joint orient, identity for other transforms
+    :param OpenMaya.MEulerRotation euler_rotation: the closest euler solution to this rotation is used
+    :return numpy.ndarray: (9,) channel values in internal units
+    """
+    local = OpenMaya.MTransformationMatrix(OpenMaya.MMatrix(local_matrix.ravel().tolist()))
+    # remove the rotate axis and joint orient from the local rotation
+    rotation = base_transformation.rotationOrientation().inverse() * local.rotation(asQuaternion=True) * \
+        joint_orient.inverse()
+
+    transformation = OpenMaya.MTransformationMatrix(base_transformation)
+    transformation.setScale(local.scale(OpenMaya.MSpace.kTransform), OpenMaya.MSpace.kTransform)
+    transformation.setShear(local.shear(OpenMaya.MSpace.kTransform), OpenMaya.MSpace.kTransform)
+    transformation.setRotation(rotation)
+    transformation.setTranslation(OpenMaya.MVector(), OpenMaya.MSpace.kTransform)
+    # NOTE: with no translation the matrix only holds the offset added by the pivots
+    pivot_offset = math_utils.matrix_to_array(transformation.asMatrix())[3, :3]
+
+    solved_rotation = transformation.rotation().closestSolution(euler_rotation)
+    values = numpy.empty(len(TRANSFORM_CHANNELS))
+    values[:3] = local_matrix[3, :3] - pivot_offset
+    values[3:6] = (solved_rotation.x, solved_rotation.y, solved_rotation.z)
+    values[6:] = local.scale(OpenMaya.MSpace.kTransform)
+    return values
+
+
+class TransformWriter(object):
+    """
+    Writes world space matrices to many transforms in one pass. Everything that doesn't change while writing is
+    resolved once: dag paths, parent matrices, pivots, rotate axis, joint orient and the channel plugs.
+    Channels keyed at the current time have their keyframe value edited when auto key is on, other free channels are
+    set directly like a regular transform edit
+    """
+
+    def __init__(self, nodes, edit_keyframes=None):
+        """
+        :param list[str] nodes: transform nodes to write to
+        :param bool edit_keyframes: option to edit the keyframes at the current time. follows auto key if None
+        """
+        self.nodes = list(nodes)
+        node_indices = {}
+        self.dag_paths = []
+        for index, node in enumerate(self.nodes):
+            dag_path = OpenMaya.MSelectionList().add(node).getDagPath(0)
+            self.dag_paths.append(dag_path)
+            node_indices[OpenMaya.MFnDagNode(dag_path).fullPathName()] = index
+
+        # parents are resolved relative to the closest ancestor that is also written, so hierarchies move together
+        count = len(self.nodes)
+        self.ancestor_indices = numpy.full(count, -1, dtype=numpy.int64)
+        self.parent_matrices = numpy.empty((count, 4, 4))
+        self.base_transformations = []  # list[OpenMaya.MTransformationMatrix]: pivots, rotate axis and rotate order
+        self.joint_orients = []  # list[OpenMaya.MQuaternion]: joint orient, identity for other transforms
+        for index, dag_path in enumerate(self.dag_paths):
+            parent_matrix = math_utils.matrix_to_array(dag_path.exclusiveMatrix())
+            ancestor_path = OpenMaya.MDagPath(dag_path)
+            while ancestor_path.length() > 1:
+                ancestor_path.pop()
+                ancestor_index = node_indices.get(ancestor_path.fullPathName())
+                if ancestor_index is not None:
+                    # NOTE: stored relative to the ancestor so it can follow the ancestor's new world matrix
+                    ancestor_matrix = math_utils.matrix_to_array(ancestor_path.inclusiveMatrix())
+                    parent_matrix = numpy.matmul(parent_matrix, numpy.linalg.inv(ancestor_matrix))
+                    self.ancestor_indices[index] = ancestor_index
+                    break
+            self.parent_matrices[index] = parent_matrix
+
+            base_transformation, joint_orient = get_base_transformation(dag_path)
+            self.base_transformations.append(base_transformation)
+            self.joint_orients.append(joint_orient)
+
+        # resolve the channel plugs. locked and driven channels are skipped
+        self.plugs = []  # list[list[OpenMaya.MPlug]]: channel plugs per node, None for channels that can't be written
+        channel_indices = {}  # dict[str, tuple(int, int)]: attribute path to (node index, channel index)
+        animated_paths = []
+        layered_paths = set()  # channels driven by an anim layer or pairBlend, only writable through their keyframes
+        for node_index, (node, dag_path) in enumerate(zip(self.nodes, self.dag_paths)):
+            dependency_node = OpenMaya.MFnDependencyNode(dag_path.node())
+            node_plugs = []
+            for channel_index, channel in enumerate(TRANSFORM_CHANNELS):
+                plug = dependency_node.findPlug(channel, False)
+                source = plug.source()
+                # NOTE: channels on anim layers or behind a pairBlend are written through the curve they resolve to
+                if plug.isLocked or (not source.isNull and anim_curve_utils.get_anim_curve_fn(plug) is None):
+                    node_plugs.append(None)
+                    continue
+                node_plugs.append(plug)
+                channel_indices[f"{node}.{channel}"] = (node_index, channel_index)
+                if not source.isNull:
+                    animated_paths.append(f"{node}.{channel}")
+                    if not source.node().hasFn(OpenMaya.MFn.kAnimCurve):
+                        layered_paths.add(f"{node}.{channel}")
+            self.plugs.append(node_plugs)
+
+        if edit_keyframes is None:
+            edit_keyframes = cmds.autoKeyframe(query=True, state=True)
+        # NOTE: without keyframe editing keyed channels are set directly, so keys only change through auto key
+        self.keyframe_handles = anim_curve_utils.KeyframeHandles(animated_paths if edit_keyframes else [])
+        keyed_paths = set(self.keyframe_handles.attribute_paths)
+        skipped_paths = keyed_paths.union(layered_paths)
+        # (node index, channel index) of the channels written through the keyframe handles, in the handles' order
+        self.keyed_indices = [channel_indices[path] for path in self.keyframe_handles.attribute_paths]
+        # (node index, channel index) of the channels set directly
+        self.plug_indices = [index for path, index in channel_indices.items() if path not in skipped_paths]
+        # animated channels without a keyframe at the current time
+        self.animated_paths = [path for path in animated_paths if path not in skipped_paths]
+
+        self.original_values = self._get_channel_values()
+        self.values = self.original_values.copy()
+        self.original_plug_values = numpy.asarray(
+            [self.original_values[index] for index in self.plug_indices], dtype=numpy.float64)
+        self.euler_rotations = [
+            OpenMaya.MEulerRotation(*self.original_values[index, 3:6], base.rotation().order)
+            for index, base in enumerate(self.base_transformations)]
+        # transforms without pivots, rotate axis or joint orient are solved together with numpy. the others go
+        # through their transformation matrix
+        self.rotate_orders = numpy.asarray(
+            [euler_rotation.order for euler_rotation in self.euler_rotations], dtype=numpy.int64)
+        self.batch_mask = numpy.asarray(
+            [not has_base_offsets(base, joint_orient)
+             for base, joint_orient in zip(self.base_transformations, self.joint_orients)], dtype=bool)
+        self.euler_values = self.original_values[:, 3:6].copy()
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def _get_channel_values(self):
+        """
+        get the current channel values in internal units
+        :return numpy.ndarray: (n, 9) channel values
+        """
+        values = numpy.zeros((len(self.nodes), len(TRANSFORM_CHANNELS)))
+        for node_index, dag_path in enumerate(self.dag_paths):
+            dependency_node = OpenMaya.MFnDependencyNode(dag_path.node())
+            for channel_index, channel in enumerate(TRANSFORM_CHANNELS):
+                values[node_index, channel_index] = dependency_node.findPlug(channel, False).asDouble()
+        return values
+
+    def get_world_matrices(self):
+        """
+        get the current world matrices
+        :return list[OpenMaya.MMatrix]: world matrices
+        """
+        return [dag_path.inclusiveMatrix() for dag_path in self.dag_paths]
+
+    def get_channel_values(self, world_matrices):
+        """
+        solve the channel values that give each transform a world matrix
+        :param numpy.ndarray world_matrices: (n, 4, 4) world matrices
+        :return numpy.ndarray: (n, 9) channel values in internal units
+        """
+        parent_matrices = self.parent_matrices.copy()
+        has_ancestor = self.ancestor_indices >= 0
+        if has_ancestor.any():
+            parent_matrices[has_ancestor] = numpy.matmul(
+                parent_matrices[has_ancestor], world_matrices[self.ancestor_indices[has_ancestor]])
+        local_matrices = numpy.matmul(world_matrices, numpy.linalg.inv(parent_matrices))
+
+        values = numpy.empty((len(self.nodes), len(TRANSFORM_CHANNELS)))
+        batch_mask = self.batch_mask.copy()
+        if batch_mask.any():
+            with numpy.errstate(divide="ignore", invalid="ignore"):
+                decomposed = math_utils.decompose_position_matrix_arrays(local_matrices[batch_mask])
+                values[batch_mask, :3] = decomposed["translation"]
+                values[batch_mask, 3:6] = math_utils.rotation_matrices_to_euler(
+                    decomposed["rotation"], self.rotate_orders[batch_mask], self.euler_values[batch_mask])
+                values[batch_mask, 6:] = decomposed["scale"]
+                # NOTE: mirrored and zero scaled matrices are left to the transformation matrix
+                batch_mask[numpy.flatnonzero(batch_mask)[~(decomposed["determinant"] > 0.0)]] = False
+        for index in numpy.flatnonzero(~batch_mask).tolist():
+            euler_rotation = self.euler_rotations[index]
+            euler_rotation.setValue(*self.euler_values[index].tolist(), euler_rotation.order)
+            values[index] = solve_channel_values(
+                local_matrices[index], self.base_transformations[index], self.joint_orients[index],
+                self.euler_rotations[index])
+        return values
+
+    def set_world_matrices(self, world_matrices):
+        """
+        move every transform to a world matrix in one pass
+        :param numpy.ndarray world_matrices: (n, 4, 4) world matrices
+        """
+        self.set_channel_values(self.get_channel_values(world_matrices))
+
+    def set_channel_values(self, values):
+        """
+        write channel values. keyed channels are written to their keyframe, other channels with one dg modifier
+        :param numpy.ndarray values: (n, 9) channel values in internal units
+        """
+        if self.keyed_indices:
+            self.keyframe_handles.set_internal_values(
+                numpy.asarray([values[index] for index in self.keyed_indices], dtype=numpy.float64))
+        if self.plug_indices:
+            self._set_plug_values(numpy.asarray([values[index] for index in self.plug_indices], dtype=numpy.float64))
+        self.values = values
+        self.euler_values = values[:, 3:6].copy()
+
+    def _set_plug_values(self, plug_values):
+        """
+        set the channels that aren't keyed at the current time
+        :param numpy.ndarray plug_values: values of the plug indices in internal units
+        """
+        set_plug_values([self.plugs[node_index][channel_index] for node_index, channel_index in self.plug_indices],
+                        plug_values)
+
+    def commit(self):
+        """
+        record the writes since the writer was created as undoable commands. animated channels that were set
+        directly are keyed if auto key is on, like a regular transform edit
+        """
+        self.keyframe_handles.commit()
+        if self.plug_indices:
+            plug_values = numpy.asarray([self.values[index] for index in self.plug_indices], dtype=numpy.float64)
+            changed_indices = numpy.flatnonzero(plug_values != self.original_plug_values).tolist()
+            if changed_indices:
+                # only the channels that changed are held by the undo command
+                plugs = [self.plugs[self.plug_indices[index][0]][self.plug_indices[index][1]]
+                         for index in changed_indices]
+                undo_utils.commit(
+                    partial(set_plug_values, plugs, self.original_plug_values[changed_indices]),
+                    partial(set_plug_values, plugs, plug_values[changed_indices]))
+                if self.animated_paths and cmds.autoKeyframe(query=True, state=True):
+                    cmds.setKeyframe(self.animated_paths)
+
+
+def get_dag_path(node):
+    """
+    :param str/OpenMaya.MDagPath node: node name or dag path
+    :return OpenMaya.MDagPath: dag path of the node
+    """
+    if isinstance(node, OpenMaya.MDagPath):
+        return node
+    return OpenMaya.MSelectionList().add(node).getDagPath(0)
+
+
+def get_matrices_at_frames(nodes, frames, attribute="worldMatrix"):
+    """
+    read a matrix attribute of many nodes at many frames through context evaluation. the current time isn't changed
+    so the scene is never scrubbed
+    :param list[str/OpenMaya.MDagPath] nodes: dag node names or dag paths
+    :param list[float] frames: frames in ui time units
+    :param str attribute: matrix array attribute, the element of the node's instance is read
+    :return numpy.ndarray: (node count, frame count, 4, 4) matrices
+    """
+    plugs = []
+    for node in nodes:
+        dag_path = get_dag_path(node)
+        plug = OpenMaya.MFnDependencyNode(dag_path.node()).findPlug(attribute, False)
+        plugs.append(plug.elementByLogicalIndex(dag_path.instanceNumber()))
+
+    matrices = numpy.empty((len(nodes), len(frames), 4, 4))
+    time_unit = OpenMaya.MTime.uiUnit()
+    for frame_index, frame in enumerate(frames):
+        with OpenMaya.MDGContextGuard(OpenMaya.MDGContext(OpenMaya.MTime(float(frame), time_unit))):
+            for node_index, plug in enumerate(plugs):
+                matrices[node_index, frame_index] = math_utils.matrix_to_array(
+                    OpenMaya.MFnMatrixData(plug.asMObject()).matrix())
+    return matrices
+
+
+def get_matched_local_matrices(controls, sources, frames, offsets=None):
+    """
+    get the local matrices that make controls follow source nodes over a frame range. every source and control matrix
+    is read in one pass of context evaluation, one context per frame for all nodes. Controls parented under other
+    matched controls follow their ancestor's matched matrix
+    :param list[str/OpenMaya.MDagPath] controls: controls to match
+    :param list[str/OpenMaya.MDagPath] sources: node each control follows
+    :param list[float] frames: frames in ui time units
+    :param numpy.ndarray offsets: (control count, 4, 4) offset of each control in its source's space. identity if None
+    :return numpy.ndarray: (control count, frame count, 4, 4) local matrices
+    """
+    target_matrices = get_matrices_at_frames(sources, frames)
+    if offsets is not None:
+        target_matrices = numpy.matmul(numpy.asarray(offsets)[:, None], target_matrices)
+    control_matrices = get_matrices_at_frames(controls, frames)
+    parent_matrices = get_matrices_at_frames(controls, frames, attribute="parentMatrix")
+
+    dag_paths = [get_dag_path(control) for control in controls]
+    control_indices = {OpenMaya.MFnDagNode(dag_path).fullPathName(): index for index, dag_path in enumerate(dag_paths)}
+    for index, dag_path in enumerate(dag_paths):
+        ancestor_path = OpenMaya.MDagPath(dag_path)
+        while ancestor_path.length() > 1:
+            ancestor_path.pop()
+            ancestor_index = control_indices.get(ancestor_path.fullPathName())
+            if ancestor_index is not None:
+                # NOTE: the parent follows the ancestor's matched matrix instead of its current one
+                relative_matrices = numpy.matmul(
+                    parent_matrices[index], numpy.linalg.inv(control_matrices[ancestor_index]))
+                parent_matrices[index] = numpy.matmul(relative_matrices, target_matrices[ancestor_index])
+                break
+    return numpy.matmul(target_matrices, numpy.linalg.inv(parent_matrices))
+
+
+def key_local_matrices(controls, local_matrices, frames, anim_curve_changes=None):
+    """
+    solve the channel values of local matrices for every frame and key each free channel in one batch
+    :param list[str/OpenMaya.MDagPath] controls: controls to key
+    :param numpy.ndarray local_matrices: (control count, frame count, 4, 4) local matrices
+    :param list[float] frames: frames in ui time units
+    :param list anim_curve_changes: list the edits are appended to as they are made, so edits made before an error
+    can still be committed. a new list is created if None
+    :return list[OpenMayaAnim.MAnimCurveChange]: recorded edits, commit them with
+    anim_curve_utils.commit_anim_curve_changes()
+    """
+    frames = numpy.asarray(frames, dtype=numpy.float64)
+    if anim_curve_changes is None:
+        anim_curve_changes = []
+    for control, control_local_matrices in zip(controls, local_matrices):
+        dag_path = get_dag_path(control)
+        control_name = dag_path.partialPathName()
+        dependency_node = OpenMaya.MFnDependencyNode(dag_path.node())
+        plugs = [dependency_node.findPlug(channel, False) for channel in TRANSFORM_CHANNELS]
+        base_transformation, joint_orient = get_base_transformation(dag_path)
+        # NOTE: each frame uses the euler solution closest to the previous frame so rotations don't flip
+        euler_rotation = OpenMaya.MEulerRotation(
+            *[plug.asDouble() for plug in plugs[3:6]], base_transformation.rotation().order)
+        values = numpy.empty((len(frames), len(TRANSFORM_CHANNELS)))
+        for frame_index, local_matrix in enumerate(control_local_matrices):
+            values[frame_index] = solve_channel_values(local_matrix, base_transformation, joint_orient, euler_rotation)
+            euler_rotation.setValue(*values[frame_index, 3:6], euler_rotation.order)
+
+        for channel_index, plug in enumerate(plugs):
+            source = plug.source()
+            if plug.isLocked or not plug.isKeyable or \
+                    (not source.isNull and not source.node().hasFn(OpenMaya.MFn.kAnimCurve)):
+                continue
+            anim_curve_changes.append(anim_curve_utils.set_keyframe_values(
+                f"{control_name}.{TRANSFORM_CHANNELS[channel_index]}", frames, values[:, channel_index]))
+    return anim_curve_changes
+
+
+def match_world_matrices_at_frames(controls, sources, frames, offsets=None):
+    """
+    key controls so they follow source nodes over a frame range. matrices are read with get_matched_local_matrices()
+    and keyed with key_local_matrices()
+    :param list[str/OpenMaya.MDagPath] controls: controls to key
+    :param list[str/OpenMaya.MDagPath] sources: node each control follows
+    :param list[float] frames: frames to key in ui time units
+    :param numpy.ndarray offsets: (control count, 4, 4) offset of each control in its source's space. identity if None
+    :return list[OpenMayaAnim.MAnimCurveChange]: recorded edits, commit them with
+    anim_curve_utils.commit_anim_curve_changes()
+    """
+    local_matrices = get_matched_local_matrices(controls, sources, frames, offsets=offsets)
+    return key_local_matrices(controls, local_matrices, frames)